@@ -0,0 +1,106 @@
+"""Columnar versus per-object evaluation of the numeric filters.
+
+Run with `python -m benchmarks.columnar`."""
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from unittest.mock import MagicMock
+
+from furretweet.columnar import TweetColumns, evaluate, passed
+from furretweet.filters import (
+    MaximumHashtagsFilter,
+    MaximumNewLinesFilter,
+    MinimumAccountAgeFilter,
+    MinimumFollowersFilter,
+)
+from furretweet.models import Includes, StreamResponse, Tweet
+
+ROWS = 1_000_000
+# Building a million pydantic models takes longer than the point being made,
+# the per-object time is measured on a sample and scaled.
+OBJECT_SAMPLE = 50_000
+
+FILTERS = [
+    MinimumFollowersFilter(100),
+    MinimumAccountAgeFilter(30),
+    MaximumHashtagsFilter(5),
+    MaximumNewLinesFilter(10),
+]
+
+
+def random_row(rng: random.Random, now: datetime) -> tuple[int, datetime, int, int]:
+    return (
+        rng.randint(0, 100_000),
+        now - timedelta(seconds=rng.randint(0, 10 * 365 * 86400)),
+        rng.randint(0, 10),
+        rng.randint(0, 20),
+    )
+
+
+def make_response(row: tuple[int, datetime, int, int]) -> StreamResponse:
+    followers, created_at, hashtags, new_lines = row
+    tweet = Tweet(
+        id=1,
+        text="#FursuitFriday" + "\n" * new_lines,
+        author_id=1,
+        created_at=created_at,
+        public_metrics=dict(
+            retweet_count=0, reply_count=0, like_count=0, quote_count=0, impression_count=0
+        ),
+        attachments=None,
+        referenced_tweets=None,
+        entities={"hashtags": [{"tag": "x"}] * hashtags},
+        edit_history_tweet_ids=[1],
+        possibly_sensitive=False,
+    )
+    includes = Includes.parse_obj(
+        {
+            "users": [
+                {
+                    "id": 1,
+                    "username": "furry",
+                    "name": "Furry",
+                    "verified": False,
+                    "verified_type": "none",
+                    "public_metrics": dict(
+                        followers_count=followers,
+                        following_count=0,
+                        tweet_count=0,
+                        listed_count=0,
+                    ),
+                    "created_at": created_at,
+                }
+            ]
+        }
+    )
+    return StreamResponse(client=MagicMock(), tweet=tweet, includes=includes, errors=[])
+
+
+def main():
+    rng = random.Random(0)
+    now = datetime.now(timezone.utc)
+    rows = [random_row(rng, now) for _ in range(ROWS)]
+
+    start = time.perf_counter()
+    columns = TweetColumns.from_rows(rows)
+    build_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    mask = passed(evaluate(FILTERS, columns, now=now), len(columns))
+    columnar_s = time.perf_counter() - start
+
+    responses = [make_response(row) for row in rows[:OBJECT_SAMPLE]]
+    start = time.perf_counter()
+    expected = [all(f.filter(r) for f in FILTERS) for r in responses]
+    object_s = (time.perf_counter() - start) * ROWS / OBJECT_SAMPLE
+
+    assert mask[:OBJECT_SAMPLE].tolist() == expected
+    print(f"rows: {ROWS}, passing: {int(mask.sum())}")
+    print(f"build columns: {build_s * 1000:.0f}ms")
+    print(f"columnar evaluation: {columnar_s * 1000:.1f}ms")
+    print(f"per-object evaluation: {object_s * 1000:.0f}ms (scaled from {OBJECT_SAMPLE} rows)")
+    print(f"speedup: {object_s / columnar_s:.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""Insert and query cost of the MinHash LSH index as it grows.
+
+Run with `python -m benchmarks.minhash`."""
+import random
+import string
+import time
+
+from furretweet.minhash import LSHEntry, LSHIndex, MinHasher, normalize_text
+
+SIZES = [1_000, 10_000, 100_000]
+QUERIES = 1_000
+
+
+def random_text(rng: random.Random, words: int = 20) -> str:
+    return " ".join(
+        "".join(rng.choices(string.ascii_lowercase, k=rng.randint(2, 9))) for _ in range(words)
+    )
+
+
+def main():
+    rng = random.Random(0)
+    hasher = MinHasher()
+
+    texts = [normalize_text(random_text(rng)) for _ in range(QUERIES)]
+    start = time.perf_counter()
+    signatures = [hasher.signature(text) for text in texts]
+    signature_us = (time.perf_counter() - start) / QUERIES * 1e6
+    print(f"signature: {signature_us:.1f}us per tweet")
+
+    print(f"{'entries':>10} {'insert us':>10} {'query us':>10} {'evict us':>10}")
+    for size in SIZES:
+        index = LSHIndex(window=float("inf"), max_entries=size)
+        pool = [hasher.signature(normalize_text(random_text(rng))) for _ in range(size)]
+
+        start = time.perf_counter()
+        for i, signature in enumerate(pool):
+            index.insert(LSHEntry(str(i), str(i % 500), signature, float(i)))
+        insert_us = (time.perf_counter() - start) / size * 1e6
+
+        start = time.perf_counter()
+        for signature in signatures:
+            index.query(signature, threshold=0.8)
+        query_us = (time.perf_counter() - start) / QUERIES * 1e6
+
+        index.window = size / 2
+        start = time.perf_counter()
+        evicted = index.evict(now=float(size))
+        evict_us = (time.perf_counter() - start) / max(evicted, 1) * 1e6
+
+        print(f"{size:>10} {insert_us:>10.1f} {query_us:>10.1f} {evict_us:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""Insert throughput of each write durability tier against a real mongod.
+
+Run with `python -m benchmarks.mongo_durability [uri]`, the uri defaults to
+MONGO_URI or a local mongod. Documents go to a scratch database that is
+dropped afterwards."""
+import asyncio
+import os
+import sys
+import time
+import warnings
+from datetime import datetime, timezone
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import PyMongoError
+
+from furretweet.database import DURABILITY_TIERS
+
+DATABASE = "furretweet_benchmark"
+DOCUMENTS = 5_000
+CONCURRENCY = 32
+BATCH_SIZE = 100
+COMPRESSORS = ["", "zlib", "snappy", "zstd"]
+
+
+def not_retweeted_document(i: int) -> dict:
+    """Shaped like the ones NotRetweetedTweetsRepository writes."""
+    now = datetime.now(timezone.utc)
+    return {
+        "_id": str(1517533170840838144 + i),
+        "text": "Happy #FursuitFriday everyone! " * 4,
+        "author_id": str(166643730 + i % 500),
+        "created_at": now,
+        "limit_reached": False,
+        "failed_filters": [
+            {"filter_name": "MinimumFollowersFilter", "details": {"followers_count": 12}},
+            {"filter_name": "MaximumHashtagsFilter", "details": {"hashtags_count": 9}},
+        ],
+        "tweet": {
+            "id": 1517533170840838144 + i,
+            "text": "Happy #FursuitFriday everyone! " * 4,
+            "public_metrics": {"retweet_count": 3, "reply_count": 1, "like_count": 40},
+            "entities": {"hashtags": [{"start": 6, "end": 20, "tag": "FursuitFriday"}]},
+        },
+        "includes": {"users": [{"id": 166643730, "username": "fursuiter"}], "media": []},
+        "campaign": "default",
+    }
+
+
+async def insert_one_by_one(collection, documents: list[dict]) -> None:
+    """As the repository does without a spool, CONCURRENCY writes in flight."""
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+
+    async def insert(document: dict):
+        async with semaphore:
+            await collection.insert_one(document)
+
+    await asyncio.gather(*(insert(document) for document in documents))
+
+
+async def insert_batches(collection, documents: list[dict], ordered: bool) -> None:
+    """As the spool drainer does, one batch at a time."""
+    for i in range(0, len(documents), BATCH_SIZE):
+        await collection.insert_many(documents[i : i + BATCH_SIZE], ordered=ordered)
+
+
+async def settle(collection, count: int) -> None:
+    # Unacknowledged writes return before the server applied them, they
+    # are timed until they all landed
+    while await collection.count_documents({}) < count:
+        await asyncio.sleep(0.001)
+
+
+async def run(uri: str, compressors: str) -> list[tuple[str, str, float]] | None:
+    options = {"compressors": compressors} if compressors else {}
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always")
+        client = AsyncIOMotorClient(uri, serverSelectionTimeoutMS=2000, **options)
+    if caught:
+        # pymongo drops compressors whose module isn't installed
+        print(f"Skipping {compressors}: {caught[0].message}", file=sys.stderr)
+        client.close()
+        return None
+
+    db = client[DATABASE]
+    results = []
+    try:
+        for tier, durability in DURABILITY_TIERS.items():
+            for mode in ("insert_one", "insert_many", "insert_many ordered"):
+                collection = db.get_collection(tier, write_concern=durability.write_concern)
+                await collection.drop()
+                documents = [not_retweeted_document(i) for i in range(DOCUMENTS)]
+                start = time.perf_counter()
+                try:
+                    if mode == "insert_one":
+                        await insert_one_by_one(collection, documents)
+                    else:
+                        await insert_batches(collection, documents, ordered="ordered" in mode)
+                    await settle(collection, DOCUMENTS)
+                except PyMongoError as e:
+                    # A standalone mongod can't take majority writes without a replica set
+                    print(f"Skipping {tier} {mode}: {e}", file=sys.stderr)
+                    continue
+                results.append((tier, mode, DOCUMENTS / (time.perf_counter() - start)))
+    finally:
+        await client.drop_database(DATABASE)
+        client.close()
+    return results
+
+
+async def main(uri: str):
+    client = AsyncIOMotorClient(uri, serverSelectionTimeoutMS=2000)
+    try:
+        await client.admin.command("ping")
+    except PyMongoError as e:
+        raise SystemExit(f"No mongod reachable at {uri}: {e}")
+    finally:
+        client.close()
+
+    print(f"{DOCUMENTS} documents, {CONCURRENCY} concurrent insert_one, batches of {BATCH_SIZE}")
+    print(f"{'compressor':>10} {'tier':>15} {'mode':>20} {'docs/s':>10}")
+    for compressors in COMPRESSORS:
+        for tier, mode, throughput in await run(uri, compressors) or []:
+            print(f"{compressors or 'none':>10} {tier:>15} {mode:>20} {throughput:>10.0f}")
+
+
+if __name__ == "__main__":
+    default_uri = os.environ.get("MONGO_URI", "mongodb://localhost:27017")
+    asyncio.run(main(sys.argv[1] if len(sys.argv) > 1 else default_uri))
@@ -0,0 +1,58 @@
+"""Runs the micro-benchmarks of `tests/benchmarks` against a saved baseline.
+
+    python -m benchmarks.regressions --save   # records a new baseline
+    python -m benchmarks.regressions          # fails if one regressed past the threshold
+
+Baselines are kept in `.benchmarks/`, out of git as timings only compare on
+the same machine: save one before changing the code.
+The fastest round is compared, the least sensitive to noise for functions
+running in microseconds."""
+import argparse
+import sys
+from pathlib import Path
+
+import pytest
+from pytest_benchmark.session import PerformanceRegression
+
+ROOT = Path(__file__).parents[1]
+BASELINE = "baseline"
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.regressions")
+    parser.add_argument("--save", action="store_true", help="save the results as the baseline")
+    parser.add_argument(
+        "--threshold", type=float, default=50, help="allowed regression, in percent"
+    )
+    args, pytest_args = parser.parse_known_args(argv)
+
+    pytest_args = [
+        str(ROOT / "tests" / "benchmarks"),
+        "--benchmark-enable",
+        "--benchmark-only",
+        "--benchmark-warmup=on",
+        f"--benchmark-storage={ROOT / '.benchmarks'}",
+        "--benchmark-columns=min,median,max,rounds",
+        *pytest_args,
+    ]
+    if args.save:
+        pytest_args.append(f"--benchmark-save={BASELINE}")
+    elif not any((ROOT / ".benchmarks").glob(f"*/*_{BASELINE}.json")):
+        print("No baseline saved on this machine, run with --save first", file=sys.stderr)
+        return 2
+    else:
+        # Compares with the latest saved baseline
+        pytest_args += [
+            "--benchmark-compare",
+            f"--benchmark-compare-fail=min:{args.threshold:g}%",
+        ]
+
+    try:
+        return pytest.main(pytest_args)
+    except PerformanceRegression:
+        # The regressed benchmarks are listed in the summary above
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,36 +1,167 @@
 import aiohttp
 import tweepy.asynchronous as tweepy
-from tweepy import StreamRule
 import asyncio
+from datetime import timedelta
 from loguru import logger
+from furretweet.accounts import AccountPool
 from furretweet.stream import FurStream
+from furretweet.models import (
+    STREAM_EXPANSIONS,
+    STREAM_MEDIA_FIELDS,
+    STREAM_TWEET_FIELDS,
+    STREAM_USER_FIELDS,
+)
 from furretweet.config import config
 from furretweet.database import MongoDatabase
+from furretweet.health import HealthServer
+from furretweet.http_session import TwitterSession
+from furretweet.loop_monitor import LoopLagMonitor
+from furretweet.media import MediaDeduplicator
+from furretweet.minhash import LSHIndex
+from furretweet.offload import FilterOffloader
+from furretweet.pipeline import PipelineWatcher, load_pipeline
+from furretweet.profiling import Profiler
+from furretweet.resilience import (
+    MONGO_FAILURES,
+    TWITTER_FAILURES,
+    CircuitBreaker,
+    DependencyUnavailable,
+)
+from furretweet.snapshot import FileSnapshotStore, StateSnapshotter
+from furretweet.spool import Spool, SpoolDrainer
 from furretweet.telegram import bot as telegram_bot
-from furretweet.tweepy import client as tweepy_client
-
-STREAM_EXPANSIONS = "author_id,attachments.media_keys"
-STREAM_TWEET_FIELDS = "author_id,created_at,entities,public_metrics,possibly_sensitive"
-STREAM_USER_FIELDS = "created_at,public_metrics,username,verified,verified_type"
-
-STREAM_RULES = [
-    StreamRule(
-        value="(#FursuitFriday OR @FurRetweet) has:media -is:retweet -is:reply -is:nullcast",
-        tag="FurretweetRules",
-    )
-]
+from furretweet.telegram_webhook import TelegramWebhook
+from furretweet.tweepy import accounts as tweepy_accounts, client as tweepy_client
 
 
 class FurRetweet:
     def __init__(self):
         self.config = config
         self.client = tweepy_client
-        self.mongo = MongoDatabase(self.config)
-        self.stream = FurStream(bearer_token=self.config.twitter.bearer_token, furretweet=self)
+        self.spool = (
+            Spool(self.config.spool.path, fsync_interval=self.config.spool.fsync_interval)
+            if self.config.spool.path
+            else None
+        )
+        self.mongo = MongoDatabase(
+            self.config, spool=self.spool, breaker=self.breaker("mongo", MONGO_FAILURES)
+        )
+        self.spool_drainer = (
+            SpoolDrainer(
+                self.spool,
+                self.mongo.acknowledged(self.mongo.not_retweeted_tweets_repository.collection),
+                batch_size=self.config.spool.drain_batch_size,
+                interval=self.config.spool.drain_interval,
+                timeout=self.config.spool.drain_timeout,
+                breaker=self.mongo.breaker,
+                ordered=self.config.mongo.not_retweeted_tweets_ordered,
+            )
+            if self.spool is not None
+            else None
+        )
+        self.media_deduplicator = MediaDeduplicator(self.mongo.media_hashes_repository)
+        # Near duplicate text indexes by window and size, kept across pipeline reloads
+        self.text_indexes: dict[tuple[float, int], LSHIndex] = {}
+        self.accounts = AccountPool(tweepy_accounts)
+        self.offloader = FilterOffloader(
+            kind=self.config.offload.executor,
+            max_workers=self.config.offload.max_workers,
+            timeout=self.config.offload.timeout,
+        )
+        self.http = TwitterSession(
+            limit=self.config.http.connection_limit,
+            keepalive_timeout=self.config.http.keepalive_timeout,
+            dns_ttl=self.config.http.dns_ttl,
+            prewarm_lead=timedelta(seconds=self.config.http.prewarm_lead),
+        )
+        self.stream = FurStream(
+            bearer_token=self.config.twitter.bearer_token,
+            furretweet=self,
+            accounts=self.accounts,
+            offloader=self.offloader,
+            http=self.http,
+            loop_monitor=LoopLagMonitor(
+                interval=self.config.loop.lag_interval,
+                warn_threshold=self.config.loop.lag_threshold,
+            ),
+            twitter_breaker=self.breaker("twitter", TWITTER_FAILURES),
+        )
+        self.health = HealthServer(
+            self.stream,
+            mongo=self.mongo,
+            breakers=[self.mongo.breaker, self.stream.twitter_breaker],
+            host=self.config.health.host,
+            port=self.config.health.port,
+            liveness_timeout=self.config.health.liveness_timeout,
+            probe_interval=self.config.health.mongo_probe_interval,
+        )
+        self.profiler = Profiler(
+            self.config.profiling.directory,
+            stage_timings=self.stream.stage_timings,
+            default_seconds=self.config.profiling.default_seconds,
+            max_seconds=self.config.profiling.max_seconds,
+        )
+        if self.config.profiling.admin_token:
+            self.profiler.install(self.health.app, self.config.profiling.admin_token)
+        telegram_bot.profiler = self.profiler
+        self.telegram_webhook = None
+        if self.config.telegram.webhook_url:
+            # Served by the health server, the app can't take routes once started
+            self.telegram_webhook = TelegramWebhook(
+                telegram_bot,
+                secret_token=self.config.telegram.webhook_secret,
+                max_concurrency=self.config.telegram.webhook_max_concurrency,
+            )
+            self.telegram_webhook.install(self.health.app)
+        self.snapshotter = StateSnapshotter(
+            self.stream,
+            (
+                FileSnapshotStore(self.config.snapshot.path)
+                if self.config.snapshot.path
+                else self.mongo.state_snapshots_repository
+            ),
+            interval=self.config.snapshot.interval,
+            max_age=self.config.snapshot.max_age,
+        )
+        self.pipeline_watcher = PipelineWatcher(
+            self.config.pipeline.path,
+            on_reload=self.stream.install_pipeline,
+            interval=self.config.pipeline.reload_interval,
+        )
         self._stream_task: asyncio.Task | None = None
 
+    def breaker(self, dependency: str, failures: tuple[type[BaseException], ...]):
+        resilience = self.config.resilience
+        return CircuitBreaker(
+            dependency,
+            timeout=getattr(resilience, f"{dependency}_timeout"),
+            failure_threshold=resilience.failure_threshold,
+            reset_timeout=resilience.reset_timeout,
+            failures=failures,
+        )
+
     async def start(self):
         logger.info("Starting FurRetweet")
+        self.profiler.install_signal_handler()
+        await self.health.start()
+        if self.telegram_webhook is not None:
+            try:
+                await telegram_bot.breaker.call(
+                    self.telegram_webhook.set_webhook, self.config.telegram.webhook_url
+                )
+            except DependencyUnavailable as e:
+                logger.warning(f"Telegram webhook not set: {e}")
+        await self.snapshotter.restore()
+        # Every account, and the list lookups going through the main one, share the pool
+        await self.http.attach(account.client for account in self.accounts)
+        await self.media_deduplicator.load()
+        if self.spool is not None:
+            await self.spool.start()
+            await self.spool_drainer.start()
+        if not self.stream.user_lists_warmed:
+            # Restored lists are refreshed by the first tweets instead
+            await self.stream.warm_user_lists()
+        await self.snapshotter.start()
         await self._start_stream()
 
     async def get_whitelist(self) -> list[int]:
@@ -55,27 +186,31 @@ class FurRetweet:
 
         return users_id
 
-    async def _setup_stream_filter(self):
-        # Check if rule already exists, if not add it
-        rules = await self.stream.get_rules()
-        # await self.stream.delete_rules(rules.data)  # type: ignore
-        if rules.data is None:  # type: ignore
-            logger.info("No stream rules found, adding new rules")
-            await self.stream.add_rules(add=STREAM_RULES)
-            return
-        logger.info("Stream rules found")
-
     async def _start_stream(self):
-        logger.debug(f"Stream Rules: {STREAM_RULES}")
-        await self._setup_stream_filter()
+        await self.stream.install_pipeline(load_pipeline(self.config.pipeline.path))
+        await self.pipeline_watcher.start()
         logger.info("Starting stream")
         self._stream_task = await self.stream.filter(
             expansions=STREAM_EXPANSIONS,
             tweet_fields=STREAM_TWEET_FIELDS,
             user_fields=STREAM_USER_FIELDS,
+            media_fields=STREAM_MEDIA_FIELDS,
         )
 
 
+def run(main) -> None:
+    if config.loop.uvloop:
+        try:
+            import uvloop
+        except ImportError:
+            logger.warning("USE_UVLOOP is set but uvloop is not installed, using asyncio's loop")
+        else:
+            logger.info("Running on uvloop")
+            with asyncio.Runner(loop_factory=uvloop.new_event_loop) as runner:
+                return runner.run(main)
+    asyncio.run(main)
+
+
 furretweet = FurRetweet()
 
-asyncio.run(furretweet.start())
+run(furretweet.start())
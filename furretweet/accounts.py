@@ -0,0 +1,86 @@
+import tweepy.asynchronous as tweepy
+from loguru import logger
+
+from furretweet.metrics import metrics
+from furretweet.rate_limiter import RetweetLimitHandler
+
+# Retweets allowed per 15 minutes window, assumed until an account's
+# first response tells its real limit.
+DEFAULT_RETWEET_LIMIT = 50
+
+
+class RetweetAccount:
+    """An account retweets are made with, and its own rate limit state.
+
+    An account without `campaigns` retweets for every campaign, otherwise
+    only for the listed ones."""
+
+    def __init__(
+        self,
+        name: str,
+        client: tweepy.AsyncClient,
+        campaigns: list[str] | None = None,
+        rate_limit_handler: RetweetLimitHandler | None = None,
+    ) -> None:
+        self.name = name
+        self.client = client
+        self.campaigns = set(campaigns or ())
+        self.rate_limit_handler = rate_limit_handler or RetweetLimitHandler()
+
+    def __repr__(self) -> str:
+        return f"<RetweetAccount {self.name}>"
+
+    def serves(self, campaign: str | None) -> bool:
+        return not self.campaigns or campaign in self.campaigns
+
+    def headroom(self) -> int:
+        """How many retweets this account can still make before its limit resets."""
+        handler = self.rate_limit_handler
+        if handler.is_limit_exceeded():
+            return 0
+        if not handler.populated or handler.seconds_until_reset <= 0:
+            return handler.limit or DEFAULT_RETWEET_LIMIT
+        return max(handler.remaining, 0)
+
+    def update_limits(self, headers) -> None:
+        self.rate_limit_handler.update_limits(headers)
+        metrics.gauge("account_quota_remaining", account=self.name).set(
+            self.rate_limit_handler.remaining
+        )
+
+
+class AccountPool:
+    """Spreads retweets over several accounts, each retweet goes to the
+    account serving its campaign with the most headroom."""
+
+    def __init__(self, accounts: list[RetweetAccount]) -> None:
+        if not accounts:
+            raise ValueError("An account pool needs at least one account")
+        self.accounts = accounts
+
+    def __len__(self) -> int:
+        return len(self.accounts)
+
+    def __iter__(self):
+        return iter(self.accounts)
+
+    @property
+    def primary(self) -> RetweetAccount:
+        return self.accounts[0]
+
+    def select(
+        self, campaign: str | None = None, exclude: frozenset[str] = frozenset()
+    ) -> RetweetAccount | None:
+        """Returns the account to retweet with, None if every account
+        serving the campaign, and not in `exclude`, reached its limit."""
+        candidates = [a for a in self.accounts if a.serves(campaign) and a.name not in exclude]
+        if not candidates:
+            if not exclude:
+                logger.warning(f"No account serves campaign {campaign}")
+            return None
+
+        # Ties go to the first account, so the primary one is used first.
+        account = max(candidates, key=lambda a: a.headroom())
+        if account.headroom() <= 0:
+            return None
+        return account
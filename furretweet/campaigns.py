@@ -0,0 +1,81 @@
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from typing import TYPE_CHECKING
+from zoneinfo import ZoneInfo
+
+if TYPE_CHECKING:
+    from furretweet.pipeline import Campaign
+
+# The time zones furthest behind and ahead of UTC, a day lasts 50 hours
+# somewhere in the world from when it starts in the latter to when it ends
+# in the former.
+LATEST_TIMEZONE = ZoneInfo("Etc/GMT+12")
+EARLIEST_TIMEZONE = ZoneInfo("Etc/GMT-14")
+
+
+def _as_utc(value: datetime | None) -> datetime | None:
+    if value is not None and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+class CampaignSchedule:
+    """When a campaign is active, generalizing the Friday check.
+
+    A campaign is active between `start` and `end` when given, and on
+    `weekdays` (0 is Monday) as long as it is one of them somewhere in the
+    world. No weekdays means every day."""
+
+    def __init__(
+        self,
+        weekdays: list[int] | None = None,
+        start: datetime | None = None,
+        end: datetime | None = None,
+    ) -> None:
+        self.weekdays = set(weekdays or ())
+        self.start = _as_utc(start)
+        self.end = _as_utc(end)
+
+    def weekdays_somewhere(self, now: datetime) -> set[int]:
+        latest = now.astimezone(LATEST_TIMEZONE).date()
+        earliest = now.astimezone(EARLIEST_TIMEZONE).date()
+        days = (earliest - latest).days + 1
+        return {(latest + timedelta(days=i)).weekday() for i in range(days)}
+
+    def is_active(self, now: datetime | None = None) -> bool:
+        now = now or datetime.now(timezone.utc)
+        if self.start is not None and now < self.start:
+            return False
+        if self.end is not None and now >= self.end:
+            return False
+        return not self.weekdays or not self.weekdays.isdisjoint(self.weekdays_somewhere(now))
+
+
+class CampaignBudget:
+    """Counts the retweets of each campaign over its rolling budget period.
+
+    It lives on the stream rather than in the compiled pipeline so
+    reloading the pipeline config doesn't reset the budgets."""
+
+    def __init__(self) -> None:
+        self._retweets: dict[str, deque[datetime]] = {}
+
+    def used(self, campaign: "Campaign", now: datetime | None = None) -> int:
+        retweets = self._retweets.get(campaign.name)
+        if not retweets:
+            return 0
+        now = now or datetime.now(timezone.utc)
+        oldest_allowed = now - timedelta(hours=campaign.spec.budget_period_hours)
+        while retweets and retweets[0] < oldest_allowed:
+            retweets.popleft()
+        return len(retweets)
+
+    def is_exhausted(self, campaign: "Campaign", now: datetime | None = None) -> bool:
+        max_retweets = campaign.spec.max_retweets
+        return max_retweets is not None and self.used(campaign, now) >= max_retweets
+
+    def record(self, campaign: "Campaign", now: datetime | None = None) -> None:
+        now = now or datetime.now(timezone.utc)
+        # Also prunes, campaigns without a budget are never checked
+        self.used(campaign, now)
+        self._retweets.setdefault(campaign.name, deque()).append(now)
@@ -0,0 +1,114 @@
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, TYPE_CHECKING
+
+import numpy as np
+
+from furretweet.models import StreamResponse
+
+if TYPE_CHECKING:
+    from furretweet.filters import BaseFilter
+
+
+@dataclass(frozen=True)
+class TweetColumns:
+    """The fields the numeric filters look at, one array per field and one row per tweet.
+
+    Datetimes are naive UTC `datetime64[us]`, the resolution of Python's datetime,
+    so comparisons give exactly the same results as on the objects."""
+
+    followers_count: np.ndarray
+    author_created_at: np.ndarray
+    hashtags_count: np.ndarray
+    new_lines_count: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.followers_count)
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[tuple[int, datetime, int, int]]) -> "TweetColumns":
+        rows = list(rows)
+        followers, created_at, hashtags, new_lines = zip(*rows) if rows else ((), (), (), ())
+        return cls(
+            followers_count=np.array(followers, dtype=np.int64),
+            author_created_at=datetime_column(created_at),
+            hashtags_count=np.array(hashtags, dtype=np.int32),
+            new_lines_count=np.array(new_lines, dtype=np.int32),
+        )
+
+    @classmethod
+    def from_responses(cls, responses: Iterable[StreamResponse]) -> "TweetColumns":
+        return cls.from_rows(
+            (
+                r.author.public_metrics.followers_count,
+                r.features.author_created_at,
+                r.features.hashtags_count,
+                r.features.new_lines_count,
+            )
+            for r in responses
+        )
+
+    @classmethod
+    def from_documents(cls, documents: Iterable[dict]) -> "TweetColumns":
+        """From stored documents holding the `tweet` and `includes` dicts,
+        without building the pydantic models."""
+        return cls.from_rows(_document_row(document) for document in documents)
+
+
+def _document_row(document: dict) -> tuple[int, datetime, int, int]:
+    tweet = document["tweet"]
+    users = document["includes"]["users"]
+    author = next((u for u in users if u["id"] == tweet["author_id"]), users[0])
+    return (
+        author["public_metrics"]["followers_count"],
+        author["created_at"],
+        len((tweet.get("entities") or {}).get("hashtags") or ()),
+        tweet["text"].count("\n"),
+    )
+
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_NAIVE_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+def _epoch_microseconds(value: datetime) -> int:
+    # Naive datetimes, as Mongo returns them, are in UTC
+    return (value - (_NAIVE_EPOCH if value.tzinfo is None else _EPOCH)) // _MICROSECOND
+
+
+def to_datetime64(value: datetime) -> np.datetime64:
+    return np.datetime64(_epoch_microseconds(value), "us")
+
+
+def datetime_column(values: Iterable[datetime]) -> np.ndarray:
+    values = list(values)
+    return np.fromiter(map(_epoch_microseconds, values), dtype=np.int64, count=len(values)).view(
+        "datetime64[us]"
+    )
+
+
+def evaluate(
+    filters: list["BaseFilter"],
+    columns: TweetColumns,
+    now: datetime | np.ndarray | None = None,
+) -> list[np.ndarray]:
+    """Returns the mask of the kept tweets for each filter, in the order of
+    `filters`. `now` is when the tweets are judged, either one datetime for
+    all of them or a `datetime_column` with one per tweet."""
+    if not isinstance(now, np.ndarray):
+        now = to_datetime64(now or datetime.now(timezone.utc))
+    masks = []
+    for f in filters:
+        if not f.columnar:
+            raise TypeError(f"{f.name} can't be evaluated on columns")
+        masks.append(f.filter_columns(columns, now))
+    return masks
+
+
+def passed(masks: list[np.ndarray], size: int) -> np.ndarray:
+    """Combines filter masks into the mask of the tweets that passed all of them."""
+    mask = np.ones(size, dtype=bool)
+    for filter_mask in masks:
+        mask &= filter_mask
+    return mask
@@ -1,7 +1,33 @@
 from dataclasses import dataclass
+import json
 import os
 
 
+@dataclass(frozen=True)
+class AccountConfig:
+    """An extra account retweets are spread over, authorized by the same app.
+    Without `campaigns` it retweets for every campaign."""
+
+    name: str
+    access_token: str
+    access_token_secret: str
+    campaigns: tuple[str, ...] = ()
+
+
+def _extra_accounts() -> tuple[AccountConfig, ...]:
+    # JSON list of {"name", "access_token", "access_token_secret", "campaigns"}
+    accounts = json.loads(os.environ.get("TWITTER_EXTRA_ACCOUNTS", "[]"))
+    return tuple(
+        AccountConfig(
+            name=account["name"],
+            access_token=account["access_token"],
+            access_token_secret=account["access_token_secret"],
+            campaigns=tuple(account.get("campaigns", ())),
+        )
+        for account in accounts
+    )
+
+
 @dataclass(frozen=True)
 class TwitterConfig:
     consumer_key: str = os.environ["TWITTER_CONSUMER_KEY"]
@@ -9,6 +35,7 @@ class TwitterConfig:
     access_token: str = os.environ["TWITTER_ACCESS_TOKEN"]
     access_token_secret: str = os.environ["TWITTER_ACCESS_TOKEN_SECRET"]
     bearer_token: str = os.environ["TWITTER_BEARER_TOKEN"]
+    extra_accounts: tuple[AccountConfig, ...] = _extra_accounts()
     whitelist_list_id = 1474582057816834053
     blacklist_list_id = 1474581944432222210
     bot_account_id = 965641664487415809
@@ -18,13 +45,114 @@ class TwitterConfig:
 class MongoConfig:
     uri: str = os.environ["MONGO_URI"]
     database: str = "furretweet"
+    max_pool_size: int = int(os.environ.get("MONGO_MAX_POOL_SIZE", "20"))
+    min_pool_size: int = int(os.environ.get("MONGO_MIN_POOL_SIZE", "2"))
+    # zstd and snappy need the pymongo[zstd,snappy] extras, zlib always works
+    compressors: str = os.environ.get("MONGO_COMPRESSORS", "zstd,snappy,zlib")
     not_retweeted_tweets_collection: str = "not_retweeted_tweets"
+    media_hashes_collection: str = "media_hashes"
+    author_retweets_collection: str = "author_retweets"
+    state_snapshots_collection: str = "state_snapshots"
+    # Tiers of `furretweet.database.DURABILITY_TIERS`. Losing a not retweeted
+    # tweet is harmless, losing author retweets lets an author past its cap.
+    not_retweeted_tweets_durability: str = os.environ.get(
+        "MONGO_NOT_RETWEETED_DURABILITY", "unacknowledged"
+    )
+    # Ordered bulk inserts stop at the first failed document
+    not_retweeted_tweets_ordered: bool = False
+    media_hashes_durability: str = os.environ.get("MONGO_MEDIA_HASHES_DURABILITY", "acknowledged")
+    author_retweets_durability: str = os.environ.get(
+        "MONGO_AUTHOR_RETWEETS_DURABILITY", "journaled"
+    )
+    state_snapshots_durability: str = os.environ.get(
+        "MONGO_STATE_SNAPSHOTS_DURABILITY", "acknowledged"
+    )
 
 
 @dataclass(frozen=True)
 class TelegramConfig:
     token: str = os.environ["TELEGRAM_TOKEN"]
     feed_channel_id: int = -498308406
+    # Public base url the health server is reachable on, empty to not receive updates
+    webhook_url: str = os.environ.get("TELEGRAM_WEBHOOK_URL", "")
+    webhook_secret: str = os.environ.get("TELEGRAM_WEBHOOK_SECRET", "")
+    webhook_max_concurrency: int = 8
+    # Telegram user ids allowed to run admin commands, like /profile
+    admin_ids: tuple[int, ...] = tuple(
+        int(user_id) for user_id in os.environ.get("TELEGRAM_ADMIN_IDS", "").split(",") if user_id
+    )
+
+
+@dataclass(frozen=True)
+class PipelineConfig:
+    path: str = os.environ.get("PIPELINE_CONFIG_PATH", "pipeline.toml")
+    reload_interval: float = 5.0
+
+
+@dataclass(frozen=True)
+class OffloadConfig:
+    executor: str = os.environ.get("OFFLOAD_EXECUTOR", "process")
+    max_workers: int = int(os.environ.get("OFFLOAD_MAX_WORKERS", "2"))
+    timeout: float = float(os.environ.get("OFFLOAD_TIMEOUT", "1.0"))
+
+
+@dataclass(frozen=True)
+class HttpConfig:
+    connection_limit: int = 20
+    keepalive_timeout: float = 75.0
+    dns_ttl: int = 300
+    prewarm_lead: float = 60.0
+
+
+@dataclass(frozen=True)
+class LoopConfig:
+    uvloop: bool = os.environ.get("USE_UVLOOP", "").lower() in ("1", "true", "yes")
+    lag_interval: float = 0.5
+    lag_threshold: float = float(os.environ.get("LOOP_LAG_THRESHOLD", "0.25"))
+
+
+@dataclass(frozen=True)
+class SpoolConfig:
+    # Empty to write to Mongo directly
+    path: str = os.environ.get("SPOOL_PATH", "")
+    fsync_interval: float = 0.05
+    drain_batch_size: int = 100
+    drain_interval: float = 1.0
+    drain_timeout: float = 10.0
+
+
+@dataclass(frozen=True)
+class ResilienceConfig:
+    twitter_timeout: float = float(os.environ.get("TWITTER_TIMEOUT", "10"))
+    mongo_timeout: float = float(os.environ.get("MONGO_TIMEOUT", "5"))
+    telegram_timeout: float = float(os.environ.get("TELEGRAM_TIMEOUT", "10"))
+    failure_threshold: int = 5
+    reset_timeout: float = 30.0
+
+
+@dataclass(frozen=True)
+class HealthConfig:
+    host: str = "0.0.0.0"
+    port: int = int(os.environ.get("HEALTH_PORT", "8080"))
+    liveness_timeout: float = 90.0
+    mongo_probe_interval: float = 15.0
+
+
+@dataclass(frozen=True)
+class SnapshotConfig:
+    # Empty to keep the snapshot in Mongo
+    path: str = os.environ.get("STATE_SNAPSHOT_PATH", "")
+    interval: float = 30.0
+    max_age: float = float(os.environ.get("STATE_SNAPSHOT_MAX_AGE", "900"))
+
+
+@dataclass(frozen=True)
+class ProfilingConfig:
+    directory: str = os.environ.get("PROFILE_DIR", "profiles")
+    default_seconds: float = 30.0
+    max_seconds: float = 300.0
+    # Bearer token of the /admin routes of the health server, empty to not serve them
+    admin_token: str = os.environ.get("ADMIN_TOKEN", "")
 
 
 @dataclass(frozen=True)
@@ -32,6 +160,15 @@ class Config:
     twitter = TwitterConfig()
     mongo = MongoConfig()
     telegram = TelegramConfig()
+    pipeline = PipelineConfig()
+    offload = OffloadConfig()
+    http = HttpConfig()
+    loop = LoopConfig()
+    spool = SpoolConfig()
+    resilience = ResilienceConfig()
+    health = HealthConfig()
+    snapshot = SnapshotConfig()
+    profiling = ProfilingConfig()
 
 
 config = Config()
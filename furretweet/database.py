@@ -1,22 +1,119 @@
 from pydantic import BaseModel, Field
-from typing import TYPE_CHECKING
+from typing import AsyncIterator, TYPE_CHECKING
+from dataclasses import dataclass
 from datetime import datetime, timezone
 
+import bson
+from loguru import logger
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import WriteConcern
+
+from furretweet.resilience import CircuitBreaker, DependencyUnavailable, guarded
 
 if TYPE_CHECKING:
     from furretweet.config import Config
+    from furretweet.media import HashEntry
     from furretweet.models import StreamResponse
+    from furretweet.spool import Spool
+
+
+@dataclass(frozen=True)
+class WriteDurability:
+    """How long a write waits for Mongo before it counts as done.
+
+    `w=0` doesn't wait at all, a write lost to a crash or rejected by the
+    server goes unnoticed. `journal` also waits for the journal to be on
+    disk, and `w="majority"` for most of the replica set to have it."""
+
+    w: int | str = 1
+    journal: bool = False
+
+    @property
+    def write_concern(self) -> WriteConcern:
+        # Journaling can't be asked from an unacknowledged write
+        return WriteConcern(w=self.w, j=self.journal if self.w != 0 else None)
+
+
+DURABILITY_TIERS = {
+    "unacknowledged": WriteDurability(w=0),
+    "acknowledged": WriteDurability(w=1),
+    "journaled": WriteDurability(w=1, journal=True),
+    "majority": WriteDurability(w="majority", journal=True),
+}
+
+
+def durability_tier(name: str) -> WriteDurability:
+    try:
+        return DURABILITY_TIERS[name]
+    except KeyError:
+        raise ValueError(
+            f"Unknown durability tier {name}, expected one of {list(DURABILITY_TIERS)}"
+        ) from None
 
 
 class MongoDatabase:
-    def __init__(self, config: "Config") -> None:
+    def __init__(
+        self,
+        config: "Config",
+        spool: "Spool | None" = None,
+        breaker: CircuitBreaker | None = None,
+    ) -> None:
         self.config = config
-        self.client = AsyncIOMotorClient(config.mongo.uri)
-        self.db = self.client[config.mongo.database]
+        mongo = config.mongo
+        self.client = AsyncIOMotorClient(
+            mongo.uri,
+            maxPoolSize=mongo.max_pool_size,
+            minPoolSize=mongo.min_pool_size,
+            # The first one the server supports is used, those not installed are skipped
+            compressors=mongo.compressors,
+        )
+        self.db = self.client[mongo.database]
+        # Shared by the repositories, they all go down with the same server
+        self.breaker = breaker
         self.not_retweeted_tweets_repository = NotRetweetedTweetsRepository(
-            collection=self.db[self.config.mongo.not_retweeted_tweets_collection]
+            collection=self.collection(
+                mongo.not_retweeted_tweets_collection, mongo.not_retweeted_tweets_durability
+            ),
+            spool=spool,
+            breaker=breaker,
+        )
+        self.media_hashes_repository = MediaHashesRepository(
+            collection=self.collection(
+                mongo.media_hashes_collection, mongo.media_hashes_durability
+            ),
+            breaker=breaker,
+        )
+        self.author_retweets_repository = AuthorRetweetsRepository(
+            collection=self.collection(
+                mongo.author_retweets_collection, mongo.author_retweets_durability
+            ),
+            breaker=breaker,
         )
+        self.state_snapshots_repository = StateSnapshotsRepository(
+            collection=self.collection(
+                mongo.state_snapshots_collection, mongo.state_snapshots_durability
+            ),
+            breaker=breaker,
+        )
+
+    def collection(self, name: str, durability: str):
+        """The collection `name`, its writes waiting as long as the durability tier says."""
+        return self.db.get_collection(
+            name, write_concern=durability_tier(durability).write_concern
+        )
+
+    @staticmethod
+    def acknowledged(collection):
+        """The same collection, with its writes acknowledged at least. The
+        spool drainer needs to know Mongo took a batch before dropping it."""
+        if collection.write_concern.acknowledged:
+            return collection
+        return collection.with_options(
+            write_concern=DURABILITY_TIERS["acknowledged"].write_concern
+        )
+
+    async def ping(self) -> None:
+        await guarded(self.breaker, self.client.admin.command, "ping")
 
 
 class FailedFilter(BaseModel):
@@ -34,10 +131,39 @@ class NotRetweetedTweet(BaseModel):
 
 
 class NotRetweetedTweetsRepository:
-    def __init__(self, collection) -> None:
+    def __init__(
+        self,
+        collection,
+        spool: "Spool | None" = None,
+        breaker: CircuitBreaker | None = None,
+    ) -> None:
         self.collection = collection
+        # When set, documents are appended to it and a SpoolDrainer writes them to Mongo
+        self.spool = spool
+        self.breaker = breaker
 
     async def add(self, response: "StreamResponse") -> None:
+        if self.spool is not None:
+            self.spool.append(bson.encode(self.document(response)))
+            return
+        document = self.document(response)
+        try:
+            # A tweet that failed its filters is written again if it passes the
+            # recheck but the selector gives it up, the first record is kept,
+            # as the spool drainer does
+            await guarded(
+                self.breaker,
+                self.collection.update_one,
+                {"_id": document.pop("_id")},
+                {"$setOnInsert": document},
+                upsert=True,
+            )
+        except DependencyUnavailable as e:
+            # Without a spool there is nowhere to keep it
+            logger.warning(f"Tweet {response.tweet.id} not saved: {e}")
+
+    @staticmethod
+    def document(response: "StreamResponse") -> dict:
         tweet = NotRetweetedTweet(
             _id=str(response.tweet.id),
             text=response.tweet.text,
@@ -49,4 +175,101 @@ class NotRetweetedTweetsRepository:
                 for filter in response.failed_filters
             ],
         )
-        await self.collection.insert_one(tweet.dict(by_alias=True))
+        document = tweet.dict(by_alias=True)
+        # The full payload lets decisions be replayed with other filters later
+        document["tweet"] = response.tweet.dict()
+        document["includes"] = response.includes.dict()
+        document["campaign"] = response.campaign.name if response.campaign else None
+        return document
+
+
+class MediaHashesRepository:
+    def __init__(self, collection, breaker: CircuitBreaker | None = None) -> None:
+        self.collection = collection
+        self.breaker = breaker
+
+    async def add(self, entry: "HashEntry") -> None:
+        try:
+            # The same media can be seen again after a restart or a reconnect.
+            await guarded(
+                self.breaker,
+                self.collection.update_one,
+                {"_id": entry.media_key},
+                {
+                    "$setOnInsert": {
+                        "hash": f"{entry.hash:016x}",
+                        "tweet_id": entry.tweet_id,
+                        "created_at": datetime.now(timezone.utc),
+                    }
+                },
+                upsert=True,
+            )
+        except DependencyUnavailable as e:
+            # Still in the in-memory index, only lost on restart
+            logger.warning(f"Hash of media {entry.media_key} not saved: {e}")
+
+    async def all(self) -> AsyncIterator[dict]:
+        async for document in self.collection.find({}, {"hash": 1, "tweet_id": 1}):
+            yield document
+
+
+class AuthorRetweetsRepository:
+    def __init__(self, collection, breaker: CircuitBreaker | None = None) -> None:
+        self.collection = collection
+        self.breaker = breaker
+
+    async def save(self, author_id: str, retweets: list[datetime]) -> None:
+        try:
+            await guarded(
+                self.breaker,
+                self.collection.update_one,
+                {"_id": author_id},
+                {"$set": {"retweets": retweets}},
+                upsert=True,
+            )
+        except DependencyUnavailable as e:
+            # The count in memory is still right, only lost on restart
+            logger.warning(f"Retweets of author {author_id} not saved: {e}")
+
+    async def since(self, since: datetime) -> AsyncIterator[tuple[str, list[datetime]]]:
+        """Yields the authors retweeted after `since` with their retweet times."""
+        async for document in self.collection.find({"retweets": {"$gt": since}}):
+            # Mongo returns naive datetimes in UTC
+            yield document["_id"], [
+                r if r.tzinfo else r.replace(tzinfo=timezone.utc) for r in document["retweets"]
+            ]
+
+
+class StateSnapshotsRepository:
+    """Keeps the state snapshot of the bot, see `StateSnapshotter`."""
+
+    SNAPSHOT_ID = "state"
+
+    def __init__(self, collection, breaker: CircuitBreaker | None = None) -> None:
+        self.collection = collection
+        self.breaker = breaker
+
+    async def load(self) -> dict | None:
+        try:
+            document = await guarded(
+                self.breaker, self.collection.find_one, {"_id": self.SNAPSHOT_ID}
+            )
+        except DependencyUnavailable as e:
+            logger.warning(f"State snapshot not loaded: {e}")
+            return None
+        if document is not None:
+            document.pop("_id", None)
+        return document
+
+    async def save(self, snapshot: dict) -> None:
+        try:
+            await guarded(
+                self.breaker,
+                self.collection.replace_one,
+                {"_id": self.SNAPSHOT_ID},
+                snapshot,
+                upsert=True,
+            )
+        except DependencyUnavailable as e:
+            # The previous one is kept, it will be rejected once too old
+            logger.warning(f"State snapshot not saved: {e}")
@@ -0,0 +1,24 @@
+class RecentIds:
+    """The last `maxlen` ids added, in the order they were added. Twitter can
+    deliver a tweet again after a reconnect, and Telegram retries an update
+    until the webhook acknowledges it."""
+
+    def __init__(self, maxlen: int = 10_000) -> None:
+        self.maxlen = maxlen
+        # Dicts keep insertion order, the first key is the oldest id
+        self._ids: dict[int, None] = {}
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __contains__(self, value: int) -> bool:
+        return value in self._ids
+
+    def __iter__(self):
+        return iter(self._ids)
+
+    def add(self, value: int) -> None:
+        self._ids.pop(value, None)
+        self._ids[value] = None
+        if len(self._ids) > self.maxlen:
+            del self._ids[next(iter(self._ids))]
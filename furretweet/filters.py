@@ -1,14 +1,44 @@
-import re
-from typing import TypeVar
-from furretweet.models import Tweet, StreamResponse
+import time
+import numpy as np
+from typing import TypeVar, TYPE_CHECKING
+from furretweet.minhash import LSHEntry, LSHIndex, MinHasher, normalize_text
+from furretweet.models import Tweet, StreamResponse, TweetSnapshot
+from furretweet.normalize import TermIndex
+from furretweet.rate_limiter import AuthorRetweetCounter
 from abc import ABC, abstractmethod
+from dataclasses import dataclass
 from datetime import datetime, timezone, timedelta
 
+if TYPE_CHECKING:
+    from furretweet.__main__ import FurRetweet
+    from furretweet.columnar import TweetColumns
+    from furretweet.database import AuthorRetweetsRepository
+    from furretweet.media import DuplicateMatch, MediaDeduplicator
+
 
 Filter = TypeVar("Filter", bound="BaseFilter")
 
 
+@dataclass(frozen=True)
+class FilterResult:
+    passed: bool
+    details: dict
+
+
 class BaseFilter(ABC):
+    # Whether the result depends on other tweets or on the bot's state, so it
+    # can't be replayed on a single stored tweet.
+    stateful = False
+    # Whether `filter_columns` is implemented, for bulk evaluation.
+    columnar = False
+    # Whether `check` is run in a worker, off the event loop. Set with `offload`
+    # in the pipeline config, the round trip costs more than most checks.
+    cpu_bound = False
+    # Decision taken when the worker fails or times out, `check` isn't run
+    # again on the event loop it was sent away from.
+    offload_fallback = False
+    offloaded: tuple[int, FilterResult] | None = None
+
     @abstractmethod
     def filter(self, response: StreamResponse) -> bool:
         """Should return False if the tweet should be
@@ -22,6 +52,39 @@ class BaseFilter(ABC):
         filter or an empty dict if not applicable."""
         raise NotImplementedError
 
+    def filter_columns(self, columns: "TweetColumns", now: np.ndarray) -> np.ndarray:
+        """Vectorized `filter` over many tweets, returns the mask of the kept ones.
+        `now` is a `datetime64[us]`, or an array of one per tweet."""
+        raise NotImplementedError
+
+    def check(self, snapshot: TweetSnapshot) -> FilterResult:
+        """Pure version of `filter` for cpu bound filters, run on a copy
+        of the filter in a worker with only a snapshot of the tweet."""
+        raise NotImplementedError
+
+    def result(self, response: StreamResponse) -> FilterResult:
+        """The offloaded result for this tweet if there is one, else runs `check` inline."""
+        offloaded, self.offloaded = self.offloaded, None
+        if offloaded is not None and offloaded[0] == response.tweet.id:
+            return offloaded[1]
+        return self.check(TweetSnapshot.from_response(response))
+
+    async def setup(self, furretweet: "FurRetweet") -> None:
+        """Called once when a pipeline with this filter is installed,
+        for filters that depend on shared resources of the bot."""
+
+    async def fetch(self, response: StreamResponse) -> None:
+        """Called before the processing lock is taken, for I/O that doesn't depend
+        on other tweets. Results are kept on `response`, as other tweets are
+        fetched concurrently."""
+
+    async def prepare(self, response: StreamResponse) -> None:
+        """Called before `filter` for filters that need to do I/O,
+        so `filter` itself can stay synchronous."""
+
+    async def on_retweet(self, response: StreamResponse) -> None:
+        """Called after a tweet that passed this filter was retweeted."""
+
     @property
     def name(self) -> str:
         return self.__class__.__name__
@@ -34,6 +97,8 @@ class BaseFilter(ABC):
 
 
 class MinimumFollowersFilter(BaseFilter):
+    columnar = True
+
     def __init__(self, min_followers: int):
         self.min_followers = min_followers
 
@@ -43,6 +108,9 @@ class MinimumFollowersFilter(BaseFilter):
             return False
         return True
 
+    def filter_columns(self, columns: "TweetColumns", now: np.ndarray) -> np.ndarray:
+        return columns.followers_count >= self.min_followers
+
     @property
     def details(self) -> dict:
         return {
@@ -61,36 +129,46 @@ class NsfwFilter(BaseFilter):
 
 
 class MinimumAccountAgeFilter(BaseFilter):
+    columnar = True
+
     def __init__(self, min_days: int):
         self.min_days = min_days
 
     def filter(self, response: StreamResponse) -> bool:
         self.response = response
         self.now = datetime.now(tz=timezone.utc)
-        if response.author.created_at < self.now - timedelta(days=self.min_days):
+        if response.features.author_age(self.now) > timedelta(days=self.min_days):
             return True
         return False
 
+    def filter_columns(self, columns: "TweetColumns", now: np.ndarray) -> np.ndarray:
+        return columns.author_created_at < now - np.timedelta64(self.min_days, "D")
+
     @property
     def details(self) -> dict:
         return {
             "min_account_days": self.min_days,
-            "account_created_at": self.response.author.created_at,
+            "account_created_at": self.response.features.author_created_at,
             "checked_at": self.now,
         }
 
 
 class MaximumNewLinesFilter(BaseFilter):
+    columnar = True
+
     def __init__(self, max: int):
         self.max = max
 
     def filter(self, response: StreamResponse) -> bool:
         self.response = response
-        self.count = response.tweet.text.count("\n")
+        self.count = response.features.new_lines_count
         if self.count > self.max:
             return False
         return True
 
+    def filter_columns(self, columns: "TweetColumns", now: np.ndarray) -> np.ndarray:
+        return columns.new_lines_count <= self.max
+
     @property
     def details(self) -> dict:
         return {
@@ -100,13 +178,8 @@ class MaximumNewLinesFilter(BaseFilter):
 
 
 class FursuitFridayOnlyFilter(BaseFilter):
-    def remove_tco_links(self, text: str) -> str:
-        pattern = r"https?://t\.co/\w+"
-        return re.sub(pattern, "", text)
-
     def filter(self, response: StreamResponse) -> bool:
-        text = self.remove_tco_links(response.tweet.text)
-        if text.lower().strip() == "#fursuitfriday":
+        if response.features.text_without_links.strip() == "#fursuitfriday":
             return False
         return True
 
@@ -117,7 +190,7 @@ class FursuitFridayOnlyFilter(BaseFilter):
 
 class MediaFilter(BaseFilter):
     def filter(self, response: StreamResponse) -> bool:
-        if response.includes.media:
+        if response.features.media_types:
             return True
         return False
 
@@ -127,19 +200,20 @@ class MediaFilter(BaseFilter):
 
 
 class MaximumHashtagsFilter(BaseFilter):
+    columnar = True
+
     def __init__(self, max: int):
         self.max = max
 
     def filter(self, response: StreamResponse) -> bool:
-        if not response.tweet.entities or not response.tweet.entities.get("hashtags"):
-            return True
-
-        self.count = len(response.tweet.entities["hashtags"])
-
+        self.count = response.features.hashtags_count
         if self.count > self.max:
             return False
         return True
 
+    def filter_columns(self, columns: "TweetColumns", now: np.ndarray) -> np.ndarray:
+        return columns.hashtags_count <= self.max
+
     @property
     def details(self) -> dict:
         return {
@@ -148,16 +222,190 @@ class MaximumHashtagsFilter(BaseFilter):
         }
 
 
-class BannedTermsFilter(BaseFilter):
+class MinimumEngagementFilter(BaseFilter):
+    def __init__(self, min_engagement: int):
+        self.min_engagement = min_engagement
+
+    def filter(self, response: StreamResponse) -> bool:
+        metrics = response.tweet.public_metrics
+        self.engagement = (
+            metrics.like_count + metrics.retweet_count + metrics.quote_count + metrics.reply_count
+        )
+        if self.engagement < self.min_engagement:
+            return False
+        return True
+
+    @property
+    def details(self) -> dict:
+        return {
+            "min_engagement": self.min_engagement,
+            "engagement": self.engagement,
+        }
+
+
+class DuplicateMediaFilter(BaseFilter):
+    stateful = True
+
+    def __init__(self, max_distance: int = 4):
+        self.max_distance = max_distance
+        self.matches: list["DuplicateMatch"] = []
+
+    async def setup(self, furretweet: "FurRetweet") -> None:
+        self.deduplicator: "MediaDeduplicator" = furretweet.media_deduplicator
+        if self.max_distance > self.deduplicator.index.max_distance:
+            raise ValueError(
+                f"max_distance can't be higher than {self.deduplicator.index.max_distance}"
+            )
+
+    async def fetch(self, response: StreamResponse) -> None:
+        await self.deduplicator.fetch(response)
+
+    async def prepare(self, response: StreamResponse) -> None:
+        self.matches = await self.deduplicator.check(response, self.max_distance)
+
+    def filter(self, response: StreamResponse) -> bool:
+        if self.matches:
+            return False
+        return True
+
+    @property
+    def details(self) -> dict:
+        return {
+            "max_distance": self.max_distance,
+            "duplicates": [
+                {
+                    "media_key": match.media_key,
+                    "duplicate_of_media_key": match.duplicate_of.media_key,
+                    "duplicate_of_tweet_id": match.duplicate_of.tweet_id,
+                    "distance": match.distance,
+                }
+                for match in self.matches
+            ],
+        }
+
+
+class NearDuplicateTextFilter(BaseFilter):
+    """Rejects tweets whose text is nearly the same as more than `max_cluster_size`
+    other tweets seen in the last `window_minutes`, as in coordinated spam waves."""
+
+    stateful = True
+
+    def __init__(
+        self,
+        threshold: float = 0.8,
+        max_cluster_size: int = 5,
+        window_minutes: float = 60,
+        min_length: int = 30,
+        max_entries: int = 100_000,
+    ):
+        self.threshold = threshold
+        self.max_cluster_size = max_cluster_size
+        self.min_length = min_length
+        self.hasher = MinHasher()
+        self.index = LSHIndex(window=window_minutes * 60, max_entries=max_entries)
+
+    async def setup(self, furretweet: "FurRetweet") -> None:
+        # The index of the previous pipeline, so a reload doesn't forget the recent tweets
+        key = (self.index.window, self.index.max_entries)
+        self.index = furretweet.text_indexes.setdefault(key, self.index)
+
     def filter(self, response: StreamResponse) -> bool:
-        self.terms_found = [
-            terms for terms in self.banned_terms if terms.lower() in response.tweet.text.lower()
-        ]
+        self.similar: list[LSHEntry] = []
+        text = normalize_text(response.tweet.text)
+        if len(text) < self.min_length:
+            # Too short to tell spam apart from the usual "Happy #FursuitFriday!"
+            return True
+
+        now = time.monotonic()
+        self.index.evict(now)
+        signature = self.hasher.signature(text)
+        key = str(response.tweet.id)
+        self.similar = [e for e in self.index.query(signature, self.threshold) if e.key != key]
+        self.index.insert(LSHEntry(key, str(response.author.id), signature, now))
+
+        if len(self.similar) + 1 > self.max_cluster_size:
+            return False
+        return True
+
+    @property
+    def details(self) -> dict:
+        return {
+            "threshold": self.threshold,
+            "max_cluster_size": self.max_cluster_size,
+            "cluster_size": len(self.similar) + 1,
+            "cluster_authors": len({e.author_id for e in self.similar}),
+            "similar_tweet_ids": [e.key for e in self.similar[:10]],
+        }
+
+
+class AuthorRetweetCapFilter(BaseFilter):
+    """Limits how many tweets of the same author are retweeted in `period_hours`,
+    the default covers the whole 50 hours Friday window."""
+
+    stateful = True
+
+    def __init__(self, max_retweets: int = 3, period_hours: float = 50):
+        self.max_retweets = max_retweets
+        self.period_hours = period_hours
+        self.counter = AuthorRetweetCounter(max_retweets, timedelta(hours=period_hours))
+        self.repository: "AuthorRetweetsRepository | None" = None
+
+    async def setup(self, furretweet: "FurRetweet") -> None:
+        self.repository = furretweet.mongo.author_retweets_repository
+        since = datetime.now(tz=timezone.utc) - self.counter.period
+        async for author_id, retweets in self.repository.since(since):
+            self.counter.restore(author_id, retweets)
+
+    async def on_retweet(self, response: StreamResponse) -> None:
+        author_id = str(response.author.id)
+        retweets = self.counter.record(author_id)
+        if self.repository is not None:
+            await self.repository.save(author_id, retweets)
 
-        if self.terms_found:
+    def filter(self, response: StreamResponse) -> bool:
+        self.count = self.counter.count(str(response.author.id))
+        if self.count >= self.max_retweets:
             return False
         return True
 
+    @property
+    def details(self) -> dict:
+        return {
+            "max_retweets": self.max_retweets,
+            "period_hours": self.period_hours,
+            "author_retweets": self.count,
+            "tracked_authors": len(self.counter),
+        }
+
+
+class BannedTermsFilter(BaseFilter):
+    """Rejects tweets containing a banned term.
+
+    Both the text and the terms are normalized, so look-alike letters,
+    leetspeak or zero-width characters don't get past it. `banned_terms`
+    match inside words too, so "nft" catches "#NFTs", the ones also in
+    `word_terms` only match whole words, so "monk" lets "monkey" through."""
+
+    def __init__(self, banned_terms: list[str] | None = None, word_terms: list[str] | None = None):
+        if banned_terms is not None:
+            self.banned_terms = banned_terms
+        if word_terms is not None:
+            self.word_terms = word_terms
+
+    @property
+    def index(self) -> TermIndex:
+        # Cached by the terms, so changing them compiles a new index
+        return TermIndex.compile(tuple(self.banned_terms), tuple(self.word_terms))
+
+    def check(self, snapshot: TweetSnapshot) -> FilterResult:
+        terms_found = self.index.find(snapshot.text_folded)
+        return FilterResult(passed=not terms_found, details={"terms_found": terms_found})
+
+    def filter(self, response: StreamResponse) -> bool:
+        result = self.result(response)
+        self.terms_found = result.details.get("terms_found", [])
+        return result.passed
+
     @property
     def details(self) -> dict:
         return {
@@ -225,3 +473,13 @@ class BannedTermsFilter(BaseFilter):
         "💦",
         "🔞",
     ]
+
+    # Found inside unrelated words: monkey, wiping, debts, manuscript, farther, murray
+    word_terms = [
+        "anus",
+        "bts",
+        "fart",
+        "monk",
+        "murr",
+        "wip",
+    ]
@@ -0,0 +1,157 @@
+import asyncio
+import time
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING
+
+from aiohttp import web
+from loguru import logger
+
+from furretweet.metrics import metrics
+from furretweet.resilience import CircuitBreaker, DependencyUnavailable
+
+if TYPE_CHECKING:
+    from furretweet.database import MongoDatabase
+    from furretweet.stream import FurStream
+
+
+class HealthServer:
+    """Small HTTP server telling how the bot is doing, for Docker and humans.
+
+    - `/healthz` fails once no byte came from the stream for `liveness_timeout`
+      seconds, Twitter sends a keep-alive every 20 seconds on a healthy one.
+    - `/readyz` succeeds once the white and blacklists were fetched and the
+      last Mongo ping succeeded.
+    - `/stats` is a JSON view of what the bot did since it started.
+
+    Every read answers from state kept in memory, Mongo is only pinged by a
+    background task every `probe_interval` seconds."""
+
+    def __init__(
+        self,
+        stream: "FurStream",
+        mongo: "MongoDatabase | None" = None,
+        breakers: list[CircuitBreaker] | None = None,
+        host: str = "0.0.0.0",
+        port: int = 8080,
+        liveness_timeout: float = 90.0,
+        probe_interval: float = 15.0,
+    ) -> None:
+        self.stream = stream
+        self.mongo = mongo
+        self.breakers = breakers or []
+        self.host = host
+        self.port = port
+        self.liveness_timeout = liveness_timeout
+        self.probe_interval = probe_interval
+        self.started_at = time.monotonic()
+        self.mongo_reachable = mongo is None
+        self.task: asyncio.Task | None = None
+        self._runner: web.AppRunner | None = None
+
+        self.app = web.Application()
+        self.app.router.add_get("/healthz", self.liveness)
+        self.app.router.add_get("/readyz", self.readiness)
+        self.app.router.add_get("/stats", self.stats)
+
+    async def start(self) -> None:
+        if self._runner is None:
+            self._runner = web.AppRunner(self.app, access_log=None)
+            await self._runner.setup()
+            await web.TCPSite(self._runner, self.host, self.port).start()
+            logger.info(f"Health server listening on {self.host}:{self.port}")
+        if self.mongo is not None and self.task is None:
+            self.task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def probe(self) -> None:
+        try:
+            await self.mongo.ping()
+            self.mongo_reachable = True
+        except DependencyUnavailable as e:
+            self.mongo_reachable = False
+            logger.warning(f"Mongo ping failed: {e}")
+        except Exception:
+            self.mongo_reachable = False
+            logger.exception("Exception while pinging Mongo")
+
+    async def _run(self) -> None:
+        while True:
+            await self.probe()
+            await asyncio.sleep(self.probe_interval)
+
+    def seconds_since_last_byte(self) -> float:
+        return time.monotonic() - self.stream.last_data_at
+
+    async def liveness(self, request: web.Request) -> web.Response:
+        idle = self.seconds_since_last_byte()
+        alive = idle < self.liveness_timeout
+        return web.json_response(
+            {"alive": alive, "seconds_since_last_byte": round(idle, 3)},
+            status=200 if alive else 503,
+        )
+
+    async def readiness(self, request: web.Request) -> web.Response:
+        checks = {
+            "user_lists": self.stream.user_lists_warmed,
+            "mongo": self.mongo_reachable,
+        }
+        ready = all(checks.values())
+        return web.json_response({"ready": ready, **checks}, status=200 if ready else 503)
+
+    async def stats(self, request: web.Request) -> web.Response:
+        return web.json_response(self.snapshot())
+
+    def snapshot(self) -> dict:
+        now = datetime.now(timezone.utc)
+        stream = self.stream
+        rejections = {
+            dict(labels)["filter"]: int(counter.value)
+            for labels, counter in metrics.family("filter_rejections_total").items()
+        }
+        return {
+            "uptime_seconds": round(time.monotonic() - self.started_at, 3),
+            "seconds_since_last_byte": round(self.seconds_since_last_byte(), 3),
+            "tweets": {
+                "received": int(metrics.counter("tweets_received_total").value),
+                "retweeted": int(sum(c.value for c in metrics.family("retweets_total").values())),
+                "not_retweeted": int(metrics.counter("tweets_not_retweeted_total").value),
+                "rejected_by_filter": rejections,
+            },
+            "accounts": {
+                account.name: {
+                    "populated": account.rate_limit_handler.populated,
+                    "remaining": account.rate_limit_handler.remaining,
+                    "limit": account.rate_limit_handler.limit,
+                    "reset_at": account.rate_limit_handler.reset_time.isoformat(),
+                    "seconds_until_reset": account.rate_limit_handler.seconds_until_reset,
+                }
+                for account in stream.accounts
+            },
+            "campaigns": {
+                campaign.name: {
+                    "active": campaign.schedule.is_active(now),
+                    "weekdays": sorted(campaign.schedule.weekdays),
+                    "start": _isoformat(campaign.schedule.start),
+                    "end": _isoformat(campaign.schedule.end),
+                    "retweets_in_budget_period": stream.campaign_budget.used(campaign, now),
+                    "max_retweets": campaign.spec.max_retweets,
+                }
+                for campaign in stream.pipeline.campaigns
+            },
+            "selection_pending": len(stream.selector),
+            "recheck_pending": len(stream.recheck_queue),
+            "breakers": {
+                breaker.dependency: breaker.state.name.lower() for breaker in self.breakers
+            },
+        }
+
+
+def _isoformat(value: datetime | None) -> str | None:
+    return value.isoformat() if value is not None else None
@@ -0,0 +1,173 @@
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from typing import Iterable, TYPE_CHECKING
+
+import aiohttp
+from loguru import logger
+
+from furretweet.metrics import metrics
+
+if TYPE_CHECKING:
+    from tweepy.asynchronous import AsyncClient
+    from furretweet.stream import FurStream
+
+TWITTER_API_URL = "https://api.twitter.com"
+HANDSHAKE_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class TwitterSession:
+    """One aiohttp session shared by every client calling the Twitter API.
+
+    Without a session of its own, tweepy's `AsyncClient` opens a new one for
+    each request, so every retweet or lookup pays the DNS lookup and the TLS
+    handshake. This one keeps connections alive between requests, caches DNS
+    answers and caps the number of connections."""
+
+    def __init__(
+        self,
+        limit: int = 20,
+        keepalive_timeout: float = 75.0,
+        dns_ttl: int = 300,
+        timeout: float = 30.0,
+        prewarm_lead: timedelta = timedelta(minutes=1),
+    ) -> None:
+        self.limit = limit
+        self.keepalive_timeout = keepalive_timeout
+        self.dns_ttl = dns_ttl
+        self.timeout = timeout
+        self.prewarm_lead = prewarm_lead
+        self.session: aiohttp.ClientSession | None = None
+        self._clients: list["AsyncClient"] = []
+
+    async def open(self) -> aiohttp.ClientSession:
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                keepalive_timeout=self.keepalive_timeout,
+                ttl_dns_cache=self.dns_ttl,
+                enable_cleanup_closed=True,
+            )
+            self.session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                trace_configs=[trace_config()],
+            )
+            for client in self._clients:
+                client.session = self.session
+        return self.session
+
+    async def attach(self, clients: Iterable["AsyncClient"]) -> None:
+        session = await self.open()
+        for client in clients:
+            client.session = session
+            self._clients.append(client)
+
+    async def prewarm(self, connections: int = 2) -> None:
+        """Opens `connections` connections to the API ahead of the traffic.
+
+        The requests are unauthenticated and their response is ignored,
+        only the connections they leave in the pool matter."""
+        session = await self.open()
+        start = time.perf_counter()
+        results = await asyncio.gather(
+            *(self._touch(session) for _ in range(connections)), return_exceptions=True
+        )
+        failed = [r for r in results if isinstance(r, Exception)]
+        if failed:
+            logger.warning(f"Failed to pre-warm {len(failed)} API connections: {failed[0]!r}")
+        metrics.counter("http_prewarms_total").inc()
+        logger.info(
+            f"Pre-warmed {connections - len(failed)} API connections "
+            f"in {time.perf_counter() - start:.3f}s"
+        )
+
+    async def _touch(self, session: aiohttp.ClientSession) -> None:
+        async with session.head(TWITTER_API_URL + "/2/openapi.json") as response:
+            await response.read()
+
+    async def close(self) -> None:
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+
+def trace_config() -> aiohttp.TraceConfig:
+    config = aiohttp.TraceConfig()
+    config.on_connection_create_start.append(_on_connection_create_start)
+    config.on_connection_create_end.append(_on_connection_create_end)
+    config.on_connection_reuseconn.append(_on_connection_reused)
+    config.on_dns_cache_hit.append(_on_dns_cache_hit)
+    config.on_dns_cache_miss.append(_on_dns_cache_miss)
+    return config
+
+
+async def _on_connection_create_start(session, context: SimpleNamespace, params) -> None:
+    context.connection_start = time.perf_counter()
+
+
+async def _on_connection_create_end(session, context: SimpleNamespace, params) -> None:
+    metrics.histogram("http_connection_handshake_seconds", buckets=HANDSHAKE_BUCKETS).observe(
+        time.perf_counter() - context.connection_start
+    )
+    metrics.counter("http_connections_created_total").inc()
+    _update_reuse_ratio()
+
+
+async def _on_connection_reused(session, context: SimpleNamespace, params) -> None:
+    metrics.counter("http_connections_reused_total").inc()
+    _update_reuse_ratio()
+
+
+async def _on_dns_cache_hit(session, context: SimpleNamespace, params) -> None:
+    metrics.counter("http_dns_cache_hits_total").inc()
+
+
+async def _on_dns_cache_miss(session, context: SimpleNamespace, params) -> None:
+    metrics.counter("http_dns_cache_misses_total").inc()
+
+
+def _update_reuse_ratio() -> None:
+    created = metrics.counter("http_connections_created_total").value
+    reused = metrics.counter("http_connections_reused_total").value
+    metrics.gauge("http_connection_reuse_ratio").set(reused / (created + reused))
+
+
+class SessionWarmer:
+    """Pre-warms the session shortly before a campaign becomes active,
+    so the first retweets of the window don't pay the connection setup."""
+
+    def __init__(
+        self,
+        stream: "FurStream",
+        session: TwitterSession,
+        interval: float = 30.0,
+    ) -> None:
+        self.stream = stream
+        self.session = session
+        self.interval = interval
+        self.active = False
+        self.task: asyncio.Task | None = None
+
+    async def start(self):
+        if self.task is None:
+            logger.info("Starting session warmer")
+            self.task = asyncio.create_task(self._run())
+
+    async def check(self, now: datetime | None = None) -> bool:
+        """Pre-warms when a campaign is about to open, returns whether it did."""
+        now = (now or datetime.now(timezone.utc)) + self.session.prewarm_lead
+        active = any(c.schedule.is_active(now) for c in self.stream.pipeline.campaigns)
+        opening, self.active = active and not self.active, active
+        if opening:
+            await self.session.prewarm()
+        return opening
+
+    async def _run(self):
+        while True:
+            try:
+                await self.check()
+            except Exception:
+                logger.exception("Exception while pre-warming the API session")
+            await asyncio.sleep(self.interval)
@@ -0,0 +1,138 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+from loguru import logger
+import tweepy.errors as tweepy_errors
+
+from furretweet.metrics import metrics
+from furretweet.models import STREAM_USER_FIELDS, User
+from furretweet.rate_limiter import RetweetLimitHandler
+from furretweet.resilience import CircuitBreaker, guarded
+
+LOOKUP_BATCH_SIZE = 100
+
+
+class UserCache:
+    """Least recently used cache of user profiles, entries expire after `ttl` seconds."""
+
+    def __init__(self, ttl: float = 3600, max_size: int = 50_000) -> None:
+        self.ttl = ttl
+        self.max_size = max_size
+        self._users: OrderedDict[int, tuple[float, User]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._users)
+
+    def get(self, user_id: int) -> User | None:
+        entry = self._users.get(user_id)
+        if entry is None:
+            return None
+        expires_at, user = entry
+        if expires_at < time.monotonic():
+            del self._users[user_id]
+            return None
+        self._users.move_to_end(user_id)
+        return user
+
+    def put(self, user: User) -> None:
+        self._users[user.id] = (time.monotonic() + self.ttl, user)
+        self._users.move_to_end(user.id)
+        while len(self._users) > self.max_size:
+            self._users.popitem(last=False)
+
+
+class UserHydrator:
+    """Resolves user ids to profiles, from `cache` when possible.
+
+    Missing ids requested within `batch_delay` seconds of each other are
+    looked up together in a single `get_users` call of up to 100 ids."""
+
+    def __init__(
+        self,
+        client,
+        cache: UserCache | None = None,
+        batch_delay: float = 0.3,
+        breaker: CircuitBreaker | None = None,
+    ) -> None:
+        self.client = client
+        self.breaker = breaker
+        self.cache = cache or UserCache()
+        self.batch_delay = batch_delay
+        self.rate_limit_handler = RetweetLimitHandler()
+        self._pending: dict[int, asyncio.Future[User | None]] = {}
+        self._flush_task: asyncio.Task | None = None
+
+    async def get_user(self, user_id: int) -> User | None:
+        user = self.cache.get(user_id)
+        if user is not None:
+            metrics.counter("user_cache_hits_total").inc()
+            return user
+        metrics.counter("user_cache_misses_total").inc()
+
+        future = self._pending.get(user_id)
+        if future is None:
+            future = self._pending[user_id] = asyncio.get_running_loop().create_future()
+            if len(self._pending) >= LOOKUP_BATCH_SIZE:
+                self._schedule_flush(delay=0)
+            else:
+                self._schedule_flush(delay=self.batch_delay)
+        return await asyncio.shield(future)
+
+    def _schedule_flush(self, delay: float):
+        if delay == 0 and self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_after(delay))
+
+    async def _flush_after(self, delay: float):
+        await asyncio.sleep(delay)
+        self._flush_task = None
+        await self.flush()
+
+    async def flush(self):
+        pending, self._pending = self._pending, {}
+        if not pending:
+            return
+
+        users: dict[int, User] = {}
+        try:
+            users = await self._lookup(list(pending))
+        except Exception:
+            logger.exception(f"Failed to look up {len(pending)} users")
+
+        for user_id, future in pending.items():
+            if not future.done():
+                future.set_result(users.get(user_id))
+
+    async def _lookup(self, ids: list[int]) -> dict[int, User]:
+        if self.rate_limit_handler.is_limit_exceeded():
+            logger.warning(
+                f"Users lookup rate limit reached, can't hydrate {len(ids)} users. "
+                f"Resets in {self.rate_limit_handler.seconds_until_reset}s"
+            )
+            return {}
+
+        try:
+            r = await guarded(
+                self.breaker,
+                self.client.get_users,
+                ids=ids,
+                user_fields=STREAM_USER_FIELDS,
+                user_auth=True,
+            )
+        except tweepy_errors.TooManyRequests as e:
+            self.rate_limit_handler.update_limits(e.response.headers)
+            raise
+
+        self.rate_limit_handler.update_limits(r.headers)
+        metrics.counter("user_lookups_total").inc()
+        json = await r.json()
+
+        users = {}
+        for data in json.get("data", []):
+            user = User.parse_obj(data)
+            self.cache.put(user)
+            users[user.id] = user
+        return users
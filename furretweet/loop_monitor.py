@@ -0,0 +1,91 @@
+import asyncio
+import sys
+import threading
+import time
+import traceback
+
+from loguru import logger
+
+from furretweet.metrics import metrics
+
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class LoopLagMonitor:
+    """Measures how late the event loop wakes up a sleeping task.
+
+    Anything running on the loop without yielding, like a heavy filter,
+    delays every other task by as much, this makes it visible. While the
+    loop is blocked for longer than `warn_threshold`, a watchdog thread logs
+    the task being run and the stack of the loop's thread, which tells what
+    is blocking it, something the lag measured afterwards can't."""
+
+    def __init__(
+        self, interval: float = 0.5, warn_threshold: float = 0.25, watchdog: bool = True
+    ) -> None:
+        self.interval = interval
+        self.warn_threshold = warn_threshold
+        self.watchdog = watchdog
+        self._task: asyncio.Task | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._loop_thread: int | None = None
+        self._heartbeat = time.monotonic()
+        self._stopped = threading.Event()
+        self._watchdog_thread: threading.Thread | None = None
+
+    async def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._loop = asyncio.get_running_loop()
+            self._loop_thread = threading.get_ident()
+            self._heartbeat = time.monotonic()
+            self._task = asyncio.create_task(self._run())
+        if self.watchdog and self._watchdog_thread is None:
+            self._stopped.clear()
+            self._watchdog_thread = threading.Thread(
+                target=self._watch, name="loop-watchdog", daemon=True
+            )
+            self._watchdog_thread.start()
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._watchdog_thread is not None:
+            self._stopped.set()
+            self._watchdog_thread.join()
+            self._watchdog_thread = None
+
+    async def _run(self) -> None:
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self._heartbeat = time.monotonic()
+            self.observe(time.perf_counter() - start - self.interval)
+
+    def observe(self, lag: float) -> None:
+        lag = max(lag, 0.0)
+        metrics.histogram("event_loop_lag_seconds", buckets=LAG_BUCKETS).observe(lag)
+        metrics.gauge("event_loop_lag_last_seconds").set(lag)
+        if lag >= self.warn_threshold:
+            logger.warning(f"Event loop was blocked for {lag:.3f}s")
+
+    def _watch(self) -> None:
+        reported = None
+        while not self._stopped.wait(self.warn_threshold / 2):
+            heartbeat = self._heartbeat
+            blocked = time.monotonic() - heartbeat - self.interval
+            # Once per blocking, the heartbeat moves on when the loop gets back
+            if blocked >= self.warn_threshold and heartbeat != reported:
+                reported = heartbeat
+                self.report_blocked(blocked)
+
+    def report_blocked(self, blocked: float) -> None:
+        metrics.counter("event_loop_blocked_total").inc()
+        frame = sys._current_frames().get(self._loop_thread)
+        stack = "".join(traceback.format_stack(frame)) if frame is not None else ""
+        task = asyncio.current_task(self._loop) if self._loop is not None else None
+        coroutine = task.get_coro() if task is not None else None
+        logger.warning(
+            f"Event loop blocked for more than {blocked:.3f}s "
+            f"running {coroutine!r}, loop thread stack:\n{stack}"
+        )
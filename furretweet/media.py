@@ -0,0 +1,235 @@
+import asyncio
+import io
+from concurrent.futures import Executor, ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+import aiohttp
+from loguru import logger
+from PIL import Image
+
+if TYPE_CHECKING:
+    from furretweet.database import MediaHashesRepository
+    from furretweet.models import Media, StreamResponse
+
+
+def dhash(data: bytes, hash_size: int = 8) -> int:
+    """Returns the difference hash of an image as a `hash_size ** 2` bits integer.
+
+    Each bit tells whether a pixel is darker than its right neighbour on a
+    grayscale thumbnail, so re-encoded, resized or slightly edited copies
+    of the same picture end up only a few bits apart."""
+    with Image.open(io.BytesIO(data)) as image:
+        thumbnail = image.convert("L").resize((hash_size + 1, hash_size), Image.LANCZOS)
+        pixels = thumbnail.tobytes()
+
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] < pixels[offset + col + 1])
+    return value
+
+
+@dataclass(frozen=True, slots=True)
+class HashEntry:
+    hash: int
+    media_key: str
+    tweet_id: str
+
+
+@dataclass(frozen=True, slots=True)
+class DuplicateMatch:
+    media_key: str
+    duplicate_of: HashEntry
+    distance: int
+
+
+class MultiIndexHashTable:
+    """In-memory index of 64 bits perceptual hashes for hamming distance lookups.
+
+    The hash is split into `max_distance + 1` chunks and each chunk is indexed
+    in its own table. Two hashes at most `max_distance` bits apart must share
+    at least one identical chunk, so a lookup only has to compare against the
+    few entries found in the matching buckets instead of the whole index."""
+
+    def __init__(self, max_distance: int = 4, bits: int = 64) -> None:
+        self.max_distance = max_distance
+        self.bits = bits
+
+        chunks = max_distance + 1
+        sizes = [bits // chunks + (1 if i < bits % chunks else 0) for i in range(chunks)]
+        self._chunks: list[tuple[int, int]] = []  # (shift, mask)
+        shift = bits
+        for size in sizes:
+            shift -= size
+            self._chunks.append((shift, (1 << size) - 1))
+
+        self._tables: list[dict[int, list[HashEntry]]] = [{} for _ in self._chunks]
+        self._entries: dict[str, HashEntry] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, media_key: str) -> HashEntry | None:
+        return self._entries.get(media_key)
+
+    def add(self, entry: HashEntry) -> None:
+        if entry.media_key in self._entries:
+            return
+        self._entries[entry.media_key] = entry
+        for table, (shift, mask) in zip(self._tables, self._chunks):
+            table.setdefault((entry.hash >> shift) & mask, []).append(entry)
+
+    def search(self, hash: int, max_distance: int | None = None) -> list[tuple[HashEntry, int]]:
+        """Returns the entries within `max_distance` bits of `hash`, closest first."""
+        if max_distance is None:
+            max_distance = self.max_distance
+        if max_distance > self.max_distance:
+            raise ValueError(f"The index only supports distances up to {self.max_distance}")
+
+        found: dict[str, tuple[HashEntry, int]] = {}
+        for table, (shift, mask) in zip(self._tables, self._chunks):
+            for entry in table.get((hash >> shift) & mask, ()):
+                if entry.media_key in found:
+                    continue
+                distance = (entry.hash ^ hash).bit_count()
+                if distance <= max_distance:
+                    found[entry.media_key] = (entry, distance)
+        return sorted(found.values(), key=lambda match: match[1])
+
+
+class MediaFetcher:
+    """Downloads media previews through a single pooled session,
+    with at most `max_concurrency` downloads in flight."""
+
+    def __init__(self, max_concurrency: int = 8, timeout: float = 10.0) -> None:
+        self.max_concurrency = max_concurrency
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.session: aiohttp.ClientSession | None = None
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_concurrency, ttl_dns_cache=300),
+                timeout=self.timeout,
+            )
+        return self.session
+
+    async def fetch(self, url: str) -> bytes:
+        async with self._semaphore:
+            async with self._get_session().get(url) as response:
+                response.raise_for_status()
+                return await response.read()
+
+    async def close(self) -> None:
+        if self.session is not None:
+            await self.session.close()
+
+
+class MediaDeduplicator:
+    """Finds media that was already seen in a previous tweet.
+
+    Previews are downloaded with `fetcher`, hashed in `executor` (a process
+    pool by default, hashing is CPU bound) and looked up in an in-memory
+    `MultiIndexHashTable` that is persisted to `repository`."""
+
+    def __init__(
+        self,
+        repository: "MediaHashesRepository",
+        fetcher: MediaFetcher | None = None,
+        executor: Executor | None = None,
+        max_distance: int = 4,
+    ) -> None:
+        self.repository = repository
+        self.fetcher = fetcher or MediaFetcher()
+        self.executor = executor
+        self.index = MultiIndexHashTable(max_distance=max_distance)
+        self.loaded = False
+
+    async def load(self) -> None:
+        async for document in self.repository.all():
+            self.index.add(
+                HashEntry(
+                    hash=int(document["hash"], 16),
+                    media_key=document["_id"],
+                    tweet_id=document["tweet_id"],
+                )
+            )
+        self.loaded = True
+        logger.info(f"Loaded {len(self.index)} media hashes")
+
+    def _get_executor(self) -> Executor:
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(max_workers=2)
+        return self.executor
+
+    @staticmethod
+    def preview_url(media: "Media") -> str | None:
+        if media.preview_image_url:
+            return media.preview_image_url
+        if media.url:
+            return f"{media.url}?name=small"
+        return None
+
+    async def _hash_media(self, media: "Media") -> int | None:
+        url = self.preview_url(media)
+        if url is None:
+            return None
+        try:
+            data = await self.fetcher.fetch(url)
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), dhash, data)
+        except Exception:
+            logger.exception(f"Failed to hash media {media.media_key} from {url}")
+            return None
+
+    async def fetch(self, response: "StreamResponse") -> None:
+        """Downloads and hashes the media of `response` that isn't indexed yet into
+        `response.media_hashes`. It doesn't touch the index, so unlike `check` it
+        can run concurrently with other tweets."""
+        medias = [
+            m
+            for m in response.includes.media
+            if m.media_key not in response.media_hashes and self.index.get(m.media_key) is None
+        ]
+        hashes = await asyncio.gather(*(self._hash_media(m) for m in medias))
+        response.media_hashes.update(zip((m.media_key for m in medias), hashes))
+
+    async def check(self, response: "StreamResponse", max_distance: int) -> list[DuplicateMatch]:
+        """Returns the media of `response` that is a near-duplicate of media
+        from another tweet, and adds the new hashes to the index."""
+        tweet_id = str(response.tweet.id)
+        matches = []
+        medias = []
+        for media in response.includes.media:
+            entry = self.index.get(media.media_key)
+            if entry is None:
+                medias.append(media)
+            elif entry.tweet_id != tweet_id:
+                # The very same upload attached to another tweet
+                matches.append(DuplicateMatch(media.media_key, entry, 0))
+
+        # Only media that wasn't fetched beforehand, like when the tweet is rechecked
+        await self.fetch(response)
+        for media in medias:
+            hash = response.media_hashes[media.media_key]
+            if hash is None:
+                continue
+
+            for entry, distance in self.index.search(hash, max_distance):
+                if entry.tweet_id != tweet_id:
+                    matches.append(DuplicateMatch(media.media_key, entry, distance))
+                    break
+
+            entry = HashEntry(hash=hash, media_key=media.media_key, tweet_id=tweet_id)
+            self.index.add(entry)
+            await self.repository.add(entry)
+
+        return matches
+
+    async def close(self) -> None:
+        await self.fetcher.close()
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,120 @@
+from bisect import bisect_left
+from typing import Iterable
+
+Labels = tuple[tuple[str, str], ...]
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Counter:
+    def __init__(self) -> None:
+        self.value = 0.0
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+    def snapshot(self) -> float:
+        return self.value
+
+
+class Gauge:
+    def __init__(self) -> None:
+        self.value = 0.0
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+    def dec(self, amount: float = 1) -> None:
+        self.value -= amount
+
+    def snapshot(self) -> float:
+        return self.value
+
+
+class Histogram:
+    """Cumulative histogram with fixed upper bounds, like Prometheus ones."""
+
+    def __init__(self, buckets: Iterable[float] = DEFAULT_BUCKETS) -> None:
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float:
+        """Returns the upper bound of the bucket holding the `q` quantile."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+    def snapshot(self) -> dict:
+        cumulative = 0
+        buckets = {}
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            buckets[str(bound)] = cumulative
+        buckets["+Inf"] = self.count
+        return {"count": self.count, "sum": self.sum, "buckets": buckets}
+
+
+class MetricsRegistry:
+    """In-process registry of counters, gauges and histograms.
+
+    Metrics are created on first use and identified by their name and labels,
+    reading or updating one is a dict lookup so it is cheap on the hot path."""
+
+    def __init__(self) -> None:
+        self._metrics: dict[str, dict[Labels, Counter | Gauge | Histogram]] = {}
+
+    def _get(self, kind: type, name: str, labels: dict[str, str], **kwargs):
+        key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        family = self._metrics.setdefault(name, {})
+        metric = family.get(key)
+        if metric is None:
+            metric = family[key] = kind(**kwargs)
+        elif not isinstance(metric, kind):
+            raise TypeError(f"Metric {name} is a {type(metric).__name__}, not a {kind.__name__}")
+        return metric
+
+    def counter(self, name: str, **labels: str) -> Counter:
+        return self._get(Counter, name, labels)
+
+    def gauge(self, name: str, **labels: str) -> Gauge:
+        return self._get(Gauge, name, labels)
+
+    def histogram(
+        self, name: str, buckets: Iterable[float] = DEFAULT_BUCKETS, **labels: str
+    ) -> Histogram:
+        return self._get(Histogram, name, labels, buckets=buckets)
+
+    def family(self, name: str) -> dict[Labels, Counter | Gauge | Histogram]:
+        """The metrics of a name with every labels they were used with."""
+        return self._metrics.get(name, {})
+
+    def snapshot(self) -> dict[str, list[dict]]:
+        return {
+            name: [
+                {"labels": dict(labels), "value": metric.snapshot()}
+                for labels, metric in family.items()
+            ]
+            for name, family in self._metrics.items()
+        }
+
+    def clear(self) -> None:
+        self._metrics.clear()
+
+
+metrics = MetricsRegistry()
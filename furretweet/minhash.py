@@ -0,0 +1,132 @@
+import re
+import time
+from array import array
+from collections import deque
+from dataclasses import dataclass
+from hashlib import shake_128
+
+_NOISE_PATTERN = re.compile(r"https?://\S+|[#@]\w+")
+_SPACES_PATTERN = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """Lowercases the text and removes links, hashtags and mentions,
+    which spam waves usually vary between copies."""
+    text = _NOISE_PATTERN.sub(" ", text.lower())
+    return _SPACES_PATTERN.sub(" ", text).strip()
+
+
+class MinHasher:
+    """Computes MinHash signatures of character shingles. The fraction of equal
+    values between two signatures estimates the Jaccard similarity of the texts.
+
+    Instead of applying `num_perm` hash functions to every shingle in Python,
+    each shingle is hashed once with an extendable output function whose
+    output is read as `num_perm` independent 32 bits hashes."""
+
+    def __init__(self, num_perm: int = 64, shingle_size: int = 5, seed: int = 1) -> None:
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self._salt = seed.to_bytes(8, "little")
+        self._digest_size = num_perm * 4
+
+    def shingles(self, text: str) -> set[str]:
+        size = self.shingle_size
+        if len(text) <= size:
+            return {text}
+        return {text[i : i + size] for i in range(len(text) - size + 1)}
+
+    def signature(self, text: str) -> array:
+        hashes = [
+            array("I", shake_128(self._salt + shingle.encode()).digest(self._digest_size))
+            for shingle in self.shingles(text)
+        ]
+        # An array of 32 bits values is 8 times smaller than a tuple of ints
+        return array("I", map(min, zip(*hashes)))
+
+
+def similarity(a: array, b: array) -> float:
+    return sum(x == y for x, y in zip(a, b)) / len(a)
+
+
+@dataclass(frozen=True, slots=True)
+class LSHEntry:
+    key: str
+    author_id: str
+    signature: array
+    inserted_at: float
+
+
+class LSHIndex:
+    """Locality sensitive hashing index of MinHash signatures over a sliding window.
+
+    Signatures are split in `bands` bands, two signatures sharing any band are
+    candidates. Entries older than `window` seconds, or beyond `max_entries`,
+    are evicted in insertion order so memory stays bounded."""
+
+    def __init__(
+        self,
+        num_perm: int = 64,
+        bands: int = 16,
+        window: float = 3600.0,
+        max_entries: int = 100_000,
+    ) -> None:
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.window = window
+        self.max_entries = max_entries
+
+        self._buckets: list[dict[int, set[str]]] = [{} for _ in range(bands)]
+        self._entries: dict[str, LSHEntry] = {}
+        self._order: deque[LSHEntry] = deque()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._entries
+
+    def _band_hashes(self, signature: array) -> list[int]:
+        data = signature.tobytes()
+        size = self.rows * signature.itemsize
+        return [hash(data[i * size : (i + 1) * size]) for i in range(self.bands)]
+
+    def insert(self, entry: LSHEntry) -> None:
+        if entry.key in self._entries:
+            return
+        while len(self._order) >= self.max_entries:
+            self._remove(self._order.popleft())
+        self._entries[entry.key] = entry
+        self._order.append(entry)
+        for buckets, band_hash in zip(self._buckets, self._band_hashes(entry.signature)):
+            buckets.setdefault(band_hash, set()).add(entry.key)
+
+    def _remove(self, entry: LSHEntry) -> None:
+        del self._entries[entry.key]
+        for buckets, band_hash in zip(self._buckets, self._band_hashes(entry.signature)):
+            bucket = buckets[band_hash]
+            bucket.discard(entry.key)
+            if not bucket:
+                del buckets[band_hash]
+
+    def evict(self, now: float | None = None) -> int:
+        """Removes the expired entries, returns how many were removed."""
+        if now is None:
+            now = time.monotonic()
+        oldest_allowed = now - self.window
+        evicted = 0
+        while self._order and self._order[0].inserted_at < oldest_allowed:
+            self._remove(self._order.popleft())
+            evicted += 1
+        return evicted
+
+    def query(self, signature: array, threshold: float) -> list[LSHEntry]:
+        """Returns the entries with an estimated similarity of at least `threshold`."""
+        candidates: set[str] = set()
+        for buckets, band_hash in zip(self._buckets, self._band_hashes(signature)):
+            candidates.update(buckets.get(band_hash, ()))
+
+        entries = (self._entries[key] for key in candidates)
+        return [e for e in entries if similarity(signature, e.signature) >= threshold]
@@ -1,12 +1,27 @@
+import asyncio
+import re
+from dataclasses import dataclass
 import tweepy.asynchronous as tweepy
 from pydantic import BaseModel
-from datetime import datetime
+from datetime import datetime, timedelta
 from loguru import logger
 from typing import TYPE_CHECKING
 from aiohttp import ClientResponse
 
+from furretweet.normalize import fold_text
+
 if TYPE_CHECKING:
     from furretweet.filters import Filter, BaseFilter
+    from furretweet.offload import FilterOffloader
+    from furretweet.pipeline import Campaign
+
+# Fields requested for every tweet, so the models below can always be parsed.
+STREAM_EXPANSIONS = "author_id,attachments.media_keys"
+STREAM_TWEET_FIELDS = "author_id,created_at,entities,public_metrics,possibly_sensitive"
+STREAM_USER_FIELDS = "created_at,public_metrics,username,verified,verified_type"
+STREAM_MEDIA_FIELDS = "url,preview_image_url"
+
+_TCO_LINK_PATTERN = re.compile(r"https?://t\.co/\w+")
 
 
 class PublicMetricsUser(BaseModel):
@@ -29,6 +44,8 @@ class User(BaseModel):
 class Media(BaseModel):
     media_key: str
     type: str
+    url: str | None
+    preview_image_url: str | None
 
 
 class PublicMetrics(BaseModel):
@@ -40,8 +57,8 @@ class PublicMetrics(BaseModel):
 
 
 class Includes(BaseModel):
-    users: list[User]
-    media: list[Media]
+    users: list[User] = []
+    media: list[Media] = []
 
 
 class Tweet(BaseModel):
@@ -57,6 +74,74 @@ class Tweet(BaseModel):
     possibly_sensitive: bool | None
 
 
+@dataclass(frozen=True, slots=True)
+class TweetFeatures:
+    """Values derived from a tweet that several filters read, extracted once per tweet."""
+
+    text_lower: str
+    # Folded for banned terms matching, see `fold_text`
+    text_folded: str
+    # Lowercased, without the t.co links Twitter appends for media
+    text_without_links: str
+    new_lines_count: int
+    hashtags: tuple[str, ...]
+    media_types: tuple[str, ...]
+    author_created_at: datetime
+
+    @property
+    def hashtags_count(self) -> int:
+        return len(self.hashtags)
+
+    def author_age(self, now: datetime) -> timedelta:
+        """How old the author's account was at `now`."""
+        return now - self.author_created_at
+
+    @classmethod
+    def extract(cls, tweet: Tweet, includes: Includes) -> "TweetFeatures":
+        text_lower = tweet.text.lower()
+        entities = tweet.entities or {}
+        author = next((u for u in includes.users if u.id == tweet.author_id), includes.users[0])
+        return cls(
+            text_lower=text_lower,
+            text_folded=fold_text(tweet.text),
+            text_without_links=_TCO_LINK_PATTERN.sub("", text_lower),
+            new_lines_count=tweet.text.count("\n"),
+            hashtags=tuple(h.get("tag", "") for h in entities.get("hashtags") or ()),
+            media_types=tuple(m.type for m in includes.media),
+            author_created_at=author.created_at,
+        )
+
+
+@dataclass(frozen=True, slots=True)
+class TweetSnapshot:
+    """The fields filters read, in a compact form cheap to pickle to worker processes."""
+
+    tweet_id: int
+    text: str
+    text_folded: str
+    author_id: int
+    followers_count: int
+    author_created_at: datetime
+    hashtags: tuple[str, ...]
+    media_keys: tuple[str, ...]
+    possibly_sensitive: bool
+
+    @classmethod
+    def from_response(cls, response: "StreamResponse") -> "TweetSnapshot":
+        features = response.features
+        return cls(
+            tweet_id=response.tweet.id,
+            text=response.tweet.text,
+            text_folded=features.text_folded,
+            author_id=response.author.id,
+            followers_count=response.author.public_metrics.followers_count,
+            author_created_at=features.author_created_at,
+            hashtags=features.hashtags,
+            media_keys=tuple(m.media_key for m in response.includes.media),
+            possibly_sensitive=bool(response.tweet.possibly_sensitive),
+        )
+
+
 class StreamResponse:
     def __init__(
         self, *, client: tweepy.AsyncClient, tweet: Tweet, includes: Includes, errors: list[dict]
@@ -65,23 +150,66 @@ class StreamResponse:
         self.tweet = tweet
         self.includes = includes
         self.errors = errors
+        self.campaign: Campaign | None = None
+        self.filters: list[BaseFilter] = []
         self.failed_filters: list[BaseFilter] = []
         self.limit_reached = False
+        # Seconds spent in each processing stage, see `StageTimings`
+        self.timings: dict[str, float] = {}
+        # Media hashes by media key, None if it couldn't be downloaded, see `MediaDeduplicator`
+        self.media_hashes: dict[str, int | None] = {}
+        self._features: TweetFeatures | None = None
+        self._features_source: tuple = ()
+
+    @property
+    def features(self) -> TweetFeatures:
+        text = self.tweet.text
+        hashtags = (self.tweet.entities or {}).get("hashtags")
+        media = self.includes.media
+        author_created_at = self.author.created_at
+        # Identity checks, so features are extracted again if the tweet is edited in place
+        if (
+            self._features is None
+            or self._features_source[0] is not text
+            or self._features_source[1] is not hashtags
+            or self._features_source[2] is not media
+            or self._features_source[3] is not author_created_at
+        ):
+            self._features = TweetFeatures.extract(self.tweet, self.includes)
+            self._features_source = (text, hashtags, media, author_created_at)
+        return self._features
+
+    async def fetch_filters(self, filters: list["Filter"]) -> None:
+        # One after the other, so filters can reuse what the previous ones fetched
+        for f in filters:
+            await f.fetch(self)
+
+    async def prepare_filters(
+        self, filters: list["Filter"], offloader: "FilterOffloader | None" = None
+    ) -> None:
+        await asyncio.gather(*(f.prepare(self) for f in filters))
+        if offloader is not None:
+            await offloader.run([f for f in filters if f.cpu_bound], self)
 
     def process_filters(self, filters: list["Filter"]) -> list["Filter"]:
         failed_filters = []
         for f in filters:
             if not f.filter(self):
                 failed_filters.append(f)
+        self.filters = filters
         self.failed_filters = failed_filters
         return failed_filters
 
     @property
     def author(self) -> User:
+        # Hydrated or lookup includes may hold other users than the author
+        for user in self.includes.users:
+            if user.id == self.tweet.author_id:
+                return user
         return self.includes.users[0]
 
-    async def retweet(self) -> ClientResponse:
-        return await self.client.retweet(self.tweet.id)  # type: ignore
+    async def retweet(self, client: tweepy.AsyncClient | None = None) -> ClientResponse:
+        return await (client or self.client).retweet(self.tweet.id)  # type: ignore
 
     @property
     def url(self) -> str:
@@ -0,0 +1,141 @@
+import re
+import unicodedata
+from dataclasses import dataclass
+from functools import lru_cache
+
+# Removed before matching, they are invisible and only split words
+ZERO_WIDTH = "\u00ad\u180e\u200b\u200c\u200d\u2060\ufeff"
+
+# Letters drawn the same as a latin one, lowercase as they are folded after casefold
+HOMOGLYPHS = {
+    # Cyrillic
+    "а": "a",
+    "в": "b",
+    "е": "e",
+    "ё": "e",
+    "һ": "h",
+    "н": "h",
+    "і": "i",
+    "ї": "i",
+    "ј": "j",
+    "к": "k",
+    "м": "m",
+    "о": "o",
+    "р": "p",
+    "ԛ": "q",
+    "ѕ": "s",
+    "с": "c",
+    "т": "t",
+    "у": "y",
+    "ԝ": "w",
+    "х": "x",
+    "ԁ": "d",
+    # Greek
+    "α": "a",
+    "β": "b",
+    "ε": "e",
+    "η": "n",
+    "ι": "i",
+    "κ": "k",
+    "ν": "v",
+    "ο": "o",
+    "ρ": "p",
+    "τ": "t",
+    "υ": "u",
+    "χ": "x",
+}
+
+LEETSPEAK = {
+    "0": "o",
+    "1": "i",
+    "3": "e",
+    "4": "a",
+    "5": "s",
+    "7": "t",
+}
+
+_WORD_PATTERN = re.compile(r"\w+")
+
+_ASCII_TABLE = str.maketrans(LEETSPEAK)
+_TABLE = str.maketrans({**LEETSPEAK, **HOMOGLYPHS, **dict.fromkeys(ZERO_WIDTH)})
+
+
+def fold_text(text: str) -> str:
+    """Folds a text to the form banned terms are matched against.
+
+    NFKC turns fullwidth, circled or mathematical letters back into plain
+    ones, then look-alike letters, leetspeak digits and zero-width characters
+    are folded with a single translation table, and runs of whitespace
+    collapsed. Only meant for matching, the result is not something to display."""
+    if text.isascii():
+        text = text.lower().translate(_ASCII_TABLE)
+    else:
+        text = unicodedata.normalize("NFKC", text).casefold().translate(_TABLE)
+    return " ".join(text.split())
+
+
+@dataclass(frozen=True)
+class TermIndex:
+    """Banned terms compiled once, so a tweet is checked without scanning it per term.
+
+    Terms match anywhere in the text, like "nft" in "#NFTs" or "porn" in
+    "furryporn". Word terms are the ones that keep matching inside unrelated
+    words, they only match whole words, so "monk" doesn't match "monkey":
+    single words are looked up in the set of the text's words, phrases are
+    found with `in` then their boundaries checked."""
+
+    words: frozenset[str]
+    phrases: tuple[tuple[str, re.Pattern], ...]
+    substrings: tuple[str, ...]
+    # Folded term to the term as it was configured, in the configured order
+    terms: dict[str, str]
+
+    @classmethod
+    @lru_cache(maxsize=32)
+    def compile(cls, terms: tuple[str, ...], word_terms: tuple[str, ...] = ()) -> "TermIndex":
+        configured: dict[str, str] = {}
+        words = set()
+        phrases = []
+        substrings = []
+        # A term in both lists is a word one, `terms` can keep every banned term
+        word_folded = {fold_text(term) for term in word_terms}
+        for term in terms + word_terms:
+            folded = fold_text(term)
+            if not folded or folded in configured:
+                continue
+            configured[folded] = term
+            if folded not in word_folded:
+                substrings.append(folded)
+            elif _WORD_PATTERN.fullmatch(folded):
+                words.add(folded)
+            else:
+                # Boundaries only where the term starts or ends with a letter,
+                # an emoji is matched even if glued to a word
+                pattern = re.escape(folded)
+                if re.match(r"\w", folded):
+                    pattern = r"(?<!\w)" + pattern
+                if re.search(r"\w$", folded):
+                    pattern += r"(?!\w)"
+                phrases.append((folded, re.compile(pattern)))
+
+        return cls(
+            words=frozenset(words),
+            phrases=tuple(phrases),
+            substrings=tuple(substrings),
+            terms=configured,
+        )
+
+    def find(self, folded_text: str) -> list[str]:
+        """The configured terms found in an already folded text, in the configured order."""
+        found = {term for term in self.substrings if term in folded_text}
+        # Splitting the text into words is only worth it once a word term is in there
+        if any(word in folded_text for word in self.words):
+            found.update(self.words.intersection(_WORD_PATTERN.findall(folded_text)))
+        found.update(
+            phrase
+            for phrase, pattern in self.phrases
+            if phrase in folded_text and pattern.search(folded_text)
+        )
+        if not found:
+            return []
+        return [term for folded, term in self.terms.items() if folded in found]
@@ -0,0 +1,84 @@
+import asyncio
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+
+from loguru import logger
+
+from furretweet.filters import BaseFilter, FilterResult
+from furretweet.metrics import metrics
+from furretweet.models import StreamResponse, TweetSnapshot
+
+OFFLOAD_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+
+def _check(f: BaseFilter, snapshot: TweetSnapshot) -> FilterResult:
+    return f.check(snapshot)
+
+
+class FilterOffloader:
+    """Runs the `check` of cpu bound filters in a worker pool so heavy filters
+    don't stall the stream reading and keep-alive handling.
+
+    Each filter is sent with a snapshot of the tweet, its result is stored on
+    the filter and picked up by `filter`. A filter whose worker fails or takes
+    longer than `timeout` gets its `offload_fallback` decision instead."""
+
+    def __init__(
+        self,
+        kind: str = "process",
+        max_workers: int = 2,
+        timeout: float = 1.0,
+        executor: Executor | None = None,
+    ) -> None:
+        if kind not in ("process", "thread"):
+            raise ValueError(f"Unknown executor kind: {kind}")
+        self.kind = kind
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self._executor = executor
+
+    @property
+    def executor(self) -> Executor:
+        if self._executor is None:
+            executor_class = ProcessPoolExecutor if self.kind == "process" else ThreadPoolExecutor
+            self._executor = executor_class(max_workers=self.max_workers)
+        return self._executor
+
+    async def run(self, filters: list[BaseFilter], response: StreamResponse) -> None:
+        if not filters:
+            return
+        snapshot = TweetSnapshot.from_response(response)
+        results = await asyncio.gather(*(self._run_one(f, snapshot) for f in filters))
+        for f, result in zip(filters, results):
+            f.offloaded = (snapshot.tweet_id, result)
+
+    async def _run_one(self, f: BaseFilter, snapshot: TweetSnapshot) -> FilterResult:
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        try:
+            result = await asyncio.wait_for(
+                loop.run_in_executor(self.executor, _check, f, snapshot), self.timeout
+            )
+        except asyncio.TimeoutError:
+            metrics.counter("offload_timeouts_total", filter=f.name).inc()
+            logger.warning(
+                f"{f.name} timed out after {self.timeout}s on tweet {snapshot.tweet_id}"
+            )
+            return self._fallback(f)
+        except Exception:
+            metrics.counter("offload_errors_total", filter=f.name).inc()
+            logger.exception(f"{f.name} failed in a worker on tweet {snapshot.tweet_id}")
+            return self._fallback(f)
+
+        metrics.histogram("offload_seconds", buckets=OFFLOAD_BUCKETS, filter=f.name).observe(
+            time.perf_counter() - start
+        )
+        return result
+
+    def _fallback(self, f: BaseFilter) -> FilterResult:
+        return FilterResult(passed=f.offload_fallback, details={"offload_fallback": True})
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,349 @@
+import asyncio
+import inspect
+import os
+import tomllib
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Awaitable, Callable, TYPE_CHECKING
+
+from loguru import logger
+from pydantic import BaseModel, Extra, ValidationError
+from tweepy import StreamRule
+
+import furretweet.filters as filters
+from furretweet.campaigns import CampaignSchedule
+
+if TYPE_CHECKING:
+    from furretweet.stream import FurStream
+
+
+class PipelineConfigError(Exception):
+    pass
+
+
+class FilterSpec(BaseModel):
+    """A filter declaration, `type` is the filter class name and
+    every other key is passed to its constructor, except `offload`
+    and `offload_fallback` which override the filter's offloading."""
+
+    type: str
+
+    class Config:
+        extra = Extra.allow
+
+    @property
+    def params(self) -> dict[str, Any]:
+        return self.dict(exclude={"type"})
+
+
+class StreamRuleSpec(BaseModel):
+    value: str
+    tag: str | None = None
+
+
+class SelectionSpec(BaseModel):
+    # How long candidates wait to be compared, 0 retweets them right away.
+    window_seconds: float = 0
+    # Candidates not selected after this long are given up.
+    max_wait_seconds: float = 60
+    max_pending: int = 1000
+    followers_weight: float = 1.0
+    engagement_weight: float = 1.0
+    account_age_weight: float = 0.5
+    recent_author_penalty: float = 3.0
+    recent_author_half_life_hours: float = 6.0
+
+
+class RecheckSpec(BaseModel):
+    # Tweets failing only these filters are looked up again later with fresh
+    # metrics, and retweeted if they got popular. Empty disables the re-check.
+    soft_filters: list[str] = []
+    min_engagement: int = 20
+    delay_seconds: float = 300
+    interval_seconds: float = 60
+    max_pending: int = 5000
+    max_requests_per_run: int = 5
+
+
+class ScheduleSpec(BaseModel):
+    # Active on these days (0 is Monday) as long as it is one of them
+    # somewhere in the world. Empty means every day.
+    weekdays: list[int] = [4]
+    # Optional absolute bounds, for events like conventions.
+    start: datetime | None = None
+    end: datetime | None = None
+
+
+class CampaignSpec(BaseModel):
+    name: str
+    # A tweet must contain one of these (case-insensitive) to be processed.
+    required_terms: list[str] = ["#fursuitfriday", "@furretweet"]
+    # Tweets are routed to the campaign owning the tag of the rule they matched.
+    stream_rules: list[StreamRuleSpec] = [
+        StreamRuleSpec(
+            value="(#FursuitFriday OR @FurRetweet) has:media -is:retweet -is:reply -is:nullcast",
+            tag="FurretweetRules",
+        )
+    ]
+    default_filters: list[FilterSpec] = [
+        FilterSpec(type="BannedTermsFilter"),
+        FilterSpec(type="MinimumFollowersFilter", min_followers=100),
+        FilterSpec(type="NsfwFilter"),
+        FilterSpec(type="MinimumAccountAgeFilter", min_days=30),
+        FilterSpec(type="MediaFilter"),
+        FilterSpec(type="MaximumHashtagsFilter", max=5),
+        FilterSpec(type="MaximumNewLinesFilter", max=10),
+        FilterSpec(type="FursuitFridayOnlyFilter"),
+    ]
+    whitelist_filters: list[FilterSpec] = [
+        FilterSpec(type="NsfwFilter"),
+        FilterSpec(type="MediaFilter"),
+    ]
+    schedule: ScheduleSpec = ScheduleSpec()
+    # At most `max_retweets` retweets every `budget_period_hours`, no limit when unset.
+    max_retweets: int | None = None
+    budget_period_hours: float = 24
+
+
+class PipelineSpec(CampaignSpec):
+    """The top-level settings are the default campaign, which also gets
+    the tweets that didn't match the rules of any other campaign."""
+
+    name: str = "default"
+    campaigns: list[CampaignSpec] = []
+    selection: SelectionSpec = SelectionSpec()
+    recheck: RecheckSpec = RecheckSpec()
+
+
+@dataclass(frozen=True, eq=False)
+class Campaign:
+    name: str
+    spec: CampaignSpec
+    required_terms: list[str]
+    default_filters: list[filters.BaseFilter]
+    whitelist_filters: list[filters.BaseFilter]
+    stream_rules: list[StreamRule]
+    schedule: CampaignSchedule
+
+    def matches(self, text: str) -> bool:
+        text = text.lower()
+        return any(term in text for term in self.required_terms)
+
+
+@dataclass(frozen=True)
+class FilterPipeline:
+    """A compiled `PipelineSpec`. It is never mutated, a new
+    pipeline is built and swapped in when the config changes."""
+
+    spec: PipelineSpec
+    campaigns: list[Campaign]
+    routes: dict[str, Campaign]
+    stream_rules: list[StreamRule]
+
+    @property
+    def default_campaign(self) -> Campaign:
+        return self.campaigns[0]
+
+    @property
+    def required_terms(self) -> list[str]:
+        return self.default_campaign.required_terms
+
+    @property
+    def default_filters(self) -> list[filters.BaseFilter]:
+        return self.default_campaign.default_filters
+
+    @property
+    def whitelist_filters(self) -> list[filters.BaseFilter]:
+        return self.default_campaign.whitelist_filters
+
+    def route(self, tags: list[str]) -> list[Campaign]:
+        """Returns the campaigns owning `tags`, or the default one if there is none."""
+        campaigns = []
+        for tag in tags:
+            campaign = self.routes.get(tag)
+            if campaign is not None and campaign not in campaigns:
+                campaigns.append(campaign)
+        return campaigns or [self.default_campaign]
+
+
+def build_filter(spec: FilterSpec) -> filters.BaseFilter:
+    filter_class = getattr(filters, spec.type, None)
+    if (
+        not isinstance(filter_class, type)
+        or not issubclass(filter_class, filters.BaseFilter)
+        or inspect.isabstract(filter_class)
+    ):
+        raise PipelineConfigError(f"Unknown filter type: {spec.type}")
+
+    params = spec.params
+    offload = params.pop("offload", None)
+    offload_fallback = params.pop("offload_fallback", None)
+    if offload and filter_class.check is filters.BaseFilter.check:
+        raise PipelineConfigError(f"{spec.type} can't be offloaded, it doesn't implement check")
+
+    try:
+        f = filter_class(**params)
+    except TypeError as e:
+        raise PipelineConfigError(f"Invalid parameters for {spec.type}: {e}") from e
+
+    if offload is not None:
+        f.cpu_bound = offload
+    if offload_fallback is not None:
+        f.offload_fallback = offload_fallback
+    return f
+
+
+def compile_campaign(spec: CampaignSpec) -> Campaign:
+    return Campaign(
+        name=spec.name,
+        spec=spec,
+        required_terms=[term.lower() for term in spec.required_terms],
+        default_filters=[build_filter(f) for f in spec.default_filters],
+        whitelist_filters=[build_filter(f) for f in spec.whitelist_filters],
+        stream_rules=[StreamRule(value=r.value, tag=r.tag) for r in spec.stream_rules],
+        schedule=CampaignSchedule(
+            weekdays=spec.schedule.weekdays, start=spec.schedule.start, end=spec.schedule.end
+        ),
+    )
+
+
+def compile_pipeline(spec: PipelineSpec) -> FilterPipeline:
+    campaigns = [compile_campaign(spec)] + [compile_campaign(c) for c in spec.campaigns]
+
+    names = [c.name for c in campaigns]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        raise PipelineConfigError(f"Duplicate campaign names: {duplicates}")
+
+    routes: dict[str, Campaign] = {}
+    for campaign in campaigns:
+        for rule in campaign.stream_rules:
+            if rule.tag is None:
+                if campaign is campaigns[0]:
+                    continue
+                raise PipelineConfigError(
+                    f"Stream rule {rule.value!r} of campaign {campaign.name} has no tag"
+                )
+            if routes.get(rule.tag, campaign) is not campaign:
+                raise PipelineConfigError(
+                    f"Stream rule tag {rule.tag} is used by campaigns "
+                    f"{routes[rule.tag].name} and {campaign.name}"
+                )
+            routes[rule.tag] = campaign
+
+    return FilterPipeline(
+        spec=spec,
+        campaigns=campaigns,
+        routes=routes,
+        stream_rules=[rule for campaign in campaigns for rule in campaign.stream_rules],
+    )
+
+
+def load_pipeline(path: str) -> FilterPipeline:
+    try:
+        with open(path, "rb") as f:
+            raw = tomllib.load(f)
+        return compile_pipeline(PipelineSpec.parse_obj(raw))
+    except (tomllib.TOMLDecodeError, ValidationError) as e:
+        raise PipelineConfigError(f"Invalid pipeline config {path}: {e}") from e
+
+
+async def sync_stream_rules(stream: "FurStream", rules: list[StreamRule]) -> None:
+    """Makes the stream rules match `rules` by only adding the missing
+    rules and deleting the stale ones, so the connection is kept open.
+    Rules Twitter refuses raise a `PipelineConfigError`, before any
+    stale rule is deleted."""
+    response = await stream.get_rules()
+    current: list[StreamRule] = response.data or []  # type: ignore
+
+    existing = {(r.value, r.tag) for r in current}
+    wanted = {(r.value, r.tag) for r in rules}
+
+    missing = [r for r in rules if (r.value, r.tag) not in existing]
+    stale_ids = [r.id for r in current if (r.value, r.tag) not in wanted]
+
+    # Add before deleting so there is no moment without any matching rule.
+    if missing:
+        logger.info(f"Adding stream rules: {missing}")
+        response = await stream.add_rules(add=missing)
+        # Invalid rules are reported in the response, not raised
+        if response.errors:
+            raise PipelineConfigError(f"Twitter refused stream rules: {response.errors}")
+    if stale_ids:
+        logger.info(f"Deleting stream rules: {stale_ids}")
+        response = await stream.delete_rules(stale_ids)
+        if response.errors:
+            # They are deleted again on the next sync
+            logger.warning(f"Failed to delete stream rules: {response.errors}")
+    if not missing and not stale_ids:
+        logger.info("Stream rules already up to date")
+
+
+class PipelineWatcher:
+    """Polls the pipeline config file and calls `on_reload` with the
+    newly compiled pipeline whenever it changes. An invalid config,
+    stream rules included, is logged and ignored, leaving the current
+    pipeline in place. A reload failing for another reason, like Twitter
+    or Mongo being unavailable, is tried again on the next check."""
+
+    def __init__(
+        self,
+        path: str,
+        on_reload: Callable[[FilterPipeline], Awaitable[None]],
+        interval: float = 5.0,
+    ) -> None:
+        self.path = path
+        self.on_reload = on_reload
+        self.interval = interval
+        self.task: asyncio.Task | None = None
+        self._last_stat: tuple[int, int] | None = self._stat()
+
+    def _stat(self) -> tuple[int, int] | None:
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    async def start(self):
+        if self.task is None:
+            logger.info(f"Watching pipeline config {self.path}")
+            self.task = asyncio.create_task(self._watch())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    async def check(self) -> bool:
+        """Reloads the pipeline if the file changed, returns whether it was reloaded."""
+        stat = self._stat()
+        if stat is None or stat == self._last_stat:
+            return False
+
+        try:
+            pipeline = load_pipeline(self.path)
+        except (OSError, PipelineConfigError):
+            return self._invalid(stat)
+
+        logger.info(f"Pipeline config {self.path} changed, reloading")
+        try:
+            await self.on_reload(pipeline)
+        except PipelineConfigError:
+            return self._invalid(stat)
+        self._last_stat = stat
+        return True
+
+    def _invalid(self, stat: tuple[int, int]) -> bool:
+        # Not tried again until the file changes
+        self._last_stat = stat
+        logger.exception(f"Failed to reload pipeline config {self.path}, keeping current one")
+        return False
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.check()
+            except Exception:
+                logger.exception("Exception in pipeline watcher")
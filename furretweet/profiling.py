@@ -0,0 +1,250 @@
+import asyncio
+import cProfile
+import hmac
+import os
+import signal
+import sys
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime, timezone
+from pathlib import Path
+
+from aiohttp import web
+from loguru import logger
+
+from furretweet.metrics import metrics
+
+PROFILE_MODES = ("sample", "cprofile")
+
+
+class ProfilerBusy(Exception):
+    pass
+
+
+class StageClock:
+    """Adds the time elapsed since the previous lap to a stage of `timings`."""
+
+    __slots__ = ("timings", "_last")
+
+    def __init__(self, timings: dict[str, float]) -> None:
+        self.timings = timings
+        self._last = time.perf_counter()
+
+    def __call__(self, stage: str) -> None:
+        now = time.perf_counter()
+        self.timings[stage] = self.timings.get(stage, 0.0) + now - self._last
+        self._last = now
+
+
+class StageTimings:
+    """Time spent in each processing stage by the last `maxlen` tweets."""
+
+    def __init__(self, maxlen: int = 1000) -> None:
+        self._timings: deque[dict[str, float]] = deque(maxlen=maxlen)
+
+    def __len__(self) -> int:
+        return len(self._timings)
+
+    def record(self, timings: dict[str, float]) -> None:
+        self._timings.append(timings)
+
+    def table(self) -> list[dict]:
+        """One row per stage, in the order they run, times in milliseconds."""
+        samples: dict[str, list[float]] = {}
+        for timings in self._timings:
+            for stage, seconds in timings.items():
+                samples.setdefault(stage, []).append(seconds * 1000)
+
+        rows = []
+        for stage, values in samples.items():
+            values.sort()
+            rows.append(
+                {
+                    "stage": stage,
+                    "count": len(values),
+                    "mean_ms": round(sum(values) / len(values), 3),
+                    "p50_ms": round(values[len(values) // 2], 3),
+                    "p95_ms": round(values[min(int(len(values) * 0.95), len(values) - 1)], 3),
+                    "max_ms": round(values[-1], 3),
+                }
+            )
+        return rows
+
+    def format(self) -> str:
+        rows = self.table()
+        if not rows:
+            return "No tweets processed yet"
+        header = f"{'stage':<16}{'count':>7}{'mean':>10}{'p50':>10}{'p95':>10}{'max':>10}"
+        lines = [f"Last {len(self)} tweets, in ms", header]
+        for row in rows:
+            lines.append(
+                f"{row['stage']:<16}{row['count']:>7}{row['mean_ms']:>10.2f}"
+                f"{row['p50_ms']:>10.2f}{row['p95_ms']:>10.2f}{row['max_ms']:>10.2f}"
+            )
+        return "\n".join(lines)
+
+
+class StackSampler:
+    """Samples the stack of a thread every `interval` seconds from another
+    thread, counting stacks in the folded format flamegraph.pl, speedscope
+    and inferno read: `outer;inner;innermost count` per line."""
+
+    def __init__(self, thread_id: int, interval: float = 0.005) -> None:
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter[tuple[str, ...]] = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(
+                    f"{code.co_qualname} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+                )
+                frame = frame.f_back
+            if stack:
+                self.stacks[tuple(reversed(stack))] += 1
+
+    def folded(self) -> str:
+        return "".join(f"{';'.join(stack)} {count}\n" for stack, count in self.stacks.items())
+
+
+class Profiler:
+    """Profiles the event loop of the running bot for a few seconds on demand.
+
+    Nothing runs between sessions. A `sample` session samples the loop
+    thread's stack from another thread and writes folded stacks, ready for
+    a flamegraph, a `cprofile` session runs cProfile on the loop thread and
+    writes pstats, heavier but exact. A session is started by SIGUSR1, by
+    the admin HTTP endpoint or by the Telegram /profile command, one at a
+    time."""
+
+    def __init__(
+        self,
+        directory: str | Path,
+        stage_timings: StageTimings | None = None,
+        default_seconds: float = 30.0,
+        max_seconds: float = 300.0,
+        sample_interval: float = 0.005,
+    ) -> None:
+        self.directory = Path(directory)
+        self.stage_timings = stage_timings
+        self.default_seconds = default_seconds
+        self.max_seconds = max_seconds
+        self.sample_interval = sample_interval
+        self._token = ""
+        self._lock = asyncio.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._lock.locked()
+
+    async def run(self, seconds: float | None = None, mode: str = "sample") -> Path:
+        """Profiles for `seconds` and returns the path of the profile written."""
+        seconds = self.default_seconds if seconds is None else seconds
+        if not 0 < seconds <= self.max_seconds:
+            raise ValueError(f"A profile lasts between 0 and {self.max_seconds} seconds")
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"Unknown profile mode {mode}, expected one of {PROFILE_MODES}")
+        if self.running:
+            raise ProfilerBusy("A profile is already running")
+
+        async with self._lock:
+            logger.info(f"Profiling the bot for {seconds}s with {mode}")
+            timestamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
+            if mode == "sample":
+                path = self.directory / f"furretweet-{timestamp}.folded"
+                data = await self._sample(seconds)
+            else:
+                path = self.directory / f"furretweet-{timestamp}.pstats"
+                data = await self._cprofile(seconds)
+            await asyncio.to_thread(self._write, path, data)
+
+        metrics.counter("profiles_total", mode=mode).inc()
+        logger.info(f"Profile written to {path}")
+        return path
+
+    async def _sample(self, seconds: float) -> str:
+        sampler = StackSampler(threading.get_ident(), self.sample_interval)
+        sampler.start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            await asyncio.to_thread(sampler.stop)
+        return sampler.folded()
+
+    async def _cprofile(self, seconds: float) -> cProfile.Profile:
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            profile.disable()
+        return profile
+
+    def _write(self, path: Path, data: str | cProfile.Profile) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        if isinstance(data, str):
+            path.write_text(data)
+        else:
+            data.dump_stats(path)
+
+    def install_signal_handler(self, signum: int = signal.SIGUSR1) -> None:
+        """Starts a sample session of `default_seconds` on each `signum`."""
+        asyncio.get_running_loop().add_signal_handler(signum, self._on_signal)
+
+    def _on_signal(self) -> None:
+        if self.running:
+            return logger.warning("Ignoring the profile signal, a profile is already running")
+        task = asyncio.create_task(self.run())
+        task.add_done_callback(_log_failure)
+
+    def install(self, app: web.Application, token: str) -> None:
+        """Adds the admin routes, they take the token as a bearer token:
+
+        - `POST /admin/profile?seconds=30&mode=sample` profiles and
+          answers once done, with the path of the profile.
+        - `GET /admin/stages` is the stage timing table."""
+        self._token = token
+        app.router.add_post("/admin/profile", self._profile_endpoint)
+        app.router.add_get("/admin/stages", self._stages_endpoint)
+
+    def _authorized(self, request: web.Request) -> bool:
+        header = request.headers.get("Authorization", "")
+        return hmac.compare_digest(header.encode(), f"Bearer {self._token}".encode())
+
+    async def _profile_endpoint(self, request: web.Request) -> web.Response:
+        if not self._authorized(request):
+            return web.Response(status=401)
+        try:
+            seconds = float(request.query.get("seconds", self.default_seconds))
+            path = await self.run(seconds, request.query.get("mode", "sample"))
+        except ValueError as e:
+            return web.json_response({"error": str(e)}, status=400)
+        except ProfilerBusy as e:
+            return web.json_response({"error": str(e)}, status=409)
+        return web.json_response({"path": str(path)})
+
+    async def _stages_endpoint(self, request: web.Request) -> web.Response:
+        if not self._authorized(request):
+            return web.Response(status=401)
+        if self.stage_timings is None:
+            return web.json_response([])
+        return web.json_response(self.stage_timings.table())
+
+
+def _log_failure(task: asyncio.Task) -> None:
+    if not task.cancelled() and task.exception() is not None:
+        logger.opt(exception=task.exception()).error("Profile failed")
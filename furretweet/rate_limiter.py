@@ -1,3 +1,4 @@
+from collections import deque
 from datetime import datetime, timedelta, timezone
 import time
 
@@ -19,20 +20,79 @@ class RetweetLimitHandler:
 
     def update_limits(self, headers) -> None:
         self.populated = True
-        remaining = int(headers.get("x-rate-limit-remaining", 0))
+        remaining = headers.get("x-rate-limit-remaining")
         reset_timestamp = int(headers.get("x-rate-limit-reset", 0))
         limit = int(headers.get("x-rate-limit-limit", 0))
 
-        if remaining:
-            self.remaining = remaining
+        # 0 remaining must be kept, it is what tells the limit was reached
+        if remaining is not None:
+            self.remaining = int(remaining)
         if reset_timestamp:
             self.reset_time = datetime.fromtimestamp(reset_timestamp, timezone.utc)
         if limit:
             self.limit = limit
 
+    def restore(self, remaining: int, limit: int, reset_time: datetime) -> None:
+        """Restores the limits of a previous run, as if its last response
+        was just received. A window that reset since then is harmless,
+        `is_limit_exceeded` already ignores it."""
+        self.populated = True
+        self.remaining = remaining
+        self.limit = limit
+        self.reset_time = reset_time
+
     @property
     def seconds_until_reset(self) -> int:
         """Returns the number of seconds until the rate limit resets."""
         reset_time = self.reset_time.replace(microsecond=0)
         time_to_wait = reset_time - datetime.now(timezone.utc)
         return int(time_to_wait.total_seconds())
+
+
+class AuthorRetweetCounter:
+    """Counts the retweets of each author over a rolling period.
+
+    Each author only keeps a ring buffer of its last `max_retweets` retweet
+    times, which is all that is needed to know if the cap was reached, and
+    authors without retweets in the period are pruned regularly."""
+
+    def __init__(self, max_retweets: int, period: timedelta) -> None:
+        self.max_retweets = max_retweets
+        self.period = period
+        self._retweets: dict[str, deque[datetime]] = {}
+        self._next_prune = datetime.now(timezone.utc) + period
+
+    def __len__(self) -> int:
+        return len(self._retweets)
+
+    def count(self, author_id: str, now: datetime | None = None) -> int:
+        retweets = self._retweets.get(author_id)
+        if not retweets:
+            return 0
+        since = (now or datetime.now(timezone.utc)) - self.period
+        return sum(1 for retweeted_at in retweets if retweeted_at > since)
+
+    def is_capped(self, author_id: str, now: datetime | None = None) -> bool:
+        return self.count(author_id, now) >= self.max_retweets
+
+    def record(self, author_id: str, retweeted_at: datetime | None = None) -> list[datetime]:
+        """Records a retweet and returns the retweet times kept for the author."""
+        retweeted_at = retweeted_at or datetime.now(timezone.utc)
+        retweets = self._retweets.get(author_id)
+        if retweets is None:
+            retweets = self._retweets[author_id] = deque(maxlen=self.max_retweets)
+        retweets.append(retweeted_at)
+
+        if retweeted_at >= self._next_prune:
+            self.prune(retweeted_at)
+        return list(retweets)
+
+    def prune(self, now: datetime | None = None) -> None:
+        now = now or datetime.now(timezone.utc)
+        since = now - self.period
+        for author_id in [a for a, r in self._retweets.items() if r[-1] <= since]:
+            del self._retweets[author_id]
+        self._next_prune = now + self.period
+
+    def restore(self, author_id: str, retweets: list[datetime]) -> None:
+        self._retweets[author_id] = deque(sorted(retweets), maxlen=self.max_retweets)
@@ -0,0 +1,223 @@
+import asyncio
+import heapq
+import itertools
+import time
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+from loguru import logger
+import tweepy.errors as tweepy_errors
+
+import furretweet.filters as filters
+from furretweet.metrics import metrics
+from furretweet.models import (
+    STREAM_EXPANSIONS,
+    STREAM_MEDIA_FIELDS,
+    STREAM_TWEET_FIELDS,
+    STREAM_USER_FIELDS,
+    Includes,
+    StreamResponse,
+    Tweet,
+)
+from furretweet.rate_limiter import RetweetLimitHandler
+from furretweet.resilience import DependencyUnavailable, guarded
+
+if TYPE_CHECKING:
+    from furretweet.pipeline import Campaign, RecheckSpec
+    from furretweet.stream import FurStream
+
+LOOKUP_BATCH_SIZE = 100
+
+
+def build_responses(client, payload: dict) -> list[StreamResponse]:
+    """Builds a response for each tweet of a tweets lookup payload,
+    with only the author and media of that tweet in its includes."""
+    includes = payload.get("includes", {})
+    users = {user["id"]: user for user in includes.get("users", [])}
+    media = {m["media_key"]: m for m in includes.get("media", [])}
+
+    responses = []
+    for data in payload.get("data", []):
+        if data["author_id"] not in users:
+            continue
+        media_keys = (data.get("attachments") or {}).get("media_keys", [])
+        tweet_includes = {
+            "users": [users[data["author_id"]]],
+            "media": [media[key] for key in media_keys if key in media],
+        }
+        responses.append(
+            StreamResponse(
+                client=client,
+                tweet=Tweet.parse_obj(data),
+                includes=Includes.parse_obj(tweet_includes),
+                errors=[],
+            )
+        )
+    return responses
+
+
+@dataclass(frozen=True, slots=True)
+class DeferredTweet:
+    """What is kept of a borderline tweet until its recheck, the lookup
+    brings back everything else. Holding the whole response would keep
+    its models and filter results alive for the whole delay."""
+
+    tweet_id: int
+    url: str
+    campaign: "Campaign | None"
+
+    @classmethod
+    def from_response(cls, response: StreamResponse) -> "DeferredTweet":
+        return cls(tweet_id=response.tweet.id, url=response.url, campaign=response.campaign)
+
+
+class RecheckQueue:
+    """Gives borderline tweets a second chance once they had time to get engagement.
+
+    A tweet is borderline when all its failed filters are soft filters. It is
+    kept in a delay queue, then looked up again in batches of 100 ids to get
+    fresh public metrics and filtered again with the soft filters replaced by
+    a `MinimumEngagementFilter`. Lookups have their own rate limit budget so
+    they never compete with retweets."""
+
+    def __init__(self, stream: "FurStream") -> None:
+        self.stream = stream
+        self.rate_limit_handler = RetweetLimitHandler()
+        self.task: asyncio.Task | None = None
+        self._pending: list[tuple[float, int, DeferredTweet]] = []
+        self._sequence = itertools.count()
+
+    @property
+    def spec(self) -> "RecheckSpec":
+        return self.stream.pipeline.spec.recheck
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    async def start(self):
+        if self.task is None:
+            logger.info("Starting recheck queue")
+            self.task = asyncio.create_task(self._run())
+
+    def is_borderline(self, response: StreamResponse) -> bool:
+        soft_filters = self.spec.soft_filters
+        return bool(response.failed_filters) and all(
+            f.name in soft_filters for f in response.failed_filters
+        )
+
+    def defer(self, response: StreamResponse, delay: float | None = None):
+        self._push(DeferredTweet.from_response(response), delay)
+
+    def _push(self, deferred: DeferredTweet, delay: float | None = None):
+        if len(self._pending) >= self.spec.max_pending:
+            return logger.warning(f"Recheck queue is full, not deferring {deferred.url}")
+
+        due = time.monotonic() + (self.spec.delay_seconds if delay is None else delay)
+        heapq.heappush(self._pending, (due, next(self._sequence), deferred))
+        metrics.gauge("recheck_pending").set(len(self._pending))
+        logger.info(f"Tweet {deferred.url} is borderline, checking it again later")
+
+    def recheck_filters(self, response: StreamResponse) -> list[filters.BaseFilter]:
+        spec = self.spec
+        campaign = response.campaign or self.stream.pipeline.default_campaign
+        return [f for f in campaign.default_filters if f.name not in spec.soft_filters] + [
+            filters.MinimumEngagementFilter(spec.min_engagement)
+        ]
+
+    def _pop_due(self, limit: int) -> list[DeferredTweet]:
+        now = time.monotonic()
+        due = []
+        while self._pending and self._pending[0][0] <= now and len(due) < limit:
+            due.append(heapq.heappop(self._pending)[2])
+        return due
+
+    async def lookup(self, deferred: list[DeferredTweet]) -> list[StreamResponse]:
+        """Fetches fresh versions of the tweets, deleted ones are left out."""
+        r = await guarded(
+            self.stream.twitter_breaker,
+            self.stream.client.get_tweets,
+            [d.tweet_id for d in deferred],
+            expansions=STREAM_EXPANSIONS,
+            tweet_fields=STREAM_TWEET_FIELDS,
+            user_fields=STREAM_USER_FIELDS,
+            media_fields=STREAM_MEDIA_FIELDS,
+            user_auth=True,
+        )
+        self.rate_limit_handler.update_limits(r.headers)
+        metrics.counter("recheck_lookups_total").inc()
+
+        campaigns = {d.tweet_id: d.campaign for d in deferred}
+        fresh_responses = build_responses(self.stream.client, await r.json())
+        for response in fresh_responses:
+            response.campaign = campaigns.get(response.tweet.id)
+        return fresh_responses
+
+    async def recheck(self, response: StreamResponse):
+        # The filters are the ones of the stream, with their per tweet state
+        async with self.stream._processing_lock:
+            await self._recheck(response)
+
+    async def _recheck(self, response: StreamResponse):
+        stream = self.stream
+        campaign = response.campaign or stream.pipeline.default_campaign
+        if not campaign.schedule.is_active():
+            return logger.info(f"Campaign {campaign.name} is no longer active, not rechecking")
+        if response.author.id in await stream.user_list(
+            "blacklist", stream.furretweet.get_blacklist
+        ):
+            return logger.info(f"Tweet {response.url} not rechecked, author is blacklisted.")
+
+        recheck_filters = self.recheck_filters(response)
+        await response.prepare_filters(recheck_filters)
+        failed_filters = response.process_filters(recheck_filters)
+        if failed_filters:
+            metrics.counter("recheck_failed_total").inc()
+            return logger.info(f"Tweet {response.url} failed the recheck {failed_filters}")
+
+        metrics.counter("recheck_rescued_total").inc()
+        logger.info(f"Tweet {response.url} passed the recheck with fresh metrics")
+        await stream.selector.submit(response)
+
+    async def run_once(self):
+        for _ in range(self.spec.max_requests_per_run):
+            if self.rate_limit_handler.is_limit_exceeded():
+                logger.info(
+                    "Tweets lookup rate limit reached, "
+                    f"resets in {self.rate_limit_handler.seconds_until_reset}s"
+                )
+                break
+
+            batch = self._pop_due(LOOKUP_BATCH_SIZE)
+            if not batch:
+                break
+
+            try:
+                responses = await self.lookup(batch)
+            except tweepy_errors.TooManyRequests as e:
+                self.rate_limit_handler.update_limits(e.response.headers)
+                for deferred in batch:
+                    self._push(deferred, delay=self.rate_limit_handler.seconds_until_reset)
+                break
+            except DependencyUnavailable as e:
+                logger.warning(f"Can't look up tweets to recheck: {e}")
+                for deferred in batch:
+                    self._push(deferred, delay=self.spec.interval_seconds)
+                break
+            except tweepy_errors.HTTPException:
+                logger.exception(f"Failed to look up {len(batch)} tweets to recheck")
+                continue
+
+            for response in responses:
+                await self.recheck(response)
+
+        metrics.gauge("recheck_pending").set(len(self._pending))
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.spec.interval_seconds)
+            if not self.spec.soft_filters:
+                continue
+            try:
+                await self.run_once()
+            except Exception:
+                logger.exception("Exception in recheck queue")
@@ -0,0 +1,142 @@
+import asyncio
+import enum
+import time
+from typing import Awaitable, Callable, TypeVar
+
+import aiohttp
+import tweepy.errors as tweepy_errors
+from loguru import logger
+from pymongo.errors import ConnectionFailure
+
+from furretweet.metrics import metrics
+
+T = TypeVar("T")
+
+# What tells a dependency is down or overloaded, other errors are about the
+# request itself, like a 403 on a protected tweet, and don't open a breaker.
+TWITTER_FAILURES: tuple[type[BaseException], ...] = (
+    tweepy_errors.TwitterServerError,
+    aiohttp.ClientError,
+)
+MONGO_FAILURES: tuple[type[BaseException], ...] = (ConnectionFailure,)
+TELEGRAM_FAILURES: tuple[type[BaseException], ...] = (aiohttp.ClientError,)
+
+
+class BreakerState(enum.IntEnum):
+    CLOSED = 0
+    HALF_OPEN = 1
+    OPEN = 2
+
+
+class DependencyUnavailable(Exception):
+    """A dependency timed out, failed, or its breaker is open. Call sites
+    catch this one to apply their fallback."""
+
+    def __init__(self, dependency: str, reason: str) -> None:
+        super().__init__(f"{dependency} is unavailable: {reason}")
+        self.dependency = dependency
+
+
+class CircuitOpen(DependencyUnavailable):
+    pass
+
+
+class CircuitBreaker:
+    """Gives each call to a dependency a deadline, and stops calling it for
+    `reset_timeout` seconds after `failure_threshold` consecutive failures.
+
+    After that, the breaker is half-open: a single trial call is let
+    through, closing the breaker if it succeeds and opening it again if it
+    fails. Meanwhile every other call fails fast with `CircuitOpen`, instead
+    of holding the stream behind a dependency that is down."""
+
+    def __init__(
+        self,
+        dependency: str,
+        timeout: float = 10.0,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        failures: tuple[type[BaseException], ...] = (),
+    ) -> None:
+        self.dependency = dependency
+        self.timeout = timeout
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = failures
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._state = BreakerState.CLOSED
+        self._trial_in_flight = False
+        self._set_state(BreakerState.CLOSED)
+
+    @property
+    def state(self) -> BreakerState:
+        if (
+            self._state is BreakerState.OPEN
+            and time.monotonic() - self.opened_at >= self.reset_timeout
+        ):
+            self._set_state(BreakerState.HALF_OPEN)
+        return self._state
+
+    def _set_state(self, state: BreakerState) -> None:
+        if state is not self._state:
+            logger.warning(f"Circuit breaker of {self.dependency} is now {state.name.lower()}")
+        self._state = state
+        metrics.gauge("circuit_breaker_state", dependency=self.dependency).set(state)
+
+    def allows_request(self) -> bool:
+        state = self.state
+        if state is BreakerState.HALF_OPEN:
+            return not self._trial_in_flight
+        return state is BreakerState.CLOSED
+
+    async def call(self, fn: Callable[..., Awaitable[T]], *args, **kwargs) -> T:
+        if not self.allows_request():
+            metrics.counter("circuit_breaker_rejected_total", dependency=self.dependency).inc()
+            raise CircuitOpen(self.dependency, "circuit breaker is open")
+
+        trial = self._state is BreakerState.HALF_OPEN
+        self._trial_in_flight = trial
+        try:
+            result = await asyncio.wait_for(fn(*args, **kwargs), self.timeout)
+        except asyncio.TimeoutError as e:
+            metrics.counter("dependency_timeouts_total", dependency=self.dependency).inc()
+            self._on_failure()
+            raise DependencyUnavailable(self.dependency, f"no answer in {self.timeout}s") from e
+        except self.failures as e:
+            self._on_failure()
+            raise DependencyUnavailable(self.dependency, repr(e)) from e
+        except Exception:
+            # The dependency answered, the request itself was wrong
+            self._on_success()
+            raise
+        finally:
+            if trial:
+                self._trial_in_flight = False
+
+        self._on_success()
+        return result
+
+    def _on_success(self) -> None:
+        self.consecutive_failures = 0
+        if self._state is not BreakerState.CLOSED:
+            self._set_state(BreakerState.CLOSED)
+
+    def _on_failure(self) -> None:
+        metrics.counter("circuit_breaker_failures_total", dependency=self.dependency).inc()
+        self.consecutive_failures += 1
+        if (
+            self._state is BreakerState.HALF_OPEN
+            or self.consecutive_failures >= self.failure_threshold
+        ):
+            self.opened_at = time.monotonic()
+            self._set_state(BreakerState.OPEN)
+
+
+async def guarded(
+    breaker: CircuitBreaker | None, fn: Callable[..., Awaitable[T]], *args, **kwargs
+) -> T:
+    """Calls `fn` through the breaker if there is one."""
+    if breaker is None:
+        return await fn(*args, **kwargs)
+    return await breaker.call(fn, *args, **kwargs)
@@ -0,0 +1,229 @@
+import asyncio
+import heapq
+import itertools
+import math
+import time
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING
+
+from loguru import logger
+
+from furretweet.filters import AuthorRetweetCapFilter
+from furretweet.metrics import metrics
+from furretweet.models import StreamResponse
+from furretweet.resilience import BreakerState
+
+if TYPE_CHECKING:
+    from furretweet.pipeline import SelectionSpec
+    from furretweet.stream import FurStream
+
+SCORE_BUCKETS = (1, 2, 3, 4, 5, 6, 7, 8, 10, 12, 15)
+
+
+class RetweetSelector:
+    """Chooses which approved tweets are worth the remaining retweet quota.
+
+    Approved tweets are held in a priority queue for `window_seconds`, then
+    the best scored ones are retweeted, only as many as the quota allows if
+    it was spread evenly until the rate limit resets. They are picked one at
+    a time, so the tweets of an author just retweeted are rescored and their
+    author cap checked again. Candidates that keep losing for
+    `max_wait_seconds` are given up as if the limit was reached."""
+
+    def __init__(self, stream: "FurStream") -> None:
+        self.stream = stream
+        self.task: asyncio.Task | None = None
+        self.last_retweets: dict[str, datetime] = {}
+        self._pending: list[tuple[float, int, float, StreamResponse]] = []
+        # Ids of the tweets in `_pending`, a tweet delivered again is only queued once
+        self._pending_ids: set[int] = set()
+        self._sequence = itertools.count()
+
+    @property
+    def spec(self) -> "SelectionSpec":
+        return self.stream.pipeline.spec.selection
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def __contains__(self, tweet_id: int) -> bool:
+        return tweet_id in self._pending_ids
+
+    async def start(self):
+        if self.task is None:
+            logger.info("Starting retweet selector")
+            self.task = asyncio.create_task(self._run())
+
+    def score(self, response: StreamResponse, now: datetime | None = None) -> float:
+        spec = self.spec
+        now = now or datetime.now(timezone.utc)
+        tweet_metrics = response.tweet.public_metrics
+        engagement = (
+            tweet_metrics.like_count
+            + tweet_metrics.reply_count
+            + 2 * (tweet_metrics.retweet_count + tweet_metrics.quote_count)
+        )
+        account_years = (now - response.author.created_at).days / 365
+
+        score = (
+            spec.followers_weight * math.log10(1 + response.author.public_metrics.followers_count)
+            + spec.engagement_weight * math.log10(1 + engagement)
+            + spec.account_age_weight * min(account_years, 5)
+        )
+
+        last_retweet = self.last_retweets.get(str(response.author.id))
+        if last_retweet is not None:
+            hours = (now - last_retweet).total_seconds() / 3600
+            half_lives = hours / spec.recent_author_half_life_hours
+            score -= spec.recent_author_penalty * 0.5**half_lives
+
+        return score
+
+    def budget(self) -> int:
+        """How many retweets can be spent in this window, over all the accounts."""
+        breaker = self.stream.twitter_breaker
+        if not breaker.allows_request():
+            # Candidates wait for Twitter to come back, or until they are given up
+            return 0
+        if breaker.state is BreakerState.HALF_OPEN:
+            return 1
+
+        budget = 0
+        for account in self.stream.accounts:
+            handler = account.rate_limit_handler
+            if not handler.populated or handler.seconds_until_reset <= 0:
+                # Unknown quota, the first retweet or 429 will tell us
+                return len(self._pending)
+
+            windows_left = max(1.0, handler.seconds_until_reset / max(self.spec.window_seconds, 1))
+            budget += max(0, min(handler.remaining, math.ceil(handler.remaining / windows_left)))
+        return budget
+
+    async def submit(self, response: StreamResponse):
+        spec = self.spec
+        if spec.window_seconds <= 0:
+            return await self.stream.retweet(response)
+        if response.tweet.id in self:
+            metrics.counter("duplicate_tweets_total").inc()
+            return logger.info(f"Tweet {response.tweet.id} is already a candidate, ignoring...")
+
+        score = self.score(response)
+        metrics.histogram("selection_score", buckets=SCORE_BUCKETS).observe(score)
+        self._push((-score, next(self._sequence), time.monotonic(), response))
+        metrics.gauge("selection_pending").set(len(self._pending))
+
+        if len(self._pending) > spec.max_pending:
+            # Drop the worst candidate, the heap is only ordered for the best one
+            worst = max(self._pending)
+            self._pending.remove(worst)
+            heapq.heapify(self._pending)
+            self._pending_ids.discard(worst[3].tweet.id)
+            await self._give_up(worst[3])
+
+    async def defer(self, response: StreamResponse):
+        """Puts back a candidate that couldn't be retweeted because Twitter was
+        unavailable, to be selected again once it is back."""
+        if self.spec.window_seconds <= 0:
+            return await self._give_up(response)
+        if response.tweet.id in self:
+            return
+        metrics.counter("selection_deferred_total").inc()
+        self._push((-self.score(response), next(self._sequence), time.monotonic(), response))
+        metrics.gauge("selection_pending").set(len(self._pending))
+
+    def _push(self, candidate: tuple[float, int, float, StreamResponse]):
+        heapq.heappush(self._pending, candidate)
+        self._pending_ids.add(candidate[3].tweet.id)
+
+    def _pop(self) -> tuple[float, int, float, StreamResponse]:
+        candidate = heapq.heappop(self._pending)
+        self._pending_ids.discard(candidate[3].tweet.id)
+        return candidate
+
+    def on_retweeted(self, response: StreamResponse):
+        self.last_retweets[str(response.author.id)] = datetime.now(timezone.utc)
+
+    async def _give_up(self, response: StreamResponse):
+        metrics.counter("selection_given_up_total").inc()
+        await self.stream.on_rate_limit_exceeded(response)
+
+    async def flush(self):
+        if not self._pending:
+            return
+
+        budget = self.budget()
+        metrics.gauge("selection_budget").set(budget)
+        metrics.gauge("retweet_quota_remaining").set(
+            sum(account.headroom() for account in self.stream.accounts)
+        )
+
+        # Picked one at a time, each retweet can lower the score of the other
+        # tweets of its author or put them over the author cap
+        selected = capped = 0
+        while selected < budget and self._pending:
+            negative_score, sequence, submitted_at, response = self._pop()
+            rescored = -self.score(response)
+            if rescored > negative_score:
+                self._push((rescored, sequence, submitted_at, response))
+                continue
+
+            capped_by = [f for f in self._author_caps(response) if not f.filter(response)]
+            if capped_by:
+                capped += 1
+                response.failed_filters = capped_by
+                metrics.counter("selection_author_capped_total").inc()
+                await self._guard(self.stream.on_failed_filters, response)
+                continue
+
+            selected += 1
+            metrics.counter("selection_selected_total").inc()
+            metrics.histogram("selection_selected_score", buckets=SCORE_BUCKETS).observe(
+                -negative_score
+            )
+            await self._guard(self.stream.retweet, response)
+
+        oldest_allowed = time.monotonic() - self.spec.max_wait_seconds
+        expired = [c for c in self._pending if c[2] < oldest_allowed]
+        if expired:
+            self._pending = [c for c in self._pending if c[2] >= oldest_allowed]
+            heapq.heapify(self._pending)
+            self._pending_ids.difference_update(c[3].tweet.id for c in expired)
+        metrics.gauge("selection_pending").set(len(self._pending))
+
+        logger.info(
+            f"Selected {selected} tweets with a budget of {budget}, {capped} over their "
+            f"author cap, {len(self._pending)} pending and {len(expired)} given up"
+        )
+
+        for *_, response in expired:
+            await self._guard(self._give_up, response)
+
+        self._prune_last_retweets()
+
+    @staticmethod
+    def _author_caps(response: StreamResponse) -> list[AuthorRetweetCapFilter]:
+        return [f for f in response.filters if isinstance(f, AuthorRetweetCapFilter)]
+
+    @staticmethod
+    async def _guard(handle, response: StreamResponse):
+        # One failing tweet doesn't lose the others of the window
+        try:
+            await handle(response)
+        except Exception:
+            logger.exception(f"Exception while handling the selected tweet {response.url}")
+
+    def _prune_last_retweets(self):
+        # Past a few half-lives the penalty is negligible
+        max_hours = self.spec.recent_author_half_life_hours * 8
+        now = datetime.now(timezone.utc)
+        for author_id, retweeted_at in list(self.last_retweets.items()):
+            if (now - retweeted_at).total_seconds() / 3600 > max_hours:
+                del self.last_retweets[author_id]
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(max(self.spec.window_seconds, 1))
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Exception while flushing retweet candidates")
@@ -0,0 +1,157 @@
+import asyncio
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import TYPE_CHECKING, Protocol
+
+import ujson
+from loguru import logger
+
+from furretweet.metrics import metrics
+
+if TYPE_CHECKING:
+    from furretweet.stream import FurStream
+
+SNAPSHOT_VERSION = 1
+
+
+class SnapshotStore(Protocol):
+    async def load(self) -> dict | None:
+        ...
+
+    async def save(self, snapshot: dict) -> None:
+        ...
+
+
+class FileSnapshotStore:
+    """Keeps the snapshot in a local JSON file, replaced atomically."""
+
+    def __init__(self, path: str | Path) -> None:
+        self.path = Path(path)
+
+    async def load(self) -> dict | None:
+        try:
+            return ujson.loads(await asyncio.to_thread(self.path.read_bytes))
+        except FileNotFoundError:
+            return None
+        except ValueError:
+            logger.warning(f"Ignoring the unreadable state snapshot {self.path}")
+            return None
+
+    async def save(self, snapshot: dict) -> None:
+        await asyncio.to_thread(self._write, ujson.dumps(snapshot))
+
+    def _write(self, data: str) -> None:
+        # A crash leaves the old snapshot or the new one, never half of one
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp_path, "w") as file:
+            file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, self.path)
+
+
+class StateSnapshotter:
+    """Checkpoints what the stream learned at runtime every `interval`
+    seconds, and restores it at startup instead of starting cold.
+
+    A snapshot holds the rate limit window of each account, the ids of the
+    last tweets decided on, and the white and blacklists. One older than
+    `max_age` seconds is rejected, its limits and lists can't be trusted
+    anymore."""
+
+    def __init__(
+        self,
+        stream: "FurStream",
+        store: SnapshotStore,
+        interval: float = 30.0,
+        max_age: float = 900.0,
+    ) -> None:
+        self.stream = stream
+        self.store = store
+        self.interval = interval
+        self.max_age = max_age
+        self.task: asyncio.Task | None = None
+
+    async def start(self) -> None:
+        if self.task is None:
+            logger.info(f"Saving state snapshots every {self.interval}s")
+            self.task = asyncio.create_task(self._run())
+
+    def capture(self, now: datetime | None = None) -> dict:
+        now = now or datetime.now(timezone.utc)
+        return {
+            "version": SNAPSHOT_VERSION,
+            "taken_at": now.isoformat(),
+            "accounts": {
+                account.name: {
+                    "remaining": account.rate_limit_handler.remaining,
+                    "limit": account.rate_limit_handler.limit,
+                    "reset_time": account.rate_limit_handler.reset_time.isoformat(),
+                }
+                for account in self.stream.accounts
+                # Nothing learned yet, the defaults are as good
+                if account.rate_limit_handler.populated
+            },
+            "recent_ids": list(self.stream.recent_ids),
+            "user_lists": self.stream.user_lists,
+        }
+
+    async def save(self) -> None:
+        start = time.perf_counter()
+        await self.store.save(self.capture())
+        metrics.histogram("state_snapshot_save_seconds").observe(time.perf_counter() - start)
+
+    async def restore(self, now: datetime | None = None) -> bool:
+        """Applies the last snapshot to the stream, returns whether it was fresh enough."""
+        start = time.perf_counter()
+        snapshot = await self.store.load()
+        if snapshot is None:
+            logger.info("No state snapshot to restore, starting cold")
+            return False
+
+        now = now or datetime.now(timezone.utc)
+        reason = self.rejection_reason(snapshot, now)
+        if reason is not None:
+            metrics.counter("state_snapshot_rejected_total").inc()
+            logger.warning(f"Ignoring the state snapshot, {reason}")
+            return False
+
+        accounts = {account.name: account for account in self.stream.accounts}
+        for name, limits in snapshot["accounts"].items():
+            # Accounts removed from the configuration since
+            if name in accounts:
+                accounts[name].rate_limit_handler.restore(
+                    limits["remaining"],
+                    limits["limit"],
+                    datetime.fromisoformat(limits["reset_time"]),
+                )
+        for tweet_id in snapshot["recent_ids"]:
+            self.stream.recent_ids.add(tweet_id)
+        self.stream.user_lists.update(snapshot["user_lists"])
+
+        logger.info(
+            f"Restored the state snapshot taken at {snapshot['taken_at']} "
+            f"in {(time.perf_counter() - start) * 1000:.1f}ms"
+        )
+        return True
+
+    def rejection_reason(self, snapshot: dict, now: datetime) -> str | None:
+        if snapshot.get("version") != SNAPSHOT_VERSION:
+            return f"its version {snapshot.get('version')} is not {SNAPSHOT_VERSION}"
+        age = now - datetime.fromisoformat(snapshot["taken_at"])
+        if age > timedelta(seconds=self.max_age):
+            return f"it is {age.total_seconds():.0f}s old"
+        if age < -timedelta(seconds=self.max_age):
+            # Taken on a clock far ahead, its age means nothing
+            return f"it was taken {-age.total_seconds():.0f}s in the future"
+        return None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.save()
+            except Exception:
+                logger.exception("Exception while saving the state snapshot")
@@ -0,0 +1,238 @@
+import asyncio
+import os
+import struct
+import time
+import zlib
+from pathlib import Path
+
+import bson
+from loguru import logger
+from pymongo.errors import BulkWriteError, PyMongoError
+
+from furretweet.metrics import metrics
+from furretweet.resilience import CircuitBreaker, DependencyUnavailable
+
+# Payload length and CRC32, a record torn by a crash is detected and dropped
+HEADER = struct.Struct("<II")
+DUPLICATE_KEY = 11000
+FSYNC_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0)
+
+
+class Spool:
+    """Append-only file of length-prefixed records, where Mongo writes wait
+    instead of holding the stream while Mongo is slow or down.
+
+    An append is a single `os.write` landing in the page cache, records are
+    fsynced in batches every `fsync_interval` by a background task. The
+    offset of the records already drained into Mongo is kept next to the
+    file, so after a restart the drainer picks up where it stopped."""
+
+    def __init__(self, path: str | Path, fsync_interval: float = 0.05) -> None:
+        self.path = Path(path)
+        self.offset_path = self.path.with_name(self.path.name + ".offset")
+        self.fsync_interval = fsync_interval
+        self.task: asyncio.Task | None = None
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT | os.O_APPEND, 0o600)
+        self._unsynced = 0
+        self.committed = self._read_offset()
+        self.size = self._recover()
+        metrics.gauge("spool_pending_bytes").set(self.pending)
+
+    @property
+    def pending(self) -> int:
+        """Bytes appended but not drained yet."""
+        return self.size - self.committed
+
+    def _read_offset(self) -> int:
+        try:
+            return int(self.offset_path.read_text())
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def _write_offset(self, offset: int) -> None:
+        # Replaced atomically, a crash leaves the old offset or the new one
+        tmp_path = self.offset_path.with_name(self.offset_path.name + ".tmp")
+        tmp_path.write_text(str(offset))
+        os.replace(tmp_path, self.offset_path)
+
+    def _recover(self) -> int:
+        """Checks the records after the committed offset, cutting the file
+        at the first torn one, and returns the size of the valid part."""
+        size = os.fstat(self._fd).st_size
+        if self.committed > size:
+            # The file was truncated after it was fully drained, before the offset was written
+            self.committed = 0
+
+        offset = self.committed
+        while offset < size:
+            record = self._read_record(offset)
+            if record is None:
+                logger.warning(f"Dropping {size - offset} torn bytes at the end of {self.path}")
+                os.ftruncate(self._fd, offset)
+                return offset
+            offset += HEADER.size + len(record)
+        return size
+
+    def _read_record(self, offset: int) -> bytes | None:
+        header = os.pread(self._fd, HEADER.size, offset)
+        if len(header) < HEADER.size:
+            return None
+        length, crc = HEADER.unpack(header)
+        payload = os.pread(self._fd, length, offset + HEADER.size)
+        if len(payload) < length or zlib.crc32(payload) != crc:
+            return None
+        return payload
+
+    def append(self, payload: bytes) -> None:
+        record = HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+        os.write(self._fd, record)
+        self.size += len(record)
+        self._unsynced += 1
+        metrics.counter("spool_appends_total").inc()
+        metrics.gauge("spool_pending_bytes").set(self.pending)
+
+    def read(self, max_records: int) -> tuple[list[bytes], int]:
+        """Returns up to `max_records` records after the committed offset,
+        and the offset to commit once they are drained."""
+        records = []
+        offset = self.committed
+        while offset < self.size and len(records) < max_records:
+            record = self._read_record(offset)
+            if record is None:
+                break
+            records.append(record)
+            offset += HEADER.size + len(record)
+        return records, offset
+
+    def commit(self, offset: int) -> None:
+        """Marks the records before `offset` as drained."""
+        if offset >= self.size:
+            # Fully drained, the file starts over instead of growing forever
+            os.ftruncate(self._fd, 0)
+            self.size = offset = 0
+        self._write_offset(offset)
+        self.committed = offset
+        metrics.gauge("spool_pending_bytes").set(self.pending)
+
+    async def sync(self) -> None:
+        if not self._unsynced:
+            return
+        self._unsynced = 0
+        start = time.perf_counter()
+        await asyncio.to_thread(os.fsync, self._fd)
+        metrics.histogram("spool_fsync_seconds", buckets=FSYNC_BUCKETS).observe(
+            time.perf_counter() - start
+        )
+
+    async def start(self) -> None:
+        if self.task is None:
+            self.task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.fsync_interval)
+            try:
+                await self.sync()
+            except OSError:
+                logger.exception(f"Could not fsync {self.path}")
+
+    async def close(self) -> None:
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+        await self.sync()
+        os.close(self._fd)
+
+
+class SpoolDrainer:
+    """Replays the spool into a Mongo collection in batches.
+
+    A batch is committed only once Mongo took it, and replaying a batch
+    that was partly written before an outage or a crash is harmless, the
+    documents already there are rejected on their `_id`. Each record ends
+    up in Mongo exactly once. The collection's writes must be acknowledged,
+    see `MongoDatabase.acknowledged`, whatever tier the repository uses."""
+
+    def __init__(
+        self,
+        spool: Spool,
+        collection,
+        batch_size: int = 100,
+        interval: float = 1.0,
+        timeout: float = 10.0,
+        max_backoff: float = 60.0,
+        breaker: CircuitBreaker | None = None,
+        ordered: bool = False,
+    ) -> None:
+        self.spool = spool
+        self.collection = collection
+        # Its deadline replaces `timeout`, and while it is open the drainer backs off
+        self.breaker = breaker
+        self.batch_size = batch_size
+        self.interval = interval
+        self.timeout = timeout
+        self.max_backoff = max_backoff
+        self.ordered = ordered
+        self.task: asyncio.Task | None = None
+
+    async def start(self) -> None:
+        if self.task is None:
+            logger.info(f"Starting spool drainer, {self.spool.pending} bytes pending")
+            self.task = asyncio.create_task(self._run())
+
+    async def drain_once(self) -> int:
+        """Writes one batch to Mongo, returns how many records were drained."""
+        records, offset = self.spool.read(self.batch_size)
+        if not records:
+            return 0
+
+        documents = [bson.decode(record) for record in records]
+        drained = len(records)
+        try:
+            if self.breaker is not None:
+                await self.breaker.call(
+                    self.collection.insert_many, documents, ordered=self.ordered
+                )
+            else:
+                await asyncio.wait_for(
+                    self.collection.insert_many(documents, ordered=self.ordered), self.timeout
+                )
+        except BulkWriteError as e:
+            # Written by a previous attempt that failed or timed out midway
+            errors = e.details.get("writeErrors", [])
+            if e.details.get("writeConcernErrors") or any(
+                error["code"] != DUPLICATE_KEY for error in errors
+            ):
+                raise
+            if self.ordered:
+                # Stopped at the duplicate, the documents after it are sent again
+                drained = errors[0]["index"] + 1
+                offset = self.spool.committed + sum(
+                    HEADER.size + len(record) for record in records[:drained]
+                )
+        self.spool.commit(offset)
+        metrics.counter("spool_drained_total").inc(drained)
+        return drained
+
+    async def _run(self) -> None:
+        failures = 0
+        while True:
+            try:
+                drained = await self.drain_once()
+            except (PyMongoError, asyncio.TimeoutError, DependencyUnavailable) as e:
+                failures += 1
+                metrics.counter("spool_drain_errors_total").inc()
+                backoff = min(self.interval * 2**failures, self.max_backoff)
+                logger.warning(f"Could not drain the spool, retrying in {backoff:.0f}s: {e!r}")
+                await asyncio.sleep(backoff)
+                continue
+            except Exception:
+                logger.exception("Exception while draining the spool")
+                await asyncio.sleep(self.max_backoff)
+                continue
+
+            if failures:
+                logger.info("Draining the spool again")
+                failures = 0
+            if drained < self.batch_size:
+                await asyncio.sleep(self.interval)
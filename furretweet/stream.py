@@ -1,15 +1,32 @@
 import asyncio
+import time
 import tweepy.asynchronous as tweepy
 from loguru import logger
 import aiohttp
 import ujson
 import furretweet.filters as filters
+from furretweet.accounts import AccountPool, RetweetAccount
+from furretweet.campaigns import CampaignBudget
+from furretweet.dedup import RecentIds
+from furretweet.http_session import SessionWarmer, TwitterSession
+from furretweet.hydration import UserHydrator
+from furretweet.loop_monitor import LoopLagMonitor
+from furretweet.metrics import metrics
 from furretweet.rate_limiter import RetweetLimitHandler
+from furretweet.recheck import RecheckQueue
+from furretweet.resilience import TWITTER_FAILURES, CircuitBreaker, DependencyUnavailable
+from furretweet.selection import RetweetSelector
 from furretweet.models import Tweet, Includes, StreamResponse
+from furretweet.offload import FilterOffloader
+from furretweet.profiling import StageClock, StageTimings
+from furretweet.pipeline import (
+    Campaign,
+    FilterPipeline,
+    PipelineSpec,
+    compile_pipeline,
+    sync_stream_rules,
+)
 import tweepy.errors as tweepy_errors
-import datetime
-from zoneinfo import ZoneInfo
-from furretweet.utils import log_exception
 
 from typing import TYPE_CHECKING
 
@@ -21,118 +38,80 @@ class LimitReached(Exception):
     pass
 
 
-class FridayChecker:
-    def __init__(self):
-        self.is_friday = False
-        self.task: asyncio.Task | None = None
-
-    async def start(self):
-        if self.task is None:
-            logger.info("Starting Friday checker")
-            self.task = asyncio.create_task(self._check_if_friday())
-
-    def _is_friday_in_timezones(self, min_tz, max_tz):
-        utc_now = datetime.datetime.now(datetime.timezone.utc)
-        for timezone in (min_tz, max_tz):
-            local_time = utc_now.astimezone(ZoneInfo(timezone))
-            if local_time.weekday() == 4:
-                return True
-        return False
-
-    @log_exception("Exception in Friday checker")
-    async def _check_if_friday(self):
-        # Checks if it's Friday somewhere in the world by verifying
-        # if it's Friday in the earliest or latest time zones.
-        # (The latest timezone is the one furthest ahead in time.)
-        # If it's Friday in either of these time zones, the retweet
-        # is enabled until it's Saturday in the latest timezone.
-        # So, the retweet is enabled for 50 hours every Friday.
-        # This is to ensure that the retweet is enabled for the entire
-        # duration of Friday in every time zone!
-
-        first_timezone = "Etc/GMT-14"
-        last_timezone = "Etc/GMT+12"
-
-        while True:
-            if self._is_friday_in_timezones(first_timezone, last_timezone):
-                logger.info("It's friday somewhere, retweet enabled")
-                self.is_friday = True
-
-                now_latest_tz = datetime.datetime.now(ZoneInfo(last_timezone))
-
-                # Find the next Friday in the last timezone
-                friday_latest_tz = now_latest_tz.date() + datetime.timedelta(
-                    (4 - now_latest_tz.weekday()) % 7
-                )
-
-                # Calculate time until Saturday in the last timezone
-                time_until_saturday_latest_tz = (
-                    datetime.datetime.combine(
-                        friday_latest_tz + datetime.timedelta(days=1),
-                        datetime.time.min,
-                        tzinfo=now_latest_tz.tzinfo,
-                    )
-                    - now_latest_tz
-                ).total_seconds()
-
-                logger.info(
-                    f"{time_until_saturday_latest_tz:.0f} seconds until Saturday "
-                    f"({(now_latest_tz + datetime.timedelta(seconds=time_until_saturday_latest_tz)).strftime('%Y-%m-%d %H:%M:%S %Z')})"
-                )
-                await asyncio.sleep(time_until_saturday_latest_tz)
-            else:
-                logger.info("It's not Friday anywhere, retweet disabled")
-                self.is_friday = False
-
-                # Calculate time until next Friday in the earliest timezone
-                now_earliest_tz = datetime.datetime.now(ZoneInfo(first_timezone))
-                time_until_friday_earliest_tz = (
-                    datetime.datetime.combine(
-                        now_earliest_tz.date()
-                        + datetime.timedelta((4 - now_earliest_tz.weekday()) % 7),
-                        datetime.time.min,
-                        tzinfo=now_earliest_tz.tzinfo,
-                    )
-                    - now_earliest_tz
-                ).total_seconds()
-                logger.info(
-                    f"Sleeping for {time_until_friday_earliest_tz:.0f} seconds until next Friday "
-                    f"({(now_earliest_tz + datetime.timedelta(seconds=time_until_friday_earliest_tz)).strftime('%Y-%m-%d %H:%M:%S %Z')})"
-                )
-                await asyncio.sleep(time_until_friday_earliest_tz)
-
-
 class FurStream(tweepy.AsyncStreamingClient):
-    def __init__(self, *, bearer_token: str, furretweet: "FurRetweet"):
+    def __init__(
+        self,
+        *,
+        bearer_token: str,
+        furretweet: "FurRetweet",
+        accounts: AccountPool | None = None,
+        offloader: FilterOffloader | None = None,
+        http: TwitterSession | None = None,
+        loop_monitor: LoopLagMonitor | None = None,
+        twitter_breaker: CircuitBreaker | None = None,
+    ):
         super().__init__(
             bearer_token=bearer_token,
             max_retries=5,
         )
         self.furretweet = furretweet
         self.client = furretweet.client
-        self.rate_limit_handler = RetweetLimitHandler()
-
-        self.default_filters: list[filters.BaseFilter] = [
-            filters.BannedTermsFilter(),
-            filters.MinimumFollowersFilter(100),
-            filters.NsfwFilter(),
-            filters.MinimumAccountAgeFilter(30),
-            filters.MediaFilter(),
-            filters.MaximumHashtagsFilter(5),
-            filters.MaximumNewLinesFilter(10),
-            filters.FursuitFridayOnlyFilter(),
-        ]
-
-        self.whitelist_filters: list[filters.BaseFilter] = [
-            filters.NsfwFilter(),
-            filters.MediaFilter(),
-        ]
-
-        self.friday_checker = FridayChecker()
+        self.accounts = accounts or AccountPool([RetweetAccount("main", self.client)])
+        # Every call to the Twitter API but the stream itself goes through it
+        self.twitter_breaker = twitter_breaker or CircuitBreaker(
+            "twitter", failures=TWITTER_FAILURES
+        )
+        # Last fetched white and blacklists, used while Twitter is unavailable
+        self.user_lists: dict[str, list[int]] = {}
+        self.recent_ids = RecentIds()
+        # Monotonic time of the last tweet or keep-alive, tells a stalled stream
+        self.last_data_at = time.monotonic()
+
+        self.pipeline = compile_pipeline(PipelineSpec())
+
+        self.campaign_budget = CampaignBudget()
+        self.selector = RetweetSelector(self)
+        self.recheck_queue = RecheckQueue(self)
+        self.hydrator = UserHydrator(self.client, breaker=self.twitter_breaker)
+        self._hydration_tasks: set[asyncio.Task] = set()
+        self._processing_lock = asyncio.Lock()
+        # Without an offloader cpu bound filters run inline, on the event loop.
+        self.offloader = offloader
+        self.loop_monitor = loop_monitor or LoopLagMonitor()
+        self.stage_timings = StageTimings()
+        self.session_warmer = SessionWarmer(self, http) if http is not None else None
+
+    @property
+    def default_filters(self) -> list[filters.BaseFilter]:
+        return self.pipeline.default_filters
+
+    @property
+    def whitelist_filters(self) -> list[filters.BaseFilter]:
+        return self.pipeline.whitelist_filters
+
+    async def install_pipeline(self, pipeline: FilterPipeline):
+        for campaign in pipeline.campaigns:
+            for f in campaign.default_filters + campaign.whitelist_filters:
+                await f.setup(self.furretweet)
+
+        # Rules first, so routing never uses campaigns whose rules Twitter
+        # doesn't have. A failure keeps the current pipeline.
+        await sync_stream_rules(self, pipeline.stream_rules)
+        # Tweets already being processed keep using the pipeline they started with.
+        self.pipeline = pipeline
+        logger.info(
+            f"Installed pipeline with campaigns {[c.name for c in pipeline.campaigns]}, "
+            f"{len(pipeline.default_filters)} default filters "
+            f"and {len(pipeline.whitelist_filters)} whitelist filters"
+        )
 
     async def on_connect(self):
         logger.info("Stream connected")
-        await self.friday_checker.start()
+        await self.selector.start()
+        await self.recheck_queue.start()
+        await self.loop_monitor.start()
+        if self.session_warmer is not None:
+            await self.session_warmer.start()
 
     async def on_disconnect(self):
         logger.info("Stream disconnected")
@@ -146,7 +125,12 @@ class FurStream(tweepy.AsyncStreamingClient):
     async def on_exception(self, exception: Exception):
         logger.exception(f"Stream exception: {exception}")
 
+    async def on_keep_alive(self):
+        self.last_data_at = time.monotonic()
+
     async def on_data(self, raw_data):
+        self.last_data_at = time.monotonic()
+        clock = StageClock({})
         data = ujson.loads(raw_data)
 
         tweet = None
@@ -155,55 +139,187 @@ class FurStream(tweepy.AsyncStreamingClient):
 
         if not "data" in data:
             return logger.warning(f"Stream received a response without data: {data}")
-        if not "includes" in data:
-            return logger.warning(f"Stream received a response without includes: {data}")
         if "errors" in data:
             errors = data["errors"]
             await self.on_errors(errors)
 
         tweet = Tweet.parse_obj(data["data"])
-        includes = Includes.parse_obj(data["includes"])
+        metrics.counter("tweets_received_total").inc()
+
+        tags = [rule.get("tag") for rule in data.get("matching_rules", [])]
+        campaign = self.route(tweet, tags)
+        if campaign is None:
+            return logger.info(f"Tweet {tweet.id} does not contain the required terms of {tags}")
+
+        includes = Includes.parse_obj(data.get("includes", {}))
+        for user in includes.users:
+            self.hydrator.cache.put(user)
+        clock("parse")
+
+        if not any(user.id == tweet.author_id for user in includes.users):
+            author = self.hydrator.cache.get(tweet.author_id)
+            if author is None:
+                # Waiting here would block the stream and defeat batching, so the
+                # tweet is hydrated and processed in the background instead.
+                logger.info(f"Stream received tweet {tweet.id} without its author, hydrating it")
+                task = asyncio.create_task(
+                    self._hydrate_and_process(tweet, includes, errors, campaign, clock.timings)
+                )
+                self._hydration_tasks.add(task)
+                task.add_done_callback(self._hydration_tasks.discard)
+                return
+            includes = Includes(users=[author, *includes.users], media=includes.media)
+
+        response = StreamResponse(
+            client=self.client, tweet=tweet, includes=includes, errors=errors
+        )
+        response.timings = clock.timings
+        await self._process(response, campaign)
 
+    def route(self, tweet: Tweet, tags: list[str]) -> Campaign | None:
+        """Picks the campaign of the stream rules the tweet matched, the first
+        active one if it matched several. None if the tweet lacks their terms."""
         # I don't know why but twitter sometimes sends us a quote retweet that doesn't match
         # our stream filter, only the quoted tweet does match, so we'll just ignore this qrt.
-        tweet_text_lower = tweet.text.lower()
-        if not "#fursuitfriday" in tweet_text_lower and not "@furretweet" in tweet_text_lower:
-            return logger.info(f"Tweet {tweet.id} does not contain #FursuitFriday or @FurRetweet")
-
-        try:
-            await self.on_response(
-                StreamResponse(client=self.client, tweet=tweet, includes=includes, errors=errors)
+        campaigns = [c for c in self.pipeline.route(tags) if c.matches(tweet.text)]
+        if not campaigns:
+            return None
+        return next((c for c in campaigns if c.schedule.is_active()), campaigns[0])
+
+    async def _hydrate_and_process(
+        self,
+        tweet: Tweet,
+        includes: Includes,
+        errors: list[dict],
+        campaign: Campaign,
+        timings: dict[str, float] | None = None,
+    ):
+        clock = StageClock(timings if timings is not None else {})
+        author = await self.hydrator.get_user(tweet.author_id)
+        clock("hydrate")
+        if author is None:
+            return logger.warning(
+                f"Could not hydrate author {tweet.author_id} of tweet {tweet.id}"
             )
-        except asyncio.CancelledError:
-            pass
-        except Exception:
-            logger.exception(f"Unhandled exception while processing stream response: {tweet}")
+
+        includes = Includes(users=[author, *includes.users], media=includes.media)
+        response = StreamResponse(
+            client=self.client, tweet=tweet, includes=includes, errors=errors
+        )
+        response.timings = clock.timings
+        await self._process(response, campaign)
+
+    def _seen(self, response: StreamResponse) -> bool:
+        # Decided on, or waiting in the selector for its window
+        if response.tweet.id in self.recent_ids or response.tweet.id in self.selector:
+            metrics.counter("duplicate_tweets_total").inc()
+            logger.info(f"Tweet {response.tweet.id} was already processed, ignoring...")
+            return True
+        return False
+
+    async def _process(self, response: StreamResponse, campaign: Campaign):
+        if self._seen(response):
+            return
+
+        response.campaign = campaign
+        clock = StageClock(response.timings)
+        # Downloads don't hold up the other tweets. Whether the author is
+        # whitelisted isn't known yet, so both filter lists fetch.
+        await response.fetch_filters(campaign.default_filters + campaign.whitelist_filters)
+        clock("fetch_filters")
+        # Filters keep per tweet state between prepare and process, so hydrated
+        # tweets must not be processed concurrently with the stream ones.
+        async with self._processing_lock:
+            clock("lock_wait")
+            # Another copy, like a hydrated one, may have been processed while waiting
+            if self._seen(response):
+                return
+            try:
+                await self.on_response(response)
+            except asyncio.CancelledError:
+                pass
+            except Exception:
+                logger.exception(
+                    f"Unhandled exception while processing stream response: {response.tweet}"
+                )
+        response.timings["total"] = sum(response.timings.values())
+        self.stage_timings.record(response.timings)
 
     async def on_response(self, response: StreamResponse):
         logger.info(f"Stream received response: {response}")
+        clock = StageClock(response.timings)
+        campaign = self.campaign_of(response)
 
-        if not self.friday_checker.is_friday:
-            return logger.info("Not friday, ignoring...")
+        if not campaign.schedule.is_active():
+            return logger.info(f"Campaign {campaign.name} is not active, ignoring...")
 
         # In the future we can cache the list of white/blacklisted users and update it every x seconds,
         # but for now we'll just fetch it every time because it will always be updated.
         # Doing this because I dont need to worry about rate limits for now, 900 requests every 15 minutes.
-        if response.author.id in await self.furretweet.get_blacklist():
+        if response.author.id in await self.user_list("blacklist", self.furretweet.get_blacklist):
             return logger.info(f"Tweet {response.url} not retweeted, author is blacklisted.")
 
-        elif response.author.id in await self.furretweet.get_whitelist():
+        whitelisted = response.author.id in await self.user_list(
+            "whitelist", self.furretweet.get_whitelist
+        )
+        clock("user_lists")
+        if whitelisted:
             logger.info(f"Tweet {response.url} author is whitelisted!")
-            failed_filters = response.process_filters(self.whitelist_filters)
-
+            campaign_filters = campaign.whitelist_filters
         else:
-            failed_filters = response.process_filters(self.default_filters)
+            campaign_filters = campaign.default_filters
+
+        await response.prepare_filters(campaign_filters, self.offloader)
+        clock("prepare_filters")
+        failed_filters = response.process_filters(campaign_filters)
+        clock("filters")
 
         if failed_filters:
-            return await self.on_failed_filters(response)
+            await self.on_failed_filters(response)
+            if self.recheck_queue.is_borderline(response):
+                self.recheck_queue.defer(response)
         else:
-            await self.retweet(response)
+            await self.selector.submit(response)
+        clock("decision")
+
+    @property
+    def user_lists_warmed(self) -> bool:
+        return "blacklist" in self.user_lists and "whitelist" in self.user_lists
+
+    async def warm_user_lists(self):
+        await self.user_list("blacklist", self.furretweet.get_blacklist)
+        await self.user_list("whitelist", self.furretweet.get_whitelist)
+
+    async def user_list(self, name: str, fetch) -> list[int]:
+        """Fetches a list of user ids, falling back to the last fetched one
+        or to an empty one, skipping the check, while Twitter is unavailable."""
+        try:
+            users = await self.twitter_breaker.call(fetch)
+        except DependencyUnavailable as e:
+            metrics.counter("user_list_fallbacks_total", list=name).inc()
+            cached = self.user_lists.get(name)
+            logger.warning(
+                f"Can't fetch the {name}, "
+                + ("using the last one" if cached is not None else "skipping it")
+                + f": {e}"
+            )
+            return cached or []
+        self.user_lists[name] = users
+        return users
+
+    @property
+    def rate_limit_handler(self) -> RetweetLimitHandler:
+        """The rate limit of the primary account, the one the stream client uses."""
+        return self.accounts.primary.rate_limit_handler
+
+    def campaign_of(self, response: StreamResponse) -> Campaign:
+        return response.campaign or self.pipeline.default_campaign
 
     async def on_failed_filters(self, response: StreamResponse):
+        self.recent_ids.add(response.tweet.id)
+        metrics.counter("tweets_not_retweeted_total").inc()
+        for f in response.failed_filters:
+            metrics.counter("filter_rejections_total", filter=f.name).inc()
         await self.furretweet.mongo.not_retweeted_tweets_repository.add(response)
         logger.info(
             f"Tweet {response.url} not retweeted due to failed filters {response.failed_filters}."
@@ -211,37 +327,78 @@ class FurStream(tweepy.AsyncStreamingClient):
 
     async def on_rate_limit_exceeded(self, response: StreamResponse):
         response.limit_reached = True
+        self.recent_ids.add(response.tweet.id)
+        metrics.counter("tweets_not_retweeted_total").inc()
         await self.furretweet.mongo.not_retweeted_tweets_repository.add(response)
         logger.info(
             f"Tweet {response.url} not retweeted due to rate limit. "
             f"Reset in {self.rate_limit_handler.seconds_until_reset}s"
         )
 
-    async def retweet(self, response: StreamResponse):
-        if self.rate_limit_handler.is_limit_exceeded():
+    async def on_retweeted(self, response: StreamResponse):
+        campaign = self.campaign_of(response)
+        self.recent_ids.add(response.tweet.id)
+        self.campaign_budget.record(campaign)
+        metrics.counter("retweets_total", campaign=campaign.name).inc()
+        self.selector.on_retweeted(response)
+        for f in self.installed_filters(response):
+            await f.on_retweet(response)
+
+    def installed_filters(self, response: StreamResponse) -> list[filters.BaseFilter]:
+        """The filters `response` was processed with, the stateful ones swapped for
+        those of the current pipeline if it was reloaded since, so retweets are
+        recorded where the next tweets are checked."""
+        campaign = self.campaign_of(response)
+        current = next((c for c in self.pipeline.campaigns if c.name == campaign.name), None)
+        if current is None or current is campaign:
+            return response.filters
+        candidates = current.default_filters + current.whitelist_filters
+        installed = []
+        for f in response.filters:
+            if f.stateful:
+                match = next((c for c in candidates if c.name == f.name), None)
+                if match is not None:
+                    # So two filters of the same type don't both map to the first one
+                    candidates.remove(match)
+                    f = match
+            installed.append(f)
+        return installed
+
+    async def retweet(self, response: StreamResponse, exclude: frozenset[str] = frozenset()):
+        campaign = self.campaign_of(response)
+        if self.campaign_budget.is_exhausted(campaign):
+            logger.info(f"Campaign {campaign.name} retweet budget is exhausted")
+            return await self.on_rate_limit_exceeded(response)
+
+        account = self.accounts.select(campaign.name, exclude=exclude)
+        if account is None:
             return await self.on_rate_limit_exceeded(response)
 
+        handler = account.rate_limit_handler
         try:
-            r = await response.retweet()
-            self.rate_limit_handler.update_limits(r.headers)
+            r = await self.twitter_breaker.call(response.retweet, account.client)
+            account.update_limits(r.headers)
 
             r_json = await r.json()
             r_data = r_json.get("data")
             if r_data.get("retweeted") is True:
                 logger.info(
-                    f"Retweeted tweet {response.url}\n"
-                    f"with rate limit remaining {self.rate_limit_handler.remaining} of {self.rate_limit_handler.limit} and "
-                    f"reseting in {self.rate_limit_handler.seconds_until_reset}s"
+                    f"Retweeted tweet {response.url} with account {account.name}\n"
+                    f"with rate limit remaining {handler.remaining} of {handler.limit} and "
+                    f"reseting in {handler.seconds_until_reset}s"
                 )
+                metrics.counter("account_retweets_total", account=account.name).inc()
+                await self.on_retweeted(response)
             else:
                 logger.warning(f"Retweeting tweet {response.url} returned {r_json}.")
 
         except tweepy_errors.TooManyRequests as e:
-            logger.debug("Got 429 Too Many Requests error from Twitter.")
+            logger.debug(f"Got 429 Too Many Requests error from Twitter for {account.name}.")
+            metrics.counter("account_rate_limited_total", account=account.name).inc()
             r: aiohttp.ClientResponse = e.response
-            self.rate_limit_handler.update_limits(r.headers)
+            account.update_limits(r.headers)
 
-            if not self.rate_limit_handler.populated:
+            if not handler.populated:
                 logger.debug(
                     "Rate limit handler not populated, ignoring 429 Too Many Requests error."
                 )
@@ -251,7 +408,12 @@ class FurStream(tweepy.AsyncStreamingClient):
                     "Updating limits from response."
                 )
 
-            return await self.on_rate_limit_exceeded(response)
+            # Another account may still have quota left
+            return await self.retweet(response, exclude=exclude | {account.name})
+
+        except DependencyUnavailable as e:
+            logger.warning(f"Deferring the retweet of {response.url}: {e}")
+            await self.selector.defer(response)
 
         except tweepy_errors.HTTPException as e:
             logger.exception(f"Error while retweeting: {e}")
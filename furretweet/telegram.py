@@ -5,7 +5,10 @@ from telebot.asyncio_filters import AdvancedCustomFilter
 from furretweet.config import config
 from furretweet import filters
 from furretweet.models import StreamResponse
+from furretweet.profiling import Profiler, ProfilerBusy
+from furretweet.resilience import TELEGRAM_FAILURES, CircuitBreaker, DependencyUnavailable
 from datetime import datetime, timezone
+from loguru import logger
 from furretweet.tweepy import client as tweepy_client
 
 import logging
@@ -22,6 +25,15 @@ logging.getLogger("TeleBot").setLevel(logging.WARNING)
 class FurTelegram(AsyncTeleBot):
     def __init__(self, token, **kwargs):
         super().__init__(token, **kwargs)
+        self.breaker = CircuitBreaker(
+            "telegram",
+            timeout=config.resilience.telegram_timeout,
+            failure_threshold=config.resilience.failure_threshold,
+            reset_timeout=config.resilience.reset_timeout,
+            failures=TELEGRAM_FAILURES,
+        )
+        # Set by FurRetweet, for the admin commands
+        self.profiler: Profiler | None = None
 
     def failed_tweet_keyboard(self, tweet_id: str, author_id: str) -> types.InlineKeyboardMarkup:
         keyboard = types.InlineKeyboardMarkup()
@@ -121,13 +133,18 @@ class FurTelegram(AsyncTeleBot):
         )
 
     async def send_response_to_feed(self, response: StreamResponse):
-        await bot.send_message(
-            chat_id=config.telegram.feed_channel_id,
-            text=self._format_response(response),
-            reply_markup=self.failed_tweet_keyboard(
-                tweet_id=str(response.tweet.id), author_id=str(response.author.id)
-            ),
-        )
+        try:
+            await self.breaker.call(
+                bot.send_message,
+                chat_id=config.telegram.feed_channel_id,
+                text=self._format_response(response),
+                reply_markup=self.failed_tweet_keyboard(
+                    tweet_id=str(response.tweet.id), author_id=str(response.author.id)
+                ),
+            )
+        except DependencyUnavailable as e:
+            # The feed is only informative, the tweet is still saved
+            logger.warning(f"Tweet {response.url} not sent to the Telegram feed: {e}")
 
 
 class FailedTweetCallbackFilter(AdvancedCustomFilter):
@@ -147,6 +164,36 @@ async def start(message: types.Message):
     await bot.reply_to(message, "Welcome to Furretweet Bot!")
 
 
+def is_admin(message: types.Message) -> bool:
+    return message.from_user is not None and message.from_user.id in config.telegram.admin_ids
+
+
+@bot.message_handler(commands=["profile"], func=is_admin)
+async def profile(message: types.Message):
+    if bot.profiler is None:
+        return await bot.reply_to(message, "Profiling is not available")
+
+    # /profile [seconds] [sample|cprofile]
+    args = message.text.split()[1:]
+    try:
+        seconds = float(args[0]) if args else None
+        mode = args[1] if len(args) > 1 else "sample"
+        await bot.reply_to(message, "Profiling...")
+        path = await bot.profiler.run(seconds, mode)
+    except (ValueError, ProfilerBusy) as e:
+        return await bot.reply_to(message, str(e))
+    await bot.reply_to(message, f"Profile written to {path}")
+
+
+@bot.message_handler(commands=["stages"], func=is_admin)
+async def stages(message: types.Message):
+    if bot.profiler is None or bot.profiler.stage_timings is None:
+        return await bot.reply_to(message, "Stage timings are not available")
+    await bot.reply_to(
+        message, f"<pre>{bot.profiler.stage_timings.format()}</pre>", parse_mode="HTML"
+    )
+
+
 @bot.callback_query_handler(func=None, config=failed_tweet_factory.filter(action="add_blacklist"))
 async def failed_tweet_add_blacklist_callback(callback: types.CallbackQuery):
     callback_data: dict = failed_tweet_factory.parse(callback_data=callback.data)
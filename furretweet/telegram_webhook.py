@@ -0,0 +1,97 @@
+import asyncio
+import hmac
+
+from aiohttp import web
+from loguru import logger
+from telebot import types
+from telebot.async_telebot import AsyncTeleBot
+
+from furretweet.dedup import RecentIds
+from furretweet.metrics import metrics
+
+SECRET_TOKEN_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class TelegramWebhook:
+    """Receives Telegram updates on an aiohttp route instead of long polling.
+
+    Telegram sends the secret token given to `setWebhook` with each update,
+    requests without it are refused. An update is answered as soon as it is
+    scheduled, its handlers run in the background, at most `max_concurrency`
+    updates at a time. Past `max_pending` updates waiting, new ones are
+    refused with a 503 and Telegram sends them again later, as it does for
+    any update not answered in time, so updates already seen are ignored."""
+
+    def __init__(
+        self,
+        bot: AsyncTeleBot,
+        secret_token: str,
+        path: str = "/telegram",
+        max_concurrency: int = 8,
+        max_pending: int = 100,
+        recent_updates: int = 1000,
+    ) -> None:
+        if not secret_token:
+            raise ValueError("A Telegram webhook needs a secret token")
+        self.bot = bot
+        self.secret_token = secret_token
+        self.path = path
+        self.max_pending = max_pending
+        self.recent_updates = RecentIds(maxlen=recent_updates)
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._tasks: set[asyncio.Task] = set()
+
+    def install(self, app: web.Application) -> None:
+        """Adds the route to an application that wasn't started yet."""
+        app.router.add_post(self.path, self.receive)
+
+    async def set_webhook(self, url: str, max_connections: int = 40) -> None:
+        await self.bot.set_webhook(
+            url=url.rstrip("/") + self.path,
+            secret_token=self.secret_token,
+            max_connections=max_connections,
+            allowed_updates=["message", "callback_query"],
+        )
+        logger.info(f"Receiving Telegram updates on {url}")
+
+    @property
+    def pending(self) -> int:
+        return len(self._tasks)
+
+    async def receive(self, request: web.Request) -> web.Response:
+        token = request.headers.get(SECRET_TOKEN_HEADER, "")
+        if not hmac.compare_digest(token.encode(), self.secret_token.encode()):
+            metrics.counter("telegram_updates_refused_total", reason="secret_token").inc()
+            return web.Response(status=401)
+
+        try:
+            update = types.Update.de_json(await request.json())
+        except (ValueError, KeyError, TypeError):
+            metrics.counter("telegram_updates_refused_total", reason="malformed").inc()
+            return web.Response(status=400)
+
+        if update.update_id in self.recent_updates:
+            metrics.counter("telegram_duplicate_updates_total").inc()
+            return web.Response()
+        if self.pending >= self.max_pending:
+            metrics.counter("telegram_updates_refused_total", reason="overloaded").inc()
+            return web.Response(status=503)
+
+        self.recent_updates.add(update.update_id)
+        metrics.counter("telegram_updates_total").inc()
+        task = asyncio.create_task(self._dispatch(update))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return web.Response()
+
+    async def _dispatch(self, update: types.Update) -> None:
+        async with self._semaphore:
+            try:
+                await self.bot.process_new_updates([update])
+            except Exception:
+                logger.exception(f"Exception while handling Telegram update {update.update_id}")
+
+    async def drain(self) -> None:
+        """Waits for the updates already received to be handled."""
+        while self._tasks:
+            await asyncio.gather(*self._tasks)
@@ -1,12 +1,27 @@
 from tweepy.asynchronous import AsyncClient
+from furretweet.accounts import RetweetAccount
 from furretweet.config import config
 import aiohttp
 
-client = AsyncClient(
-    consumer_key=config.twitter.consumer_key,
-    consumer_secret=config.twitter.consumer_secret,
-    access_token=config.twitter.access_token,
-    access_token_secret=config.twitter.access_token_secret,
-    wait_on_rate_limit=False,
-    return_type=aiohttp.ClientResponse,  # type: ignore
-)
+
+def create_client(access_token: str, access_token_secret: str) -> AsyncClient:
+    return AsyncClient(
+        consumer_key=config.twitter.consumer_key,
+        consumer_secret=config.twitter.consumer_secret,
+        access_token=access_token,
+        access_token_secret=access_token_secret,
+        wait_on_rate_limit=False,
+        return_type=aiohttp.ClientResponse,  # type: ignore
+    )
+
+
+client = create_client(config.twitter.access_token, config.twitter.access_token_secret)
+
+accounts = [RetweetAccount("main", client)] + [
+    RetweetAccount(
+        account.name,
+        create_client(account.access_token, account.access_token_secret),
+        campaigns=list(account.campaigns),
+    )
+    for account in config.twitter.extra_accounts
+]
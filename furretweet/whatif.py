@@ -0,0 +1,211 @@
+"""Replays the stored not retweeted tweets through a candidate pipeline config
+and reports how the decisions would have changed, per filter and per author.
+
+    python -m furretweet.whatif candidate.toml --campaign default --workers 8
+
+Documents are read through a cursor in batches, and the batches are filtered
+in a process pool with a bounded number in flight, so memory stays constant
+whatever the size of the collection. Stateful filters, like the duplicate or
+per author cap ones, can't be replayed on a single tweet and keep their
+stored result. The numeric filters are evaluated on columns of the whole
+batch at once, as of when each tweet was created. Tweets stored before their payload was saved are skipped.
+"""
+import argparse
+import os
+import sys
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, Executor, Future, ProcessPoolExecutor, wait
+from dataclasses import dataclass, field
+from itertools import islice
+from typing import Iterable, Iterator
+
+from pymongo import MongoClient
+
+from furretweet.columnar import TweetColumns, datetime_column, evaluate
+from furretweet.models import Includes, StreamResponse, Tweet
+from furretweet.pipeline import Campaign, PipelineConfigError, load_pipeline
+
+DEFAULT_CAMPAIGN = "default"
+PROJECTION = {"author_id": 1, "failed_filters": 1, "tweet": 1, "includes": 1}
+
+
+@dataclass
+class ReplayReport:
+    documents: int = 0
+    skipped: int = 0
+    newly_passing: int = 0
+    newly_failing: int = 0
+    failures_before: Counter[str] = field(default_factory=Counter)
+    failures_after: Counter[str] = field(default_factory=Counter)
+    authors_passing: Counter[str] = field(default_factory=Counter)
+    authors_failing: Counter[str] = field(default_factory=Counter)
+
+    def merge(self, other: "ReplayReport") -> None:
+        self.documents += other.documents
+        self.skipped += other.skipped
+        self.newly_passing += other.newly_passing
+        self.newly_failing += other.newly_failing
+        self.failures_before.update(other.failures_before)
+        self.failures_after.update(other.failures_after)
+        self.authors_passing.update(other.authors_passing)
+        self.authors_failing.update(other.authors_failing)
+
+    def format(self, top_authors: int = 20) -> str:
+        replayed = self.documents - self.skipped
+        lines = [
+            f"Replayed {replayed} tweets, skipped {self.skipped} stored without payload",
+            f"Newly passing: {self.newly_passing}",
+            f"Newly failing: {self.newly_failing}",
+            "",
+            f"{'Filter':<32} {'Before':>10} {'After':>10} {'Delta':>10}",
+        ]
+        names = sorted(self.failures_before.keys() | self.failures_after.keys())
+        for name in names:
+            before, after = self.failures_before[name], self.failures_after[name]
+            lines.append(f"{name:<32} {before:>10} {after:>10} {after - before:>+10}")
+
+        for title, authors in (
+            ("Authors with the most newly passing tweets", self.authors_passing),
+            ("Authors with the most newly failing tweets", self.authors_failing),
+        ):
+            lines += ["", title]
+            lines += [f"  {author}: {count}" for author, count in authors.most_common(top_authors)]
+        return "\n".join(lines)
+
+
+# Compiled once per worker process, keyed by config path and campaign name.
+_campaigns: dict[tuple[str, str], Campaign] = {}
+
+
+def load_campaign(path: str, name: str) -> Campaign:
+    key = (path, name)
+    if key not in _campaigns:
+        campaigns = {c.name: c for c in load_pipeline(path).campaigns}
+        if name not in campaigns:
+            raise PipelineConfigError(
+                f"Unknown campaign {name}, expected one of {list(campaigns)}"
+            )
+        _campaigns[key] = campaigns[name]
+    return _campaigns[key]
+
+
+def replay_batch(path: str, campaign_name: str, documents: list[dict]) -> ReplayReport:
+    campaign = load_campaign(path, campaign_name)
+    filters = [f for f in campaign.default_filters if not f.stateful]
+    columnar_filters = [f for f in filters if f.columnar]
+    object_filters = [f for f in filters if not f.columnar]
+    replayed = {f.name for f in filters}
+
+    stored = [document for document in documents if "tweet" in document]
+    report = ReplayReport(documents=len(documents), skipped=len(documents) - len(stored))
+    # Judged when they were streamed, not now, or accounts would have aged since
+    created_at = datetime_column(document["tweet"]["created_at"] for document in stored)
+    masks = evaluate(columnar_filters, TweetColumns.from_documents(stored), now=created_at)
+
+    for i, document in enumerate(stored):
+        # By position, the same filter type can be configured more than once
+        after = {f.name for f, mask in zip(columnar_filters, masks) if not mask[i]}
+        if object_filters:
+            response = StreamResponse(
+                client=None,  # type: ignore
+                tweet=Tweet.parse_obj(document["tweet"]),
+                includes=Includes.parse_obj(document["includes"]),
+                errors=[],
+            )
+            after.update(f.name for f in object_filters if not f.filter(response))
+
+        before = {f["filter_name"] for f in document["failed_filters"]}
+        after |= before - replayed
+
+        report.failures_before.update(before)
+        report.failures_after.update(after)
+        if before and not after:
+            report.newly_passing += 1
+            report.authors_passing[document["author_id"]] += 1
+        elif after and not before:
+            report.newly_failing += 1
+            report.authors_failing[document["author_id"]] += 1
+    return report
+
+
+def batched(iterable: Iterable[dict], size: int) -> Iterator[list[dict]]:
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def replay(
+    documents: Iterable[dict],
+    path: str,
+    executor: Executor,
+    campaign: str = DEFAULT_CAMPAIGN,
+    batch_size: int = 1000,
+    max_pending: int = 16,
+) -> ReplayReport:
+    report = ReplayReport()
+    pending: set[Future[ReplayReport]] = set()
+
+    for batch in batched(documents, batch_size):
+        if len(pending) >= max_pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                report.merge(future.result())
+        pending.add(executor.submit(replay_batch, path, campaign, batch))
+
+    for future in wait(pending).done:
+        report.merge(future.result())
+    return report
+
+
+def campaign_query(campaign: str) -> dict:
+    if campaign == DEFAULT_CAMPAIGN:
+        # Tweets stored before campaigns existed belong to the default one
+        return {"campaign": {"$in": [None, DEFAULT_CAMPAIGN]}}
+    return {"campaign": campaign}
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m furretweet.whatif",
+        description="Replays not retweeted tweets through a candidate pipeline config.",
+    )
+    parser.add_argument("config", help="candidate pipeline config (TOML)")
+    parser.add_argument("--campaign", default=DEFAULT_CAMPAIGN)
+    parser.add_argument("--mongo-uri", default=os.environ.get("MONGO_URI"))
+    parser.add_argument("--database", default="furretweet")
+    parser.add_argument("--collection", default="not_retweeted_tweets")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--top-authors", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    if not args.mongo_uri:
+        parser.error("--mongo-uri or the MONGO_URI env var is required")
+
+    try:
+        load_campaign(args.config, args.campaign)
+    except (OSError, PipelineConfigError) as e:
+        print(f"Invalid candidate config: {e}", file=sys.stderr)
+        return 2
+
+    # Aware datetimes, as the filters compare them with aware ones
+    client = MongoClient(args.mongo_uri, tz_aware=True)
+    collection = client[args.database][args.collection]
+    with collection.find(
+        campaign_query(args.campaign), PROJECTION, batch_size=args.batch_size
+    ) as cursor, ProcessPoolExecutor(args.workers) as executor:
+        report = replay(
+            cursor,
+            args.config,
+            executor,
+            campaign=args.campaign,
+            batch_size=args.batch_size,
+            max_pending=args.workers * 2,
+        )
+
+    print(report.format(args.top_authors))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,54 @@
+import copy
+from pathlib import Path
+
+import pytest
+
+from furretweet.models import Includes, StreamResponse, Tweet
+from furretweet.pipeline import load_pipeline
+
+PIPELINE_PATH = Path(__file__).parents[2] / "pipeline.toml"
+
+LONG_TEXT = (
+    "Finally finished my new fursuit for the con this weekend, thank you so much to "
+    "everyone who helped with the fur, the foam and the late night sewing sessions! "
+) * 3
+HASHTAGS = ["FursuitFriday", "furry", "fursuit", "furryart", "fursuiter", "furries"] * 4
+
+
+def long_text(raw_data: dict) -> dict:
+    raw_data["data"]["text"] = LONG_TEXT + "\n\n#FursuitFriday https://t.co/34axngukSE"
+    return raw_data
+
+
+def many_hashtags(raw_data: dict) -> dict:
+    raw_data["data"]["text"] = "New paws! " + " ".join(f"#{tag}" for tag in HASHTAGS)
+    raw_data["data"]["entities"]["hashtags"] = [{"tag": tag} for tag in HASHTAGS]
+    return raw_data
+
+
+VARIANTS = {
+    "example": lambda raw_data: raw_data,
+    "long_text": long_text,
+    "many_hashtags": many_hashtags,
+}
+
+
+@pytest.fixture(params=list(VARIANTS))
+def raw_data_variant(request, raw_data_example: dict) -> dict:
+    return VARIANTS[request.param](copy.deepcopy(raw_data_example))
+
+
+@pytest.fixture
+def response_variant(raw_data_variant: dict) -> StreamResponse:
+    return StreamResponse(
+        client=None,  # type: ignore
+        tweet=Tweet.parse_obj(raw_data_variant["data"]),
+        includes=Includes.parse_obj(raw_data_variant["includes"]),
+        errors=[],
+    )
+
+
+@pytest.fixture(scope="session")
+def default_filters():
+    """The filters of the shipped pipeline, the ones the stream really runs."""
+    return load_pipeline(str(PIPELINE_PATH)).default_filters
@@ -0,0 +1,18 @@
+import bson
+
+from furretweet.database import NotRetweetedTweetsRepository
+from furretweet.models import StreamResponse
+from furretweet.spool import Spool
+
+
+def test_not_retweeted_document(
+    benchmark, response_variant: StreamResponse, default_filters: list
+):
+    response_variant.process_filters(default_filters)
+    benchmark(NotRetweetedTweetsRepository.document, response_variant)
+
+
+def test_spool_append(benchmark, tmp_path, response_variant: StreamResponse):
+    spool = Spool(tmp_path / "writes.spool")
+    payload = bson.encode(NotRetweetedTweetsRepository.document(response_variant))
+    benchmark(spool.append, payload)
@@ -0,0 +1,25 @@
+from furretweet.filters import (
+    BannedTermsFilter,
+    MaximumHashtagsFilter,
+    MinimumFollowersFilter,
+    NearDuplicateTextFilter,
+)
+from furretweet.models import StreamResponse
+
+
+def test_banned_terms_filter(benchmark, response_variant: StreamResponse, default_filters: list):
+    banned_terms_filter = next(f for f in default_filters if isinstance(f, BannedTermsFilter))
+    benchmark(banned_terms_filter.filter, response_variant)
+
+
+def test_near_duplicate_text_filter(benchmark, response_variant: StreamResponse):
+    near_duplicate_filter = NearDuplicateTextFilter(min_length=10)
+    benchmark(near_duplicate_filter.filter, response_variant)
+
+
+def test_maximum_hashtags_filter(benchmark, response_variant: StreamResponse):
+    benchmark(MaximumHashtagsFilter(5).filter, response_variant)
+
+
+def test_minimum_followers_filter(benchmark, response_variant: StreamResponse):
+    benchmark(MinimumFollowersFilter(100).filter, response_variant)
@@ -0,0 +1,23 @@
+from furretweet.models import Includes, StreamResponse, Tweet, TweetFeatures, TweetSnapshot
+
+
+def test_tweet_parse_obj(benchmark, raw_data_variant: dict):
+    benchmark(Tweet.parse_obj, raw_data_variant["data"])
+
+
+def test_includes_parse_obj(benchmark, raw_data_variant: dict):
+    benchmark(Includes.parse_obj, raw_data_variant["includes"])
+
+
+def test_process_filters(benchmark, response_variant: StreamResponse, default_filters: list):
+    benchmark(response_variant.process_filters, default_filters)
+
+
+def test_tweet_snapshot(benchmark, response_variant: StreamResponse):
+    benchmark(TweetSnapshot.from_response, response_variant)
+
+
+def test_tweet_features(benchmark, raw_data_variant: dict):
+    tweet = Tweet.parse_obj(raw_data_variant["data"])
+    includes = Includes.parse_obj(raw_data_variant["includes"])
+    benchmark(TweetFeatures.extract, tweet, includes)
@@ -0,0 +1,12 @@
+from furretweet.models import StreamResponse
+from furretweet.normalize import fold_text
+
+OBFUSCATED = "Ｆｒｅｅ сrурtо giveaway, b\u200buy my n\u200bft p0rn #FursuitFriday " * 3
+
+
+def test_fold_text(benchmark, response_variant: StreamResponse):
+    benchmark(fold_text, response_variant.tweet.text)
+
+
+def test_fold_text_obfuscated(benchmark):
+    benchmark(fold_text, OBFUSCATED)
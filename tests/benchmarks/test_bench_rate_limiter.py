@@ -0,0 +1,24 @@
+from datetime import datetime, timedelta, timezone
+
+from furretweet.rate_limiter import AuthorRetweetCounter, RetweetLimitHandler
+
+
+def test_is_limit_exceeded(benchmark):
+    handler = RetweetLimitHandler()
+    reset = datetime.now(timezone.utc) + timedelta(minutes=15)
+    handler.update_limits(
+        {
+            "x-rate-limit-limit": "50",
+            "x-rate-limit-remaining": "0",
+            "x-rate-limit-reset": str(int(reset.timestamp())),
+        }
+    )
+    assert benchmark(handler.is_limit_exceeded)
+
+
+def test_author_retweet_count(benchmark):
+    counter = AuthorRetweetCounter(3, timedelta(hours=50))
+    for author_id in range(10_000):
+        for _ in range(3):
+            counter.record(str(author_id))
+    benchmark(counter.count, "5000")
@@ -0,0 +1,19 @@
+import pytest
+
+from furretweet.filters import MaximumHashtagsFilter, MinimumFollowersFilter
+from furretweet.models import StreamResponse
+
+
+@pytest.fixture
+def bot():
+    try:
+        from furretweet.telegram import bot
+    except KeyError as e:
+        pytest.skip(f"The telegram bot needs the {e} env var")
+    return bot
+
+
+def test_format_response(benchmark, bot, response_variant: StreamResponse):
+    failed_filters = [MinimumFollowersFilter(10**6), MaximumHashtagsFilter(0)]
+    response_variant.process_filters(failed_filters)
+    benchmark(bot._format_response, response_variant)
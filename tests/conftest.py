@@ -1,6 +1,21 @@
+import asyncio
+import copy
+import importlib.util
 import pytest
+from datetime import datetime, timedelta, timezone
 from furretweet.models import Tweet, Includes, StreamResponse
 from unittest.mock import MagicMock
+from tweepy.errors import TooManyRequests, TwitterServerError
+
+# pytest-benchmark is a dev dependency, the benchmarks need its fixture
+collect_ignore = [] if importlib.util.find_spec("pytest_benchmark") else ["benchmarks"]
+
+
+def pytest_configure(config):
+    if config.pluginmanager.hasplugin("benchmark"):
+        # Benchmarks run once as plain tests, `python -m benchmarks.regressions` times them
+        # with --benchmark-enable
+        config.option.benchmark_disable = True
 
 
 @pytest.fixture
@@ -64,3 +79,101 @@ def mock_response(raw_data_example):
     errors = []
 
     return StreamResponse(client=MagicMock(), tweet=tweet, includes=includes, errors=errors)  # type: ignore
+
+
+class FakeResponse:
+    def __init__(self, payload: dict, status: int = 200, headers: dict | None = None):
+        self.payload = payload
+        self.status = status
+        self.reason = "OK" if status < 400 else "Error"
+        self.headers = headers or {}
+
+    async def json(self):
+        return self.payload
+
+
+class FakeTwitterAPI:
+    """In-memory stand-in for tweepy's `AsyncClient`, serving the tweets and users
+    added to it with the same payloads and rate limit headers as the Twitter API.
+
+    Setting `fault` to "error" makes every call fail with a 503, to "hang"
+    makes them never answer."""
+
+    def __init__(self, limit: int = 900):
+        self.limit = limit
+        self.remaining: dict[str, int] = {}
+        self.reset = int((datetime.now(timezone.utc) + timedelta(minutes=15)).timestamp())
+        self.tweets: dict[str, dict] = {}
+        self.users: dict[str, dict] = {}
+        self.media: dict[str, dict] = {}
+        self.calls: list[tuple[str, dict]] = []
+        self.fault: str | None = None
+
+    def add_tweet(self, raw_data: dict) -> dict:
+        data = copy.deepcopy(raw_data["data"])
+        self.tweets[data["id"]] = data
+        for user in raw_data["includes"]["users"]:
+            self.users[user["id"]] = copy.deepcopy(user)
+        for media in raw_data["includes"]["media"]:
+            self.media[media["media_key"]] = copy.deepcopy(media)
+        return data
+
+    async def _request(self, endpoint: str, **params) -> dict:
+        self.calls.append((endpoint, params))
+        if self.fault == "hang":
+            await asyncio.Event().wait()
+        if self.fault == "error":
+            raise TwitterServerError(
+                FakeResponse({}, status=503), response_json={"title": "Service Unavailable"}
+            )
+        remaining = self.remaining.get(endpoint, self.limit)
+        headers = {
+            "x-rate-limit-limit": str(self.limit),
+            "x-rate-limit-remaining": str(max(remaining - 1, 0)),
+            "x-rate-limit-reset": str(self.reset),
+        }
+        if remaining <= 0:
+            raise TooManyRequests(
+                FakeResponse({}, status=429, headers=headers),
+                response_json={"title": "Too Many Requests"},
+            )
+        self.remaining[endpoint] = remaining - 1
+        return headers
+
+    async def get_tweets(self, ids, **params):
+        headers = await self._request("get_tweets", ids=ids, **params)
+        assert len(ids) <= 100
+        data = [self.tweets[str(i)] for i in ids if str(i) in self.tweets]
+        author_ids = {tweet["author_id"] for tweet in data}
+        media_keys = {
+            key for tweet in data for key in tweet.get("attachments", {}).get("media_keys", [])
+        }
+        payload = {
+            "data": data,
+            "includes": {
+                "users": [self.users[i] for i in author_ids if i in self.users],
+                "media": [self.media[k] for k in media_keys if k in self.media],
+            },
+        }
+        return FakeResponse(payload, headers=headers)
+
+    async def get_users(self, *, ids, **params):
+        headers = await self._request("get_users", ids=ids, **params)
+        assert len(ids) <= 100
+        data = [self.users[str(i)] for i in ids if str(i) in self.users]
+        return FakeResponse({"data": data}, headers=headers)
+
+    async def retweet(self, tweet_id, **params):
+        headers = await self._request("retweet", tweet_id=tweet_id, **params)
+        return FakeResponse({"data": {"retweeted": True}}, headers=headers)
+
+
+@pytest.fixture
+def fake_twitter_api():
+    return FakeTwitterAPI()
+
+
+@pytest.fixture
+def fake_twitter_api_factory():
+    """For tests needing several accounts, each with its own fake API."""
+    return FakeTwitterAPI
@@ -0,0 +1,67 @@
+import pytest
+from unittest.mock import MagicMock
+from datetime import datetime, timedelta, timezone
+from furretweet.accounts import DEFAULT_RETWEET_LIMIT, AccountPool, RetweetAccount
+from furretweet.metrics import metrics
+
+
+def set_remaining(account: RetweetAccount, remaining: int):
+    handler = account.rate_limit_handler
+    handler.populated = True
+    handler.remaining = remaining
+    handler.limit = 50
+    handler.reset_time = datetime.now(timezone.utc) + timedelta(minutes=10)
+
+
+def test_headroom():
+    account = RetweetAccount("main", MagicMock())
+    assert account.headroom() == DEFAULT_RETWEET_LIMIT
+
+    set_remaining(account, 12)
+    assert account.headroom() == 12
+
+    set_remaining(account, 0)
+    assert account.headroom() == 0
+
+
+def test_select_most_headroom():
+    main, second, third = accounts = [RetweetAccount(name, MagicMock()) for name in "abc"]
+    pool = AccountPool(accounts)
+    set_remaining(main, 3)
+    set_remaining(second, 30)
+    set_remaining(third, 10)
+
+    assert pool.select() is second
+    assert pool.select(exclude=frozenset({"b"})) is third
+
+    for account in accounts:
+        set_remaining(account, 0)
+    assert pool.select() is None
+
+
+def test_select_by_campaign():
+    main = RetweetAccount("main", MagicMock())
+    convention = RetweetAccount("convention", MagicMock(), campaigns=["anthrocon"])
+    pool = AccountPool([main, convention])
+    set_remaining(main, 5)
+    set_remaining(convention, 40)
+
+    assert pool.select("default") is main
+    assert pool.select("anthrocon") is convention
+
+    set_remaining(main, 0)
+    assert pool.select("default") is None
+
+
+def test_update_limits_metrics(fake_twitter_api):
+    metrics.clear()
+    account = RetweetAccount("main", fake_twitter_api)
+    account.update_limits({"x-rate-limit-remaining": "7", "x-rate-limit-reset": "0"})
+
+    assert account.rate_limit_handler.remaining == 7
+    assert metrics.gauge("account_quota_remaining", account="main").value == 7
+
+
+def test_empty_pool():
+    with pytest.raises(ValueError):
+        AccountPool([])
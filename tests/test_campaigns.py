@@ -0,0 +1,59 @@
+from datetime import datetime, timedelta, timezone
+from furretweet.campaigns import CampaignBudget, CampaignSchedule
+from furretweet.pipeline import CampaignSpec, compile_campaign
+
+
+def utc(*args) -> datetime:
+    return datetime(*args, tzinfo=timezone.utc)
+
+
+def test_schedule_friday_somewhere():
+    schedule = CampaignSchedule(weekdays=[4])
+
+    # Friday starts at 10:00 UTC on Thursday in UTC+14
+    assert not schedule.is_active(utc(2023, 4, 13, 9, 59))
+    assert schedule.is_active(utc(2023, 4, 13, 10, 0))
+    assert schedule.is_active(utc(2023, 4, 14, 11, 0))
+    # and ends at 12:00 UTC on Saturday in UTC-12
+    assert schedule.is_active(utc(2023, 4, 15, 11, 59))
+    assert not schedule.is_active(utc(2023, 4, 15, 12, 0))
+
+
+def test_schedule_bounds():
+    schedule = CampaignSchedule(start=datetime(2023, 6, 29), end=utc(2023, 7, 3))
+
+    assert not schedule.is_active(utc(2023, 6, 28, 23, 59))
+    assert schedule.is_active(utc(2023, 6, 29))
+    assert not schedule.is_active(utc(2023, 7, 3))
+
+
+def test_campaign_budget():
+    campaign = compile_campaign(
+        CampaignSpec(name="anthrocon", max_retweets=2, budget_period_hours=1)
+    )
+    unlimited = compile_campaign(CampaignSpec(name="default"))
+    budget = CampaignBudget()
+    now = utc(2023, 4, 14, 12)
+
+    budget.record(campaign, now)
+    budget.record(campaign, now + timedelta(minutes=30))
+    budget.record(unlimited, now)
+
+    assert budget.is_exhausted(campaign, now + timedelta(minutes=30))
+    assert not budget.is_exhausted(unlimited, now + timedelta(minutes=30))
+
+    # The first retweet left the rolling period
+    assert budget.used(campaign, now + timedelta(minutes=61)) == 1
+    assert not budget.is_exhausted(campaign, now + timedelta(minutes=61))
+
+
+def test_campaign_budget_without_limit_is_pruned():
+    unlimited = compile_campaign(CampaignSpec(name="unlimited", budget_period_hours=1))
+    budget = CampaignBudget()
+    now = utc(2023, 4, 14, 12)
+
+    for minutes in range(0, 600, 10):
+        budget.record(unlimited, now + timedelta(minutes=minutes))
+
+    # Only the retweets of the last hour are kept, even if the budget is never checked
+    assert len(budget._retweets["unlimited"]) == 7
@@ -0,0 +1,117 @@
+import copy
+import random
+import numpy as np
+import pytest
+from datetime import datetime, timedelta, timezone
+from freezegun import freeze_time
+from furretweet.columnar import TweetColumns, evaluate, passed
+from furretweet.filters import (
+    MaximumHashtagsFilter,
+    MaximumNewLinesFilter,
+    MinimumAccountAgeFilter,
+    MinimumFollowersFilter,
+    NsfwFilter,
+)
+from furretweet.models import Includes, StreamResponse, Tweet
+from unittest.mock import MagicMock
+
+NOW = datetime(2023, 4, 14, 12, tzinfo=timezone.utc)
+
+
+def random_raw_data(raw_data_example: dict, rng: random.Random) -> dict:
+    raw_data = copy.deepcopy(raw_data_example)
+    user = raw_data["includes"]["users"][0]
+    user["public_metrics"]["followers_count"] = rng.choice(
+        [0, 99, 100, 101, rng.randint(0, 10**6)]
+    )
+    # Around the 30 days boundary, down to the microsecond
+    age = timedelta(days=30) + timedelta(microseconds=rng.choice([-1, 0, 1, 10**9, -(10**9)]))
+    user["created_at"] = (NOW - age).isoformat()
+
+    hashtags = rng.choice([None, 0, 5, 6, 12])
+    if hashtags is None:
+        raw_data["data"]["entities"] = None
+    else:
+        raw_data["data"]["entities"] = {"hashtags": [{"tag": "x"}] * hashtags}
+    raw_data["data"]["text"] = "\n".join(["#FursuitFriday"] * rng.randint(1, 14))
+    return raw_data
+
+
+@pytest.fixture
+def responses(raw_data_example: dict) -> list[StreamResponse]:
+    rng = random.Random(0)
+    responses = []
+    for _ in range(500):
+        raw_data = random_raw_data(raw_data_example, rng)
+        responses.append(
+            StreamResponse(
+                client=MagicMock(),
+                tweet=Tweet.parse_obj(raw_data["data"]),
+                includes=Includes.parse_obj(raw_data["includes"]),
+                errors=[],
+            )
+        )
+    return responses
+
+
+FILTERS = [
+    MinimumFollowersFilter(100),
+    MinimumAccountAgeFilter(30),
+    MaximumHashtagsFilter(5),
+    MaximumNewLinesFilter(10),
+]
+
+
+@freeze_time(NOW)
+@pytest.mark.parametrize("f", FILTERS, ids=lambda f: f.name)
+def test_parity_with_filter(f, responses: list[StreamResponse]):
+    [mask] = evaluate([f], TweetColumns.from_responses(responses), now=NOW)
+
+    expected = np.array([f.filter(response) for response in responses])
+    assert mask.dtype == bool
+    assert np.array_equal(mask, expected)
+    # Both outcomes are covered
+    assert 0 < expected.sum() < len(expected)
+
+
+def test_from_documents(responses: list[StreamResponse]):
+    documents = [{"tweet": r.tweet.dict(), "includes": r.includes.dict()} for r in responses]
+
+    from_documents = TweetColumns.from_documents(documents)
+    from_responses = TweetColumns.from_responses(responses)
+
+    assert len(from_documents) == len(responses)
+    for name in ("followers_count", "author_created_at", "hashtags_count", "new_lines_count"):
+        assert np.array_equal(getattr(from_documents, name), getattr(from_responses, name))
+
+
+def test_naive_datetimes_are_utc(responses: list[StreamResponse]):
+    documents = [{"tweet": r.tweet.dict(), "includes": r.includes.dict()} for r in responses[:5]]
+    for document in documents:
+        created_at = document["includes"]["users"][0]["created_at"]
+        document["includes"]["users"][0]["created_at"] = created_at.replace(tzinfo=None)
+
+    assert np.array_equal(
+        TweetColumns.from_documents(documents).author_created_at,
+        TweetColumns.from_responses(responses[:5]).author_created_at,
+    )
+
+
+def test_passed(responses: list[StreamResponse]):
+    columns = TweetColumns.from_responses(responses)
+    masks = evaluate(FILTERS, columns, now=NOW)
+
+    with freeze_time(NOW):
+        expected = [all(f.filter(r) for f in FILTERS) for r in responses]
+    assert passed(masks, len(columns)).tolist() == expected
+
+
+def test_empty_columns():
+    columns = TweetColumns.from_responses([])
+    assert len(columns) == 0
+    assert evaluate(FILTERS, columns)[0].shape == (0,)
+
+
+def test_evaluate_not_columnar(responses: list[StreamResponse]):
+    with pytest.raises(TypeError):
+        evaluate([NsfwFilter()], TweetColumns.from_responses(responses))
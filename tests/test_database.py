@@ -4,10 +4,14 @@ from unittest.mock import MagicMock, AsyncMock
 from pydantic import ValidationError
 from furretweet.filters import NsfwFilter, BannedTermsFilter
 from furretweet.database import (
+    AuthorRetweetsRepository,
+    MediaHashesRepository,
     MongoDatabase,
     NotRetweetedTweetsRepository,
     NotRetweetedTweet,
+    StateSnapshotsRepository,
 )
+from furretweet.media import HashEntry
 from datetime import datetime, timezone
 
 from furretweet.models import StreamResponse
@@ -20,7 +24,17 @@ def sample_config():
         mongo=MagicMock(
             uri="mongodb://localhost:27017",
             database="test_db",
+            max_pool_size=10,
+            min_pool_size=0,
+            compressors="zlib",
             not_retweeted_tweets_collection="test_collection",
+            media_hashes_collection="test_media_hashes",
+            author_retweets_collection="test_author_retweets",
+            state_snapshots_collection="test_state_snapshots",
+            not_retweeted_tweets_durability="unacknowledged",
+            media_hashes_durability="acknowledged",
+            author_retweets_durability="journaled",
+            state_snapshots_durability="majority",
         )
     )
 
@@ -42,6 +56,40 @@ def test_mongo_database_initialization(sample_config: MagicMock):
     assert mongo_database.client is not None
     assert mongo_database.db is not None
     assert isinstance(mongo_database.not_retweeted_tweets_repository, NotRetweetedTweetsRepository)
+    assert isinstance(mongo_database.media_hashes_repository, MediaHashesRepository)
+    assert isinstance(mongo_database.author_retweets_repository, AuthorRetweetsRepository)
+    assert isinstance(mongo_database.state_snapshots_repository, StateSnapshotsRepository)
+
+
+def test_mongo_database_client_options(mongo_database: MongoDatabase):
+    options = mongo_database.client.delegate.options
+    assert options.pool_options.max_pool_size == 10
+    assert options.pool_options.min_pool_size == 0
+
+
+def test_mongo_database_durability_tiers(mongo_database: MongoDatabase):
+    def write_concern(repository) -> dict:
+        return repository.collection.write_concern.document
+
+    assert write_concern(mongo_database.not_retweeted_tweets_repository) == {"w": 0}
+    assert write_concern(mongo_database.media_hashes_repository) == {"w": 1, "j": False}
+    assert write_concern(mongo_database.author_retweets_repository) == {"w": 1, "j": True}
+    assert write_concern(mongo_database.state_snapshots_repository) == {"w": "majority", "j": True}
+    assert not mongo_database.not_retweeted_tweets_repository.collection.write_concern.acknowledged
+
+
+def test_drainer_collection_is_acknowledged(mongo_database: MongoDatabase):
+    collection = mongo_database.not_retweeted_tweets_repository.collection
+    assert mongo_database.acknowledged(collection).write_concern.document == {"w": 1, "j": False}
+    # Stronger tiers are kept
+    collection = mongo_database.author_retweets_repository.collection
+    assert mongo_database.acknowledged(collection) is collection
+
+
+def test_unknown_durability_tier(sample_config: MagicMock):
+    sample_config.mongo.media_hashes_durability = "fsync"
+    with pytest.raises(ValueError):
+        MongoDatabase(config=sample_config)
 
 
 def test_not_retweeted_tweet_model():
@@ -68,7 +116,7 @@ def test_not_retweeted_tweet_model():
 async def test_not_retweeted_tweets_repository_add(
     mock_response: StreamResponse, not_retweeted_tweets_repository
 ):
-    not_retweeted_tweets_repository.collection.insert_one = AsyncMock()
+    not_retweeted_tweets_repository.collection.update_one = AsyncMock()
     banned_terms_filter = BannedTermsFilter()
     banned_terms_filter.terms_found = ["banned", "words"]
     mock_response.failed_filters = [NsfwFilter(), banned_terms_filter]
@@ -76,10 +124,14 @@ async def test_not_retweeted_tweets_repository_add(
     # Test adding a StreamResponse to the repository
     await not_retweeted_tweets_repository.add(mock_response)
 
-    not_retweeted_tweets_repository.collection.insert_one.assert_called_once()
-    tweet_data = not_retweeted_tweets_repository.collection.insert_one.call_args.args[0]
+    update_one = not_retweeted_tweets_repository.collection.update_one
+    update_one.assert_called_once()
+    query, update = update_one.call_args.args
+    # Written again, the first record is kept
+    assert update_one.call_args.kwargs == {"upsert": True}
+    tweet_data = update["$setOnInsert"]
 
-    assert tweet_data["_id"] == str(mock_response.tweet.id)
+    assert query == {"_id": str(mock_response.tweet.id)}
     assert tweet_data["text"] == mock_response.tweet.text
     assert tweet_data["author_id"] == str(mock_response.author.id)
     assert tweet_data["created_at"] == mock_response.tweet.created_at
@@ -88,3 +140,38 @@ async def test_not_retweeted_tweets_repository_add(
         {"filter_name": "NsfwFilter", "details": {}},
         {"filter_name": "BannedTermsFilter", "details": banned_terms_filter.details},
     ]
+    assert tweet_data["tweet"] == mock_response.tweet.dict()
+    assert tweet_data["includes"] == mock_response.includes.dict()
+    assert tweet_data["campaign"] is None
+
+
+@pytest.mark.asyncio
+async def test_media_hashes_repository_add(mongo_database: MongoDatabase):
+    repository = mongo_database.media_hashes_repository
+    repository.collection.update_one = AsyncMock()
+
+    await repository.add(HashEntry(hash=0xFF, media_key="3_1", tweet_id="1"))
+
+    repository.collection.update_one.assert_called_once()
+    query, update = repository.collection.update_one.call_args.args
+    assert query == {"_id": "3_1"}
+    assert update["$setOnInsert"]["hash"] == "00000000000000ff"
+    assert update["$setOnInsert"]["tweet_id"] == "1"
+    assert repository.collection.update_one.call_args.kwargs == {"upsert": True}
+
+
+@pytest.mark.asyncio
+async def test_author_retweets_repository_since(mongo_database: MongoDatabase):
+    repository = mongo_database.author_retweets_repository
+    naive = datetime(2023, 4, 14, 12)
+
+    async def find(query):
+        yield {"_id": "1", "retweets": [naive]}
+
+    repository.collection.find = MagicMock(side_effect=find)
+    since = datetime(2023, 4, 14, tzinfo=timezone.utc)
+
+    assert [r async for r in repository.since(since)] == [
+        ("1", [naive.replace(tzinfo=timezone.utc)])
+    ]
+    repository.collection.find.assert_called_once_with({"retweets": {"$gt": since}})
@@ -1,4 +1,5 @@
 import pytest
+from unittest.mock import AsyncMock, MagicMock
 from datetime import datetime, timezone, timedelta
 from furretweet.filters import (
     MinimumFollowersFilter,
@@ -9,6 +10,9 @@ from furretweet.filters import (
     MediaFilter,
     MaximumHashtagsFilter,
     BannedTermsFilter,
+    NearDuplicateTextFilter,
+    AuthorRetweetCapFilter,
+    MinimumEngagementFilter,
 )
 from freezegun import freeze_time
 
@@ -137,3 +141,136 @@ def test_banned_terms_filter(mock_response: StreamResponse):
     assert all(
         word in banned_terms_filter.details["terms_found"] for word in ["crypto", "nft", "kill"]
     )
+
+
+def test_banned_terms_filter_obfuscated(mock_response: StreamResponse):
+    banned_terms_filter = BannedTermsFilter(["monk", "nft", "porn"], word_terms=["monk"])
+
+    mock_response.tweet.text = "My monkey fursuit"
+    assert banned_terms_filter.filter(mock_response)
+
+    mock_response.tweet.text = "Mint my ｎｆｔ, f\u200burryp0rn"
+    assert not banned_terms_filter.filter(mock_response)
+    assert banned_terms_filter.details == {"terms_found": ["nft", "porn"]}
+
+
+@pytest.mark.parametrize(
+    "text, term",
+    [
+        ("Check my #NFTs", "nft"),
+        ("#cryptoart drop", "crypto"),
+        ("#NSFWfursuit", "nsfw"),
+        ("Who wants bitcoins", "bitcoin"),
+    ],
+)
+def test_banned_terms_filter_matches_inside_words(
+    mock_response: StreamResponse, text: str, term: str
+):
+    banned_terms_filter = BannedTermsFilter()
+    mock_response.tweet.text = text
+    assert not banned_terms_filter.filter(mock_response)
+    assert banned_terms_filter.details == {"terms_found": [term]}
+
+
+def test_banned_terms_filter_default_word_terms(mock_response: StreamResponse):
+    banned_terms_filter = BannedTermsFilter()
+    mock_response.tweet.text = "My monkey is wiping its debts in the manuscript"
+    assert banned_terms_filter.filter(mock_response)
+
+
+def test_near_duplicate_text_filter(mock_response: StreamResponse):
+    near_duplicate_filter = NearDuplicateTextFilter(max_cluster_size=2, min_length=20)
+    spam = "Earn 500 dollars a day working from home, click the link in my bio #FursuitFriday"
+
+    # Short texts are never considered spam
+    mock_response.tweet.text = "Happy #FursuitFriday! https://t.co/34axngukSE"
+    assert near_duplicate_filter.filter(mock_response)
+    assert near_duplicate_filter.details["cluster_size"] == 1
+
+    for tweet_id in (1, 2):
+        mock_response.tweet.id = tweet_id
+        mock_response.tweet.text = f"{spam} https://t.co/link{tweet_id}"
+        assert near_duplicate_filter.filter(mock_response)
+
+    # The same tweet processed twice doesn't count as its own duplicate
+    assert near_duplicate_filter.filter(mock_response)
+
+    mock_response.tweet.id = 3
+    mock_response.tweet.text = spam.replace("500", "600")
+    assert not near_duplicate_filter.filter(mock_response)
+    assert near_duplicate_filter.details["cluster_size"] == 3
+    assert sorted(near_duplicate_filter.details["similar_tweet_ids"]) == ["1", "2"]
+    assert near_duplicate_filter.details["cluster_authors"] == 1
+
+    mock_response.tweet.id = 4
+    mock_response.tweet.text = "Finally finished my new fursuit head, took me four months!"
+    assert near_duplicate_filter.filter(mock_response)
+
+
+@pytest.mark.asyncio
+async def test_near_duplicate_text_filter_survives_reload(mock_response: StreamResponse):
+    furretweet = MagicMock(text_indexes={})
+    mock_response.tweet.text = (
+        "Earn 500 dollars a day working from home, click the link in my bio #FursuitFriday"
+    )
+    before = NearDuplicateTextFilter(max_cluster_size=1, min_length=20)
+    await before.setup(furretweet)
+    assert before.filter(mock_response)
+
+    # The filter of the reloaded pipeline still knows the tweets seen before
+    after = NearDuplicateTextFilter(max_cluster_size=1, min_length=20)
+    await after.setup(furretweet)
+    mock_response.tweet.id = 2
+    assert not after.filter(mock_response)
+
+    # Unless the window or the size of the index changed
+    resized = NearDuplicateTextFilter(max_cluster_size=1, min_length=20, max_entries=10)
+    await resized.setup(furretweet)
+    assert resized.filter(mock_response)
+
+
+@pytest.mark.asyncio
+async def test_author_retweet_cap_filter(mock_response: StreamResponse):
+    now = datetime.now(tz=timezone.utc)
+
+    async def since(since):
+        yield "1", [now - timedelta(hours=1)]
+
+    furretweet = MagicMock()
+    furretweet.mongo.author_retweets_repository.since = since
+    furretweet.mongo.author_retweets_repository.save = AsyncMock()
+
+    author_cap_filter = AuthorRetweetCapFilter(max_retweets=2, period_hours=50)
+    await author_cap_filter.setup(furretweet)
+
+    mock_response.author.id = 1
+    assert author_cap_filter.filter(mock_response)
+    assert author_cap_filter.details == {
+        "max_retweets": 2,
+        "period_hours": 50,
+        "author_retweets": 1,
+        "tracked_authors": 1,
+    }
+
+    await author_cap_filter.on_retweet(mock_response)
+    author_id, retweets = furretweet.mongo.author_retweets_repository.save.call_args.args
+    assert author_id == "1"
+    assert len(retweets) == 2
+
+    assert not author_cap_filter.filter(mock_response)
+    assert author_cap_filter.details["author_retweets"] == 2
+
+    mock_response.author.id = 2
+    assert author_cap_filter.filter(mock_response)
+
+
+def test_minimum_engagement_filter(mock_response: StreamResponse):
+    min_engagement_filter = MinimumEngagementFilter(min_engagement=500)
+
+    # 457 likes, 23 retweets, 2 replies and 1 quote
+    assert not min_engagement_filter.filter(mock_response)
+    assert min_engagement_filter.details == {"min_engagement": 500, "engagement": 483}
+
+    mock_response.tweet.public_metrics.like_count = 474
+    assert min_engagement_filter.filter(mock_response)
+    assert min_engagement_filter.details == {"min_engagement": 500, "engagement": 500}
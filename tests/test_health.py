@@ -0,0 +1,105 @@
+import json
+import time
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+import pytest_asyncio
+from aiohttp.test_utils import TestClient, TestServer
+
+from furretweet.health import HealthServer
+from furretweet.metrics import metrics
+from furretweet.models import StreamResponse
+from furretweet.resilience import DependencyUnavailable
+from furretweet.stream import FurStream
+
+
+@pytest.fixture(autouse=True)
+def clear_metrics():
+    metrics.clear()
+
+
+@pytest.fixture
+def fur_stream():
+    furretweet = MagicMock()
+    furretweet.get_blacklist = AsyncMock(return_value=[1])
+    furretweet.get_whitelist = AsyncMock(return_value=[2])
+    furretweet.mongo.not_retweeted_tweets_repository.add = AsyncMock()
+    return FurStream(bearer_token="token", furretweet=furretweet)
+
+
+@pytest.fixture
+def mongo():
+    mongo = MagicMock()
+    mongo.ping = AsyncMock()
+    return mongo
+
+
+@pytest_asyncio.fixture
+async def health(fur_stream: FurStream, mongo: MagicMock):
+    health = HealthServer(fur_stream, mongo=mongo, liveness_timeout=60)
+    yield health
+    await health.stop()
+
+
+@pytest_asyncio.fixture
+async def client(health: HealthServer):
+    client = TestClient(TestServer(health.app))
+    await client.start_server()
+    yield client
+    await client.close()
+
+
+@pytest.mark.asyncio
+async def test_liveness(client: TestClient, fur_stream: FurStream):
+    response = await client.get("/healthz")
+    assert response.status == 200
+
+    # Stalled, not even keep-alives
+    fur_stream.last_data_at = time.monotonic() - 61
+    response = await client.get("/healthz")
+    assert response.status == 503
+    assert (await response.json())["alive"] is False
+
+    await fur_stream.on_keep_alive()
+    assert (await client.get("/healthz")).status == 200
+
+
+@pytest.mark.asyncio
+async def test_readiness(client: TestClient, health: HealthServer, fur_stream: FurStream, mongo):
+    response = await client.get("/readyz")
+    assert response.status == 503
+    assert await response.json() == {"ready": False, "user_lists": False, "mongo": False}
+
+    await fur_stream.warm_user_lists()
+    await health.probe()
+    response = await client.get("/readyz")
+    assert response.status == 200
+
+    mongo.ping.side_effect = DependencyUnavailable("mongo", "no answer")
+    await health.probe()
+    assert (await client.get("/readyz")).status == 503
+
+
+@pytest.mark.asyncio
+async def test_stats(
+    client: TestClient, fur_stream: FurStream, raw_data_example: dict, mock_response
+):
+    fur_stream.on_response = AsyncMock()
+    await fur_stream.on_data(json.dumps(raw_data_example))
+    failed_filter = MagicMock()
+    failed_filter.name = "MinimumFollowersFilter"
+    mock_response.failed_filters = [failed_filter]
+    await fur_stream.on_failed_filters(mock_response)
+
+    response = await client.get("/stats")
+    assert response.status == 200
+    stats = await response.json()
+    assert stats["tweets"] == {
+        "received": 1,
+        "retweeted": 0,
+        "not_retweeted": 1,
+        "rejected_by_filter": {"MinimumFollowersFilter": 1},
+    }
+    assert stats["accounts"]["main"]["populated"] is False
+    assert stats["campaigns"]["default"]["weekdays"] == [4]
+    assert stats["selection_pending"] == 0
@@ -0,0 +1,89 @@
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+import pytest_asyncio
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+import furretweet.http_session as http_session
+from furretweet.campaigns import CampaignSchedule
+from furretweet.http_session import SessionWarmer, TwitterSession
+from furretweet.metrics import metrics
+
+
+@pytest.fixture(autouse=True)
+def clear_metrics():
+    metrics.clear()
+
+
+@pytest_asyncio.fixture
+async def server():
+    app = web.Application()
+    app.router.add_route("*", "/{tail:.*}", lambda request: web.Response(text="ok"))
+    server = TestServer(app)
+    await server.start_server()
+    yield server
+    await server.close()
+
+
+@pytest_asyncio.fixture
+async def session():
+    session = TwitterSession(limit=4)
+    yield session
+    await session.close()
+
+
+@pytest.mark.asyncio
+async def test_attach_shares_the_session(session: TwitterSession):
+    clients = [SimpleNamespace(session=None), SimpleNamespace(session=None)]
+    await session.attach(clients)
+    assert all(client.session is session.session for client in clients)
+
+    # A reopened session is handed to the attached clients again
+    await session.close()
+    await session.open()
+    assert all(client.session is session.session for client in clients)
+
+
+@pytest.mark.asyncio
+async def test_connection_reuse_metrics(session: TwitterSession, server: TestServer):
+    aiohttp_session = await session.open()
+    for _ in range(3):
+        async with aiohttp_session.get(server.make_url("/2/tweets")) as response:
+            await response.read()
+
+    assert metrics.counter("http_connections_created_total").value == 1
+    assert metrics.counter("http_connections_reused_total").value == 2
+    assert metrics.gauge("http_connection_reuse_ratio").value == pytest.approx(2 / 3)
+    assert metrics.histogram("http_connection_handshake_seconds").count == 1
+
+
+@pytest.mark.asyncio
+async def test_prewarm(session: TwitterSession, server: TestServer, monkeypatch):
+    monkeypatch.setattr(http_session, "TWITTER_API_URL", str(server.make_url("")).rstrip("/"))
+    await session.prewarm(connections=2)
+    assert metrics.counter("http_connections_created_total").value == 2
+    assert metrics.counter("http_prewarms_total").value == 1
+
+    async with session.session.get(server.make_url("/2/tweets")) as response:
+        await response.read()
+    assert metrics.counter("http_connections_reused_total").value == 1
+
+
+@pytest.mark.asyncio
+async def test_session_warmer_prewarms_before_the_window_opens():
+    opens_at = datetime(2023, 4, 21, 10, 0, tzinfo=timezone.utc)
+    campaign = MagicMock(schedule=CampaignSchedule(start=opens_at))
+    stream = MagicMock()
+    stream.pipeline.campaigns = [campaign]
+    session = TwitterSession(prewarm_lead=timedelta(minutes=1))
+    session.prewarm = AsyncMock()
+    warmer = SessionWarmer(stream, session)
+
+    assert not await warmer.check(opens_at - timedelta(minutes=5))
+    assert await warmer.check(opens_at - timedelta(seconds=30))
+    # Only once per window
+    assert not await warmer.check(opens_at + timedelta(minutes=5))
+    session.prewarm.assert_awaited_once()
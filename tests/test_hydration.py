@@ -0,0 +1,69 @@
+import asyncio
+import copy
+import pytest
+from freezegun import freeze_time
+from furretweet.hydration import UserCache, UserHydrator
+from furretweet.models import User
+
+
+@pytest.fixture
+def user(raw_data_example: dict) -> User:
+    return User.parse_obj(raw_data_example["includes"]["users"][0])
+
+
+@pytest.fixture
+def hydrator(fake_twitter_api, raw_data_example: dict):
+    for user_id in ("1", "2", "3"):
+        user = copy.deepcopy(raw_data_example["includes"]["users"][0])
+        user["id"] = user_id
+        fake_twitter_api.users[user_id] = user
+    return UserHydrator(fake_twitter_api, batch_delay=0.05)
+
+
+def test_user_cache(user: User):
+    cache = UserCache(ttl=60, max_size=2)
+    assert cache.get(user.id) is None
+
+    with freeze_time("2023-04-14 12:00:00") as frozen_time:
+        cache.put(user)
+        assert cache.get(user.id) == user
+
+        frozen_time.tick(61)
+        assert cache.get(user.id) is None
+        assert len(cache) == 0
+
+
+def test_user_cache_evicts_least_recently_used(user: User):
+    cache = UserCache(max_size=2)
+    users = [user.copy(update={"id": i}) for i in range(3)]
+    cache.put(users[0])
+    cache.put(users[1])
+    cache.get(0)
+    cache.put(users[2])
+
+    assert len(cache) == 2
+    assert cache.get(0) == users[0]
+    assert cache.get(1) is None
+
+
+@pytest.mark.asyncio
+async def test_hydrator_batches_lookups(hydrator: UserHydrator, fake_twitter_api):
+    users = await asyncio.gather(*(hydrator.get_user(i) for i in (1, 2, 3, 2, 4)))
+
+    assert [u.id if u else None for u in users] == [1, 2, 3, 2, None]
+    assert len(fake_twitter_api.calls) == 1
+    assert sorted(fake_twitter_api.calls[0][1]["ids"]) == [1, 2, 3, 4]
+
+    # Resolved users are served from the cache
+    assert (await hydrator.get_user(1)).id == 1
+    assert len(fake_twitter_api.calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_hydrator_rate_limited(hydrator: UserHydrator, fake_twitter_api):
+    fake_twitter_api.remaining["get_users"] = 0
+
+    # Failed lookups resolve to no user instead of raising
+    assert await hydrator.get_user(1) is None
+    assert hydrator.rate_limit_handler.populated
+    assert len(hydrator.cache) == 0
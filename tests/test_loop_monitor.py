@@ -0,0 +1,72 @@
+import asyncio
+import time
+
+import pytest
+from loguru import logger
+
+from furretweet.loop_monitor import LoopLagMonitor
+from furretweet.metrics import metrics
+
+
+@pytest.fixture(autouse=True)
+def clear_metrics():
+    metrics.clear()
+
+
+@pytest.fixture
+def warnings():
+    messages = []
+    handler_id = logger.add(messages.append, level="WARNING", format="{message}")
+    yield messages
+    logger.remove(handler_id)
+
+
+def blocking_call(seconds: float):
+    time.sleep(seconds)
+
+
+async def blocking_coroutine():
+    blocking_call(0.2)
+
+
+@pytest.mark.asyncio
+async def test_lag_is_recorded():
+    monitor = LoopLagMonitor(interval=0.01, warn_threshold=1.0, watchdog=False)
+    await monitor.start()
+    await asyncio.sleep(0.02)
+    # Blocks the loop, the monitor wakes up late
+    time.sleep(0.1)
+    await asyncio.sleep(0.02)
+    await monitor.stop()
+
+    histogram = metrics.histogram("event_loop_lag_seconds")
+    assert histogram.count >= 2
+    assert histogram.sum >= 0.05
+    assert metrics.gauge("event_loop_lag_last_seconds").value >= 0
+
+
+@pytest.mark.asyncio
+async def test_watchdog_logs_the_blocking_stack(warnings: list):
+    monitor = LoopLagMonitor(interval=0.01, warn_threshold=0.05)
+    await monitor.start()
+    await asyncio.sleep(0.02)
+    await asyncio.create_task(blocking_coroutine())
+    await asyncio.sleep(0.02)
+    await monitor.stop()
+
+    assert metrics.counter("event_loop_blocked_total").value == 1
+    blocked = [m for m in warnings if "loop thread stack" in m]
+    assert len(blocked) == 1
+    assert "blocking_coroutine" in blocked[0]
+    assert "in blocking_call" in blocked[0]
+
+
+@pytest.mark.asyncio
+async def test_watchdog_is_quiet_on_a_healthy_loop(warnings: list):
+    monitor = LoopLagMonitor(interval=0.01, warn_threshold=0.05)
+    await monitor.start()
+    await asyncio.sleep(0.15)
+    await monitor.stop()
+
+    assert metrics.counter("event_loop_blocked_total").value == 0
+    assert not warnings
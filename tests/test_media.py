@@ -0,0 +1,214 @@
+import io
+import random
+import pytest
+import pytest_asyncio
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from PIL import Image, ImageDraw
+from unittest.mock import AsyncMock, MagicMock
+from furretweet.filters import DuplicateMediaFilter
+from furretweet.media import (
+    HashEntry,
+    MediaDeduplicator,
+    MediaFetcher,
+    MultiIndexHashTable,
+    dhash,
+)
+from furretweet.models import Media, StreamResponse
+
+
+def make_image(seed: int, size: tuple[int, int] = (400, 300), format: str = "PNG") -> bytes:
+    rng = random.Random(seed)
+    image = Image.new("RGB", size, (255, 255, 255))
+    draw = ImageDraw.Draw(image)
+    for _ in range(12):
+        x, y = rng.randrange(size[0]), rng.randrange(size[1])
+        w, h = rng.randrange(30, 150), rng.randrange(30, 150)
+        color = tuple(rng.randrange(256) for _ in range(3))
+        draw.ellipse((x, y, x + w, y + h), fill=color)
+
+    buffer = io.BytesIO()
+    image.save(buffer, format=format)
+    return buffer.getvalue()
+
+
+def resize_image(data: bytes, size: tuple[int, int], format: str = "JPEG") -> bytes:
+    with Image.open(io.BytesIO(data)) as image:
+        buffer = io.BytesIO()
+        image.convert("RGB").resize(size).save(buffer, format=format, quality=70)
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def images():
+    original = make_image(seed=1)
+    return {
+        "original.png": original,
+        "repost.jpg": resize_image(original, (200, 150)),
+        "other.png": make_image(seed=2),
+    }
+
+
+@pytest_asyncio.fixture
+async def media_server(images: dict[str, bytes]):
+    requests = []
+
+    async def handler(request: web.Request):
+        requests.append(request.match_info["name"])
+        name = request.match_info["name"]
+        if name not in images:
+            raise web.HTTPNotFound()
+        return web.Response(body=images[name], content_type="image/png")
+
+    app = web.Application()
+    app.router.add_get("/media/{name}", handler)
+    server = TestServer(app)
+    await server.start_server()
+    server.requests = requests  # type: ignore
+    yield server
+    await server.close()
+
+
+@pytest.fixture
+def repository():
+    repository = MagicMock()
+    repository.add = AsyncMock()
+    return repository
+
+
+def set_media(response: StreamResponse, tweet_id: int, *media: Media):
+    response.tweet.id = tweet_id
+    response.includes.media = list(media)
+
+
+def photo(server: TestServer, media_key: str, name: str) -> Media:
+    return Media(media_key=media_key, type="photo", url=str(server.make_url(f"/media/{name}")))
+
+
+def test_dhash(images: dict[str, bytes]):
+    original = dhash(images["original.png"])
+    repost = dhash(images["repost.jpg"])
+    other = dhash(images["other.png"])
+
+    assert original.bit_length() <= 64
+    assert (original ^ repost).bit_count() <= 4
+    assert (original ^ other).bit_count() > 10
+
+
+def test_multi_index_hash_table():
+    index = MultiIndexHashTable(max_distance=4)
+    base = 0xF0F0_1234_ABCD_5678
+    index.add(HashEntry(hash=base, media_key="1", tweet_id="1"))
+    index.add(HashEntry(hash=base ^ 0b1011, media_key="2", tweet_id="2"))
+    index.add(HashEntry(hash=~base & (2**64 - 1), media_key="3", tweet_id="3"))
+    # Adding the same media twice is ignored
+    index.add(HashEntry(hash=0, media_key="1", tweet_id="1"))
+
+    assert len(index) == 3
+    assert index.get("1").hash == base  # type: ignore
+
+    matches = index.search(base ^ 0b1)
+    assert [(entry.media_key, distance) for entry, distance in matches] == [("1", 1), ("2", 2)]
+    assert [entry.media_key for entry, _ in index.search(base ^ 0b1, max_distance=1)] == ["1"]
+    assert index.search(base ^ 0b11111) == [(index.get("2"), 2)]
+
+    with pytest.raises(ValueError):
+        index.search(base, max_distance=5)
+
+
+@pytest.mark.asyncio
+async def test_media_deduplicator(
+    media_server: TestServer, repository: MagicMock, mock_response: StreamResponse
+):
+    deduplicator = MediaDeduplicator(repository, fetcher=MediaFetcher(max_concurrency=2))
+
+    set_media(mock_response, 1, photo(media_server, "3_1", "original.png"))
+    assert await deduplicator.check(mock_response, max_distance=4) == []
+    assert repository.add.call_count == 1
+
+    # Processing the same tweet again is not a duplicate
+    assert await deduplicator.check(mock_response, max_distance=4) == []
+
+    # A re-encoded repost in another tweet is a duplicate of the first tweet
+    set_media(
+        mock_response,
+        2,
+        photo(media_server, "3_2", "other.png"),
+        photo(media_server, "3_3", "repost.jpg"),
+    )
+    matches = await deduplicator.check(mock_response, max_distance=4)
+    assert len(matches) == 1
+    assert matches[0].media_key == "3_3"
+    assert matches[0].duplicate_of.tweet_id == "1"
+    assert repository.add.call_count == 3
+
+    # The same upload attached to another tweet doesn't need to be downloaded again
+    set_media(mock_response, 3, photo(media_server, "3_2", "other.png"))
+    matches = await deduplicator.check(mock_response, max_distance=4)
+    assert [(m.duplicate_of.tweet_id, m.distance) for m in matches] == [("2", 0)]
+    assert media_server.requests.count("other.png") == 1  # type: ignore
+
+    # Media that can't be downloaded is never considered a duplicate
+    set_media(mock_response, 4, photo(media_server, "3_4", "missing.png"))
+    assert await deduplicator.check(mock_response, max_distance=4) == []
+
+    await deduplicator.close()
+
+
+@pytest.mark.asyncio
+async def test_media_deduplicator_fetch(
+    media_server: TestServer, repository: MagicMock, mock_response: StreamResponse
+):
+    deduplicator = MediaDeduplicator(repository)
+    set_media(mock_response, 1, photo(media_server, "3_1", "original.png"))
+
+    # Fetched ahead of the check, without touching the index
+    await deduplicator.fetch(mock_response)
+    assert list(mock_response.media_hashes) == ["3_1"]
+    assert len(deduplicator.index) == 0
+
+    assert await deduplicator.check(mock_response, max_distance=4) == []
+    assert media_server.requests.count("original.png") == 1  # type: ignore
+    assert len(deduplicator.index) == 1
+
+    await deduplicator.close()
+
+
+@pytest.mark.asyncio
+async def test_media_deduplicator_load(repository: MagicMock):
+    async def documents():
+        yield {"_id": "3_1", "hash": "00000000000000ff", "tweet_id": "1"}
+
+    repository.all = documents
+    deduplicator = MediaDeduplicator(repository)
+    await deduplicator.load()
+
+    assert deduplicator.loaded
+    assert deduplicator.index.get("3_1") == HashEntry(hash=0xFF, media_key="3_1", tweet_id="1")
+
+
+@pytest.mark.asyncio
+async def test_duplicate_media_filter(
+    media_server: TestServer, repository: MagicMock, mock_response: StreamResponse
+):
+    furretweet = MagicMock()
+    furretweet.media_deduplicator = MediaDeduplicator(repository)
+    duplicate_media_filter = DuplicateMediaFilter(max_distance=4)
+    await duplicate_media_filter.setup(furretweet)
+
+    set_media(mock_response, 1, photo(media_server, "3_1", "original.png"))
+    await mock_response.prepare_filters([duplicate_media_filter])
+    assert duplicate_media_filter.filter(mock_response)
+    assert duplicate_media_filter.details == {"max_distance": 4, "duplicates": []}
+
+    set_media(mock_response, 2, photo(media_server, "3_2", "repost.jpg"))
+    await mock_response.prepare_filters([duplicate_media_filter])
+    assert not duplicate_media_filter.filter(mock_response)
+    duplicate = duplicate_media_filter.details["duplicates"][0]
+    assert duplicate["media_key"] == "3_2"
+    assert duplicate["duplicate_of_tweet_id"] == "1"
+
+    with pytest.raises(ValueError):
+        await DuplicateMediaFilter(max_distance=10).setup(furretweet)
+
+    await furretweet.media_deduplicator.close()
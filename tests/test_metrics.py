@@ -0,0 +1,40 @@
+import pytest
+from furretweet.metrics import MetricsRegistry
+
+
+def test_counter_and_gauge():
+    registry = MetricsRegistry()
+    registry.counter("retweets_total").inc()
+    registry.counter("retweets_total").inc(2)
+    registry.counter("retweets_total", account="1").inc()
+    registry.gauge("pending").set(5)
+    registry.gauge("pending").dec()
+
+    assert registry.counter("retweets_total").value == 3
+    assert registry.snapshot() == {
+        "retweets_total": [
+            {"labels": {}, "value": 3},
+            {"labels": {"account": "1"}, "value": 1},
+        ],
+        "pending": [{"labels": {}, "value": 4}],
+    }
+
+    with pytest.raises(TypeError):
+        registry.gauge("retweets_total")
+
+
+def test_histogram():
+    registry = MetricsRegistry()
+    histogram = registry.histogram("latency", buckets=(1, 5, 10))
+    for value in (0.5, 1, 3, 7, 20):
+        histogram.observe(value)
+
+    assert histogram.snapshot() == {
+        "count": 5,
+        "sum": 31.5,
+        "buckets": {"1": 2, "5": 3, "10": 4, "+Inf": 5},
+    }
+    assert histogram.quantile(0.5) == 5
+    assert histogram.quantile(0.8) == 10
+    assert histogram.quantile(1) == float("inf")
+    assert registry.histogram("empty").quantile(0.5) == 0
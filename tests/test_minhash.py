@@ -0,0 +1,56 @@
+import pytest
+from furretweet.minhash import LSHEntry, LSHIndex, MinHasher, normalize_text, similarity
+
+SPAM = "Earn 500 dollars a day working from home, click the link in my bio to start today"
+
+
+def test_normalize_text():
+    text = "Check THIS   out #FursuitFriday @FurRetweet\nhttps://t.co/34axngukSE"
+    assert normalize_text(text) == "check this out"
+
+
+def test_minhash_similarity():
+    hasher = MinHasher()
+    signature = hasher.signature(SPAM)
+
+    assert len(signature) == hasher.num_perm
+    assert signature == hasher.signature(SPAM)
+    assert similarity(signature, hasher.signature(SPAM.replace("500", "600"))) > 0.7
+    assert similarity(signature, hasher.signature("My new fursuit head, made by me!")) < 0.2
+
+
+def test_lsh_index_query():
+    hasher = MinHasher()
+    index = LSHIndex(window=60)
+    index.insert(LSHEntry("1", "10", hasher.signature(SPAM), 0))
+    index.insert(LSHEntry("2", "20", hasher.signature(SPAM + "!"), 0))
+    index.insert(LSHEntry("3", "30", hasher.signature("Look at my new fursuit paws"), 0))
+
+    assert len(index) == 3
+    assert sorted(e.key for e in index.query(hasher.signature(SPAM), threshold=0.8)) == ["1", "2"]
+
+    with pytest.raises(ValueError):
+        LSHIndex(num_perm=64, bands=10)
+
+
+def test_lsh_index_evict():
+    hasher = MinHasher()
+    index = LSHIndex(window=60, max_entries=2)
+    signature = hasher.signature(SPAM)
+
+    index.insert(LSHEntry("1", "10", signature, 0))
+    index.insert(LSHEntry("2", "10", signature, 30))
+    assert index.evict(now=70) == 1
+    assert "1" not in index and "2" in index
+
+    # At max_entries the oldest entry makes room even if still in the window
+    index.insert(LSHEntry("3", "10", signature, 71))
+    index.insert(LSHEntry("4", "10", signature, 72))
+    assert len(index) == 2
+    assert "2" not in index
+    assert index.evict(now=72) == 0
+    assert sorted(e.key for e in index.query(signature, threshold=1)) == ["3", "4"]
+
+    assert index.evict(now=1000) == 2
+    assert len(index) == 0
+    assert index.query(signature, threshold=0) == []
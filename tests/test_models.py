@@ -1,3 +1,4 @@
+from datetime import datetime
 import aiohttp
 import pytest
 from furretweet.models import StreamResponse
@@ -87,3 +88,35 @@ def test_str_representation(mock_stream_response: StreamResponse):
     string_representation = str(mock_stream_response)
     expected_str = f"({mock_stream_response.url}) @{mock_stream_response.includes.users[0].username}: {mock_stream_response.tweet.text}"
     assert string_representation == expected_str
+
+
+def test_features(mock_response: StreamResponse):
+    mock_response.tweet.text = "Happy #FursuitFriday!\nNew PAWS https://t.co/34axngukSE"
+    mock_response.tweet.entities["hashtags"] = [{"start": 6, "end": 20, "tag": "FursuitFriday"}]  # type: ignore
+    features = mock_response.features
+
+    assert features.text_lower == "happy #fursuitfriday!\nnew paws https://t.co/34axngukse"
+    assert features.text_without_links == "happy #fursuitfriday!\nnew paws "
+    assert features.new_lines_count == 1
+    assert features.hashtags == ("FursuitFriday",)
+    assert features.hashtags_count == 1
+    assert features.media_types == ("photo",)
+    assert features.author_created_at == mock_response.author.created_at
+    assert features.author_age(mock_response.tweet.created_at).days == 4299
+    # Extracted once
+    assert mock_response.features is features
+
+
+def test_features_follow_edits(mock_response: StreamResponse):
+    features = mock_response.features
+
+    mock_response.tweet.text = "Edited"
+    assert mock_response.features.text_lower == "edited"
+    mock_response.tweet.entities["hashtags"] = [{"tag": "a"}, {"tag": "b"}]  # type: ignore
+    assert mock_response.features.hashtags_count == 2
+    mock_response.includes.media = []
+    assert mock_response.features.media_types == ()
+    author = mock_response.author.copy(update={"created_at": datetime(2022, 1, 1)})
+    mock_response.includes.users = [author]
+    assert mock_response.features.author_created_at == datetime(2022, 1, 1)
+    assert mock_response.features is not features
@@ -0,0 +1,61 @@
+import pytest
+
+from furretweet.normalize import TermIndex, fold_text
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ("Buy NFT", "buy nft"),
+        # Fullwidth letters
+        ("ｎｆｔ", "nft"),
+        # Cyrillic с, р, у, о
+        ("сrурtо", "crypto"),
+        ("p0rn", "porn"),
+        ("cr\u200bypto", "crypto"),
+        ("earn\n\n  money", "earn money"),
+        ("🔞", "🔞"),
+        # Mentions and prices keep their sign
+        ("go @trump", "go @trump"),
+        ("buy $doge", "buy $doge"),
+    ],
+)
+def test_fold_text(text: str, expected: str):
+    assert fold_text(text) == expected
+
+
+def test_term_index_word_boundaries():
+    index = TermIndex.compile(("porn", "fuck me", "🔞"), ("monk", "wip", "fuck me"))
+
+    assert index.find(fold_text("My monkey is wiping the floor")) == []
+    assert index.find(fold_text("Monk suit, still a WIP")) == ["monk", "wip"]
+    assert index.find(fold_text("Fuck\nme")) == ["fuck me"]
+    assert index.find(fold_text("fuck meat")) == []
+    assert index.find(fold_text("hi🔞")) == ["🔞"]
+    assert index.find(fold_text("#FurryPorn")) == ["porn"]
+
+
+def test_term_index_matches_mentions():
+    index = TermIndex.compile(("trump",))
+    assert index.find(fold_text("go @trump")) == ["trump"]
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ("Check my #NFTs", ["nft"]),
+        ("#cryptoart drop", ["crypto"]),
+        ("#NSFWfursuit", ["nsfw"]),
+        ("bitcoins", ["bitcoin"]),
+        ("#Monkey #wiping", []),
+    ],
+)
+def test_term_index_matches_inside_words_by_default(text: str, expected: list[str]):
+    index = TermIndex.compile(("bitcoin", "crypto", "monk", "nft", "nsfw", "wip"), ("monk", "wip"))
+    assert index.find(fold_text(text)) == expected
+
+
+def test_term_index_reports_configured_terms():
+    index = TermIndex.compile(("Crypto",))
+    assert index.find(fold_text("CRYPTO crypto")) == ["Crypto"]
+    assert TermIndex.compile(()).find("anything") == []
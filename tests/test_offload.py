@@ -0,0 +1,105 @@
+import time
+
+import pytest
+
+from furretweet.filters import BannedTermsFilter, FilterResult
+from furretweet.metrics import metrics
+from furretweet.models import StreamResponse, TweetSnapshot
+from furretweet.offload import FilterOffloader
+from furretweet.pipeline import FilterSpec, PipelineConfigError, build_filter
+
+
+class SlowFilter(BannedTermsFilter):
+    cpu_bound = True
+
+    def check(self, snapshot: TweetSnapshot) -> FilterResult:
+        time.sleep(0.5)
+        return super().check(snapshot)
+
+
+@pytest.fixture(autouse=True)
+def clear_metrics():
+    metrics.clear()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("kind", ["thread", "process"])
+async def test_offloaded_result(mock_response: StreamResponse, kind: str):
+    offloader = FilterOffloader(kind=kind, max_workers=1)
+    banned_terms_filter = BannedTermsFilter(["crypto"])
+    banned_terms_filter.cpu_bound = True
+    mock_response.tweet.text = "Buy some CRYPTO"
+
+    try:
+        await mock_response.prepare_filters([banned_terms_filter], offloader)
+    finally:
+        offloader.shutdown()
+
+    assert banned_terms_filter.offloaded == (
+        mock_response.tweet.id,
+        FilterResult(passed=False, details={"terms_found": ["crypto"]}),
+    )
+    assert not banned_terms_filter.filter(mock_response)
+    assert banned_terms_filter.details == {"terms_found": ["crypto"]}
+    assert banned_terms_filter.offloaded is None
+    assert metrics.histogram("offload_seconds", filter="BannedTermsFilter").count == 1
+
+
+@pytest.mark.asyncio
+async def test_inline_without_offloaded_result(mock_response: StreamResponse):
+    banned_terms_filter = BannedTermsFilter(["crypto"])
+    mock_response.tweet.text = "Buy some crypto"
+    # A result left by another tweet is ignored
+    banned_terms_filter.offloaded = (mock_response.tweet.id + 1, FilterResult(True, {}))
+
+    await mock_response.prepare_filters([banned_terms_filter])
+    assert not banned_terms_filter.filter(mock_response)
+
+
+@pytest.mark.asyncio
+async def test_timeout_fallback(mock_response: StreamResponse):
+    offloader = FilterOffloader(kind="thread", timeout=0.05)
+    slow_filter = SlowFilter(["crypto"])
+    slow_filter.offload_fallback = False
+    mock_response.tweet.text = "Nothing banned here"
+
+    try:
+        await mock_response.prepare_filters([slow_filter], offloader)
+    finally:
+        offloader.shutdown()
+
+    assert not slow_filter.filter(mock_response)
+    assert slow_filter.details == {"terms_found": []}
+    assert metrics.counter("offload_timeouts_total", filter="SlowFilter").value == 1
+
+
+@pytest.mark.asyncio
+async def test_timeout_isnt_checked_again_inline(mock_response: StreamResponse):
+    offloader = FilterOffloader(kind="thread", timeout=0.05)
+    slow_filter = SlowFilter(["crypto"])
+    mock_response.tweet.text = "Nothing banned here"
+
+    start = time.perf_counter()
+    try:
+        await mock_response.prepare_filters([slow_filter], offloader)
+        # Rejected by default, without waiting for the slow check on the loop
+        assert not slow_filter.filter(mock_response)
+        assert time.perf_counter() - start < 0.4
+    finally:
+        offloader.shutdown()
+
+
+def test_build_filter_offload_params():
+    f = build_filter(
+        FilterSpec(
+            type="BannedTermsFilter", banned_terms=["x"], offload=False, offload_fallback=True
+        )
+    )
+    assert not f.cpu_bound
+    assert f.offload_fallback is True
+    # Checked inline unless offloading is asked for
+    assert not build_filter(FilterSpec(type="BannedTermsFilter")).cpu_bound
+    assert build_filter(FilterSpec(type="BannedTermsFilter", offload=True)).cpu_bound
+
+    with pytest.raises(PipelineConfigError):
+        build_filter(FilterSpec(type="MaximumHashtagsFilter", offload=True))
@@ -0,0 +1,253 @@
+import os
+import pytest
+from unittest.mock import MagicMock, AsyncMock
+from tweepy import StreamRule
+from furretweet.filters import BannedTermsFilter, MinimumFollowersFilter, NsfwFilter
+from furretweet.pipeline import (
+    CampaignSpec,
+    FilterSpec,
+    PipelineConfigError,
+    PipelineSpec,
+    PipelineWatcher,
+    StreamRuleSpec,
+    build_filter,
+    compile_pipeline,
+    load_pipeline,
+    sync_stream_rules,
+)
+
+PIPELINE_TOML = """
+required_terms = ["#FursuitFriday"]
+
+[[stream_rules]]
+value = "#FursuitFriday has:media"
+tag = "FurretweetRules"
+
+[[default_filters]]
+type = "BannedTermsFilter"
+banned_terms = ["crypto"]
+
+[[default_filters]]
+type = "MinimumFollowersFilter"
+min_followers = 500
+
+[[whitelist_filters]]
+type = "NsfwFilter"
+"""
+
+
+@pytest.fixture
+def pipeline_path(tmp_path):
+    path = tmp_path / "pipeline.toml"
+    path.write_text(PIPELINE_TOML)
+    return str(path)
+
+
+def test_build_filter():
+    min_followers_filter = build_filter(
+        FilterSpec(type="MinimumFollowersFilter", min_followers=10)
+    )
+    assert isinstance(min_followers_filter, MinimumFollowersFilter)
+    assert min_followers_filter.min_followers == 10
+
+    with pytest.raises(PipelineConfigError):
+        build_filter(FilterSpec(type="DoesNotExistFilter"))
+
+    with pytest.raises(PipelineConfigError):
+        build_filter(FilterSpec(type="BaseFilter"))
+
+    with pytest.raises(PipelineConfigError):
+        build_filter(FilterSpec(type="MinimumFollowersFilter", unknown=1))
+
+
+def test_default_pipeline_matches_defaults():
+    pipeline = compile_pipeline(PipelineSpec())
+
+    assert [f.name for f in pipeline.default_filters] == [
+        "BannedTermsFilter",
+        "MinimumFollowersFilter",
+        "NsfwFilter",
+        "MinimumAccountAgeFilter",
+        "MediaFilter",
+        "MaximumHashtagsFilter",
+        "MaximumNewLinesFilter",
+        "FursuitFridayOnlyFilter",
+    ]
+    assert [f.name for f in pipeline.whitelist_filters] == ["NsfwFilter", "MediaFilter"]
+    assert pipeline.default_filters[0].banned_terms == BannedTermsFilter.banned_terms
+
+
+def test_load_pipeline(pipeline_path: str):
+    pipeline = load_pipeline(pipeline_path)
+
+    assert pipeline.required_terms == ["#fursuitfriday"]
+    assert pipeline.stream_rules == [
+        StreamRule(value="#FursuitFriday has:media", tag="FurretweetRules")
+    ]
+    assert isinstance(pipeline.default_filters[0], BannedTermsFilter)
+    assert pipeline.default_filters[0].banned_terms == ["crypto"]
+    assert pipeline.default_filters[1].min_followers == 500
+    assert isinstance(pipeline.whitelist_filters[0], NsfwFilter)
+
+
+def test_compile_campaigns():
+    spec = PipelineSpec(
+        campaigns=[
+            CampaignSpec(
+                name="anthrocon",
+                required_terms=["#Anthrocon"],
+                stream_rules=[StreamRuleSpec(value="#Anthrocon has:media", tag="Anthrocon")],
+                default_filters=[FilterSpec(type="NsfwFilter")],
+            )
+        ]
+    )
+    pipeline = compile_pipeline(spec)
+    default, anthrocon = pipeline.campaigns
+
+    assert pipeline.default_campaign is default
+    assert pipeline.routes == {"FurretweetRules": default, "Anthrocon": anthrocon}
+    assert pipeline.stream_rules == default.stream_rules + anthrocon.stream_rules
+    assert [f.name for f in anthrocon.default_filters] == ["NsfwFilter"]
+    assert anthrocon.matches("Hello #AnthroCon")
+
+    assert pipeline.route(["Anthrocon", "FurretweetRules"]) == [anthrocon, default]
+    # Unknown or missing tags go to the default campaign
+    assert pipeline.route(["Unknown"]) == [default]
+    assert pipeline.route([]) == [default]
+
+
+def test_compile_campaigns_invalid():
+    rule = StreamRuleSpec(value="#Anthrocon", tag="Anthrocon")
+
+    with pytest.raises(PipelineConfigError, match="Duplicate campaign"):
+        compile_pipeline(PipelineSpec(campaigns=[CampaignSpec(name="default")]))
+
+    with pytest.raises(PipelineConfigError, match="no tag"):
+        untagged = CampaignSpec(name="anthrocon", stream_rules=[rule.copy(update={"tag": None})])
+        compile_pipeline(PipelineSpec(campaigns=[untagged]))
+
+    with pytest.raises(PipelineConfigError, match="used by campaigns"):
+        compile_pipeline(
+            PipelineSpec(
+                campaigns=[
+                    CampaignSpec(name="a", stream_rules=[rule]),
+                    CampaignSpec(name="b", stream_rules=[rule]),
+                ]
+            )
+        )
+
+
+def test_load_pipeline_invalid(tmp_path):
+    path = tmp_path / "pipeline.toml"
+
+    path.write_text("default_filters = [")
+    with pytest.raises(PipelineConfigError):
+        load_pipeline(str(path))
+
+    path.write_text("[[default_filters]]\nmin_followers = 10\n")
+    with pytest.raises(PipelineConfigError):
+        load_pipeline(str(path))
+
+
+@pytest.mark.asyncio
+async def test_sync_stream_rules():
+    stream = MagicMock()
+    stream.get_rules = AsyncMock(
+        return_value=MagicMock(
+            data=[
+                StreamRule(value="#FursuitFriday", tag="FurretweetRules", id="1"),
+                StreamRule(value="#OldHashtag", tag="FurretweetRules", id="2"),
+            ]
+        )
+    )
+    stream.add_rules = AsyncMock(return_value=MagicMock(errors=[]))
+    stream.delete_rules = AsyncMock(return_value=MagicMock(errors=[]))
+
+    new_rule = StreamRule(value="#NewHashtag", tag="FurretweetRules")
+    await sync_stream_rules(
+        stream, [StreamRule(value="#FursuitFriday", tag="FurretweetRules"), new_rule]
+    )
+
+    stream.add_rules.assert_called_once_with(add=[new_rule])
+    stream.delete_rules.assert_called_once_with(["2"])
+
+
+@pytest.mark.asyncio
+async def test_sync_stream_rules_refused():
+    stream = MagicMock()
+    stream.get_rules = AsyncMock(
+        return_value=MagicMock(
+            data=[StreamRule(value="#OldHashtag", tag="FurretweetRules", id="2")]
+        )
+    )
+    # Twitter answers invalid rules with errors instead of raising
+    errors = [{"title": "UnprocessableEntity", "value": "#New(Hashtag"}]
+    stream.add_rules = AsyncMock(return_value=MagicMock(errors=errors))
+    stream.delete_rules = AsyncMock()
+
+    with pytest.raises(PipelineConfigError):
+        await sync_stream_rules(stream, [StreamRule(value="#New(Hashtag", tag="FurretweetRules")])
+
+    # The old rules keep matching
+    stream.delete_rules.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_sync_stream_rules_up_to_date():
+    rule = StreamRule(value="#FursuitFriday", tag="FurretweetRules")
+    stream = MagicMock()
+    stream.get_rules = AsyncMock(return_value=MagicMock(data=[rule._replace(id="1")]))
+    stream.add_rules = AsyncMock()
+    stream.delete_rules = AsyncMock()
+
+    await sync_stream_rules(stream, [rule])
+
+    stream.add_rules.assert_not_called()
+    stream.delete_rules.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_pipeline_watcher(pipeline_path: str):
+    on_reload = AsyncMock()
+    watcher = PipelineWatcher(pipeline_path, on_reload=on_reload)
+
+    # Unchanged file, nothing to reload
+    assert not await watcher.check()
+
+    with open(pipeline_path, "a") as f:
+        f.write('\n[[whitelist_filters]]\ntype = "MediaFilter"\n')
+    os.utime(pipeline_path, ns=(0, 1))
+
+    assert await watcher.check()
+    pipeline = on_reload.call_args.args[0]
+    assert [f.name for f in pipeline.whitelist_filters] == ["NsfwFilter", "MediaFilter"]
+
+    # An invalid config is ignored and the current pipeline is kept
+    on_reload.reset_mock()
+    with open(pipeline_path, "a") as f:
+        f.write("\n[[whitelist_filters]]\n")
+    os.utime(pipeline_path, ns=(0, 2))
+
+    assert not await watcher.check()
+    on_reload.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_pipeline_watcher_retries_failed_reload(pipeline_path: str):
+    on_reload = AsyncMock(side_effect=[ConnectionError("twitter is down"), None])
+    watcher = PipelineWatcher(pipeline_path, on_reload=on_reload)
+    os.utime(pipeline_path, ns=(0, 1))
+
+    with pytest.raises(ConnectionError):
+        await watcher.check()
+    # The file didn't change since, it is reloaded again
+    assert await watcher.check()
+    assert not await watcher.check()
+    assert on_reload.call_count == 2
+
+    # Rules Twitter refuses are an invalid config, not tried again
+    on_reload.side_effect = PipelineConfigError("Twitter refused stream rules")
+    os.utime(pipeline_path, ns=(0, 2))
+    assert not await watcher.check()
+    assert not await watcher.check()
+    assert on_reload.call_count == 3
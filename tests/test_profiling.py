@@ -0,0 +1,179 @@
+import asyncio
+import os
+import pstats
+import signal
+import time
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+import pytest_asyncio
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+from freezegun import freeze_time
+
+from furretweet.metrics import metrics
+from furretweet.models import StreamResponse
+from furretweet.profiling import Profiler, ProfilerBusy, StageClock, StageTimings
+from furretweet.stream import FurStream
+
+
+@pytest.fixture(autouse=True)
+def clear_metrics():
+    metrics.clear()
+
+
+def busy_handler(seconds: float):
+    # Blocks the event loop, as a slow filter would
+    time.sleep(seconds)
+
+
+async def block_loop(seconds: float):
+    await asyncio.sleep(0.02)
+    busy_handler(seconds)
+
+
+@pytest.mark.asyncio
+async def test_sample_profile(tmp_path):
+    profiler = Profiler(tmp_path, sample_interval=0.001)
+    blocker = asyncio.create_task(block_loop(0.1))
+    path = await profiler.run(0.2)
+    await blocker
+
+    assert path.suffix == ".folded"
+    lines = path.read_text().splitlines()
+    # Root first, ending with the count of samples
+    busy = [line for line in lines if "busy_handler" in line]
+    assert busy
+    stack, count = busy[0].rsplit(" ", 1)
+    assert stack.split(";")[-1].startswith("busy_handler (test_profiling.py:")
+    assert int(count) > 0
+
+
+@pytest.mark.asyncio
+async def test_cprofile_profile(tmp_path):
+    profiler = Profiler(tmp_path)
+    blocker = asyncio.create_task(block_loop(0.05))
+    path = await profiler.run(0.1, mode="cprofile")
+    await blocker
+
+    stats = pstats.Stats(str(path))
+    assert any(function == "busy_handler" for _, _, function in stats.stats)
+    assert metrics.counter("profiles_total", mode="cprofile").value == 1
+
+
+@pytest.mark.asyncio
+async def test_one_profile_at_a_time(tmp_path):
+    profiler = Profiler(tmp_path, max_seconds=1)
+    with pytest.raises(ValueError):
+        await profiler.run(2)
+    with pytest.raises(ValueError):
+        await profiler.run(0.1, mode="perf")
+
+    running = asyncio.create_task(profiler.run(0.05))
+    await asyncio.sleep(0)
+    with pytest.raises(ProfilerBusy):
+        await profiler.run(0.05)
+    await running
+
+
+@pytest.mark.asyncio
+async def test_signal_starts_a_profile(tmp_path):
+    profiler = Profiler(tmp_path, default_seconds=0.05)
+    profiler.install_signal_handler(signal.SIGUSR2)
+    try:
+        os.kill(os.getpid(), signal.SIGUSR2)
+        await asyncio.sleep(0.01)
+        assert profiler.running
+        await asyncio.sleep(0.2)
+    finally:
+        asyncio.get_running_loop().remove_signal_handler(signal.SIGUSR2)
+    assert len(list(tmp_path.glob("*.folded"))) == 1
+
+
+def test_stage_timings_table():
+    timings = StageTimings(maxlen=2)
+    for milliseconds in (100, 1, 3):
+        timings.record({"parse": milliseconds / 1000, "filters": 0.002})
+
+    # The oldest tweet was dropped
+    assert timings.table() == [
+        {
+            "stage": "parse",
+            "count": 2,
+            "mean_ms": 2.0,
+            "p50_ms": 3.0,
+            "p95_ms": 3.0,
+            "max_ms": 3.0,
+        },
+        {
+            "stage": "filters",
+            "count": 2,
+            "mean_ms": 2.0,
+            "p50_ms": 2.0,
+            "p95_ms": 2.0,
+            "max_ms": 2.0,
+        },
+    ]
+    assert timings.format().splitlines()[0] == "Last 2 tweets, in ms"
+
+
+def test_stage_clock_adds_up_laps():
+    clock = StageClock({})
+    clock("parse")
+    clock("filters")
+    clock("filters")
+    assert list(clock.timings) == ["parse", "filters"]
+
+
+@pytest.mark.asyncio
+async def test_stream_records_stage_timings(mock_response: StreamResponse):
+    furretweet = MagicMock()
+    furretweet.get_blacklist = AsyncMock(return_value=[])
+    furretweet.get_whitelist = AsyncMock(return_value=[])
+    stream = FurStream(bearer_token="token", furretweet=furretweet)
+    stream.selector.submit = AsyncMock()
+
+    # On a Friday, when the default campaign is active
+    with freeze_time("2022-04-22 12:00:00"):
+        await stream._process(mock_response, stream.pipeline.default_campaign)
+
+    stages = [row["stage"] for row in stream.stage_timings.table()]
+    assert stages == [
+        "fetch_filters",
+        "lock_wait",
+        "user_lists",
+        "prepare_filters",
+        "filters",
+        "decision",
+        "total",
+    ]
+
+
+@pytest_asyncio.fixture
+async def admin_client(tmp_path):
+    timings = StageTimings()
+    timings.record({"parse": 0.001})
+    profiler = Profiler(tmp_path, stage_timings=timings)
+    app = web.Application()
+    profiler.install(app, "admin-token")
+    client = TestClient(TestServer(app))
+    await client.start_server()
+    yield client
+    await client.close()
+
+
+@pytest.mark.asyncio
+async def test_admin_endpoints(admin_client: TestClient):
+    headers = {"Authorization": "Bearer admin-token"}
+    assert (await admin_client.post("/admin/profile?seconds=0.01")).status == 401
+    assert (await admin_client.get("/admin/stages")).status == 401
+
+    response = await admin_client.post("/admin/profile?seconds=0.01", headers=headers)
+    assert response.status == 200
+    assert (await response.json())["path"].endswith(".folded")
+
+    response = await admin_client.post("/admin/profile?seconds=forever", headers=headers)
+    assert response.status == 400
+
+    response = await admin_client.get("/admin/stages", headers=headers)
+    assert (await response.json())[0]["stage"] == "parse"
@@ -1,6 +1,6 @@
 import pytest
 from datetime import datetime, timezone, timedelta
-from furretweet.rate_limiter import RetweetLimitHandler
+from furretweet.rate_limiter import AuthorRetweetCounter, RetweetLimitHandler
 from freezegun import freeze_time
 
 
@@ -55,6 +55,20 @@ def test_update_limits():
     assert handler.limit == 15
 
 
+def test_update_limits_exhausted():
+    handler = RetweetLimitHandler()
+    reset = int(datetime.now(timezone.utc).timestamp()) + 10
+    handler.update_limits({"x-rate-limit-remaining": "1", "x-rate-limit-reset": str(reset)})
+    handler.update_limits({"x-rate-limit-remaining": "0", "x-rate-limit-reset": str(reset)})
+
+    assert handler.remaining == 0
+    assert handler.is_limit_exceeded()
+
+    # Missing headers leave the known limits untouched
+    handler.update_limits({})
+    assert handler.remaining == 0
+
+
 def test_seconds_until_reset():
     initial_datetime = datetime(year=1, month=7, day=12, hour=15, minute=6, second=3)
 
@@ -67,3 +81,44 @@ def test_seconds_until_reset():
 
         frozen_datetime.tick(delta=timedelta(seconds=5))
         assert handler.seconds_until_reset == 15
+
+
+def test_author_retweet_counter():
+    initial_datetime = datetime(year=2023, month=4, day=14, hour=12, tzinfo=timezone.utc)
+
+    with freeze_time(initial_datetime) as frozen_datetime:
+        counter = AuthorRetweetCounter(max_retweets=2, period=timedelta(hours=10))
+        assert counter.count("1") == 0
+        assert not counter.is_capped("1")
+
+        counter.record("1")
+        frozen_datetime.tick(delta=timedelta(hours=1))
+        retweets = counter.record("1")
+        assert retweets == [initial_datetime, initial_datetime + timedelta(hours=1)]
+        assert counter.count("1") == 2
+        assert counter.is_capped("1")
+        assert not counter.is_capped("2")
+
+        # The ring buffer only keeps the last max_retweets retweets
+        frozen_datetime.tick(delta=timedelta(hours=1))
+        assert counter.record("1")[0] == initial_datetime + timedelta(hours=1)
+
+        # Retweets older than the period don't count anymore
+        frozen_datetime.tick(delta=timedelta(hours=9, minutes=30))
+        assert counter.count("1") == 1
+        frozen_datetime.tick(delta=timedelta(hours=1))
+        assert counter.count("1") == 0
+
+        counter.record("2")
+        counter.prune()
+        assert len(counter) == 1
+        assert counter.count("2") == 1
+
+
+def test_author_retweet_counter_restore():
+    counter = AuthorRetweetCounter(max_retweets=2, period=timedelta(hours=10))
+    now = datetime.now(timezone.utc)
+    counter.restore("1", [now, now - timedelta(hours=1), now - timedelta(hours=2)])
+
+    assert counter.count("1") == 2
+    assert counter.is_capped("1")
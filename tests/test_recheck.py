@@ -0,0 +1,185 @@
+import asyncio
+import copy
+import pytest
+from freezegun import freeze_time
+from unittest.mock import AsyncMock, MagicMock
+from furretweet.filters import MinimumEngagementFilter, MinimumFollowersFilter, NsfwFilter
+from furretweet.models import StreamResponse
+from furretweet.pipeline import FilterSpec, PipelineSpec, RecheckSpec, compile_pipeline
+from furretweet.recheck import RecheckQueue, build_responses
+from furretweet.resilience import CircuitBreaker
+
+
+@pytest.fixture
+def stream(fake_twitter_api):
+    stream = MagicMock()
+    stream.client = fake_twitter_api
+    stream.twitter_breaker = CircuitBreaker("twitter")
+    stream.pipeline = compile_pipeline(
+        PipelineSpec(
+            default_filters=[
+                FilterSpec(type="MinimumFollowersFilter", min_followers=10_000),
+                FilterSpec(type="NsfwFilter"),
+            ],
+            recheck=RecheckSpec(soft_filters=["MinimumFollowersFilter"], min_engagement=100),
+        )
+    )
+    stream.selector.submit = AsyncMock()
+    stream._processing_lock = asyncio.Lock()
+    stream.user_list = AsyncMock(return_value=[])
+    return stream
+
+
+@pytest.fixture
+def recheck_queue(stream: MagicMock):
+    return RecheckQueue(stream)
+
+
+def make_tweet(raw_data_example: dict, tweet_id: int, likes: int) -> dict:
+    raw_data = copy.deepcopy(raw_data_example)
+    raw_data["data"]["id"] = str(tweet_id)
+    raw_data["data"]["public_metrics"]["like_count"] = likes
+    return raw_data
+
+
+def make_response(raw_data: dict) -> StreamResponse:
+    payload = {"data": [raw_data["data"]], "includes": raw_data["includes"]}
+    response = build_responses(MagicMock(), payload)[0]
+    response.failed_filters = [MinimumFollowersFilter(10_000)]
+    return response
+
+
+def test_build_responses(raw_data_example: dict):
+    payload = {
+        "data": [raw_data_example["data"], {**raw_data_example["data"], "author_id": "1"}],
+        "includes": raw_data_example["includes"],
+    }
+    responses = build_responses(MagicMock(), payload)
+
+    # Tweets without their author in the includes are skipped
+    assert len(responses) == 1
+    assert responses[0].author.username == "DonovanCarmona"
+    assert responses[0].includes.media[0].media_key == "3_1517533153853902848"
+    assert build_responses(MagicMock(), {"meta": {"result_count": 0}}) == []
+
+
+def test_is_borderline(recheck_queue: RecheckQueue, mock_response: StreamResponse):
+    mock_response.failed_filters = [MinimumFollowersFilter(10_000)]
+    assert recheck_queue.is_borderline(mock_response)
+
+    mock_response.failed_filters = [MinimumFollowersFilter(10_000), NsfwFilter()]
+    assert not recheck_queue.is_borderline(mock_response)
+
+    mock_response.failed_filters = []
+    assert not recheck_queue.is_borderline(mock_response)
+
+
+def test_recheck_filters(recheck_queue: RecheckQueue, mock_response: StreamResponse):
+    recheck_filters = recheck_queue.recheck_filters(mock_response)
+
+    assert [f.name for f in recheck_filters] == ["NsfwFilter", "MinimumEngagementFilter"]
+    assert isinstance(recheck_filters[-1], MinimumEngagementFilter)
+    assert recheck_filters[-1].min_engagement == 100
+
+
+@pytest.mark.asyncio
+@freeze_time("2022-04-22 12:00:00")
+async def test_run_once(
+    recheck_queue: RecheckQueue, stream: MagicMock, fake_twitter_api, raw_data_example: dict
+):
+    popular = make_tweet(raw_data_example, 1, likes=10)
+    unpopular = make_tweet(raw_data_example, 2, likes=10)
+    deleted = make_tweet(raw_data_example, 3, likes=10)
+    for raw_data in (popular, unpopular, deleted):
+        recheck_queue.defer(make_response(raw_data), delay=0)
+    # Not due yet
+    recheck_queue.defer(make_response(make_tweet(raw_data_example, 4, likes=0)))
+
+    # The tweet got popular since it was streamed
+    fake_twitter_api.add_tweet(make_tweet(raw_data_example, 1, likes=500))
+    fake_twitter_api.add_tweet(unpopular)
+
+    await recheck_queue.run_once()
+
+    assert len(fake_twitter_api.calls) == 1
+    endpoint, params = fake_twitter_api.calls[0]
+    assert endpoint == "get_tweets"
+    assert sorted(params["ids"]) == [1, 2, 3]
+    assert params["user_auth"]
+
+    stream.selector.submit.assert_called_once()
+    rescued = stream.selector.submit.call_args.args[0]
+    assert rescued.tweet.id == 1
+    assert rescued.tweet.public_metrics.like_count == 500
+    assert len(recheck_queue) == 1
+    assert recheck_queue.rate_limit_handler.populated
+
+
+@pytest.mark.asyncio
+async def test_run_once_batches(
+    recheck_queue: RecheckQueue, fake_twitter_api, raw_data_example: dict
+):
+    for tweet_id in range(250):
+        recheck_queue.defer(make_response(make_tweet(raw_data_example, tweet_id, 0)), delay=0)
+
+    await recheck_queue.run_once()
+
+    assert [len(params["ids"]) for _, params in fake_twitter_api.calls] == [100, 100, 50]
+    assert len(recheck_queue) == 0
+
+
+@pytest.mark.asyncio
+async def test_run_once_rate_limited(
+    recheck_queue: RecheckQueue, stream: MagicMock, fake_twitter_api, raw_data_example: dict
+):
+    fake_twitter_api.remaining["get_tweets"] = 0
+    recheck_queue.defer(make_response(make_tweet(raw_data_example, 1, likes=0)), delay=0)
+
+    await recheck_queue.run_once()
+
+    # Deferred again until the limit resets
+    assert len(recheck_queue) == 1
+    assert recheck_queue.rate_limit_handler.populated
+    stream.selector.submit.assert_not_called()
+
+    # Nothing is due, and no request is made while the limit is exceeded
+    recheck_queue.rate_limit_handler.remaining = 0
+    await recheck_queue.run_once()
+    assert len(fake_twitter_api.calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_recheck_skips_blacklisted_and_inactive(
+    recheck_queue: RecheckQueue, stream: MagicMock, raw_data_example: dict
+):
+    response = make_response(make_tweet(raw_data_example, 1, likes=500))
+
+    # On a Monday the default campaign is no longer active
+    with freeze_time("2022-04-25 12:00:00"):
+        await recheck_queue.recheck(response)
+    stream.selector.submit.assert_not_called()
+
+    stream.user_list.return_value = [response.author.id]
+    with freeze_time("2022-04-22 12:00:00"):
+        await recheck_queue.recheck(response)
+    stream.selector.submit.assert_not_called()
+
+    stream.user_list.return_value = []
+    with freeze_time("2022-04-22 12:00:00"):
+        await recheck_queue.recheck(response)
+    stream.selector.submit.assert_called_once_with(response)
+
+
+@pytest.mark.asyncio
+async def test_recheck_waits_for_the_stream(
+    recheck_queue: RecheckQueue, stream: MagicMock, raw_data_example: dict
+):
+    response = make_response(make_tweet(raw_data_example, 1, likes=500))
+    async with stream._processing_lock:
+        recheck = asyncio.create_task(recheck_queue.recheck(response))
+        await asyncio.sleep(0.01)
+        # The stream is processing a tweet with the same filters
+        assert not recheck.done()
+    with freeze_time("2022-04-22 12:00:00"):
+        await recheck
+    stream.selector.submit.assert_called_once()
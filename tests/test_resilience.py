@@ -0,0 +1,181 @@
+import asyncio
+from datetime import timedelta
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from freezegun import freeze_time
+from pymongo.errors import AutoReconnect
+from tweepy.errors import Forbidden, TwitterServerError
+
+from furretweet.accounts import AccountPool, RetweetAccount
+from furretweet.database import AuthorRetweetsRepository
+from furretweet.metrics import metrics
+from furretweet.models import StreamResponse
+from furretweet.pipeline import PipelineSpec, SelectionSpec, compile_pipeline
+from furretweet.resilience import (
+    MONGO_FAILURES,
+    TWITTER_FAILURES,
+    BreakerState,
+    CircuitBreaker,
+    CircuitOpen,
+    DependencyUnavailable,
+)
+from furretweet.stream import FurStream
+from tests.conftest import FakeResponse
+
+
+@pytest.fixture(autouse=True)
+def clear_metrics():
+    metrics.clear()
+
+
+def failing(exception: Exception):
+    async def call():
+        raise exception
+
+    return call
+
+
+async def succeeding():
+    return "ok"
+
+
+async def hanging(*args, **kwargs):
+    await asyncio.Event().wait()
+
+
+def server_error() -> TwitterServerError:
+    return TwitterServerError(FakeResponse({}, status=503), response_json={})
+
+
+@pytest.mark.asyncio
+async def test_breaker_opens_then_half_opens():
+    breaker = CircuitBreaker(
+        "twitter", failure_threshold=2, reset_timeout=30, failures=TWITTER_FAILURES
+    )
+    with freeze_time() as clock:
+        for _ in range(2):
+            with pytest.raises(DependencyUnavailable):
+                await breaker.call(failing(server_error()))
+        assert breaker.state is BreakerState.OPEN
+        assert metrics.gauge("circuit_breaker_state", dependency="twitter").value == 2
+
+        # Fails fast without calling the dependency
+        call = AsyncMock()
+        with pytest.raises(CircuitOpen):
+            await breaker.call(call)
+        call.assert_not_called()
+        assert metrics.counter("circuit_breaker_rejected_total", dependency="twitter").value == 1
+
+        # A failed trial opens it again for another reset_timeout
+        clock.tick(timedelta(seconds=30))
+        assert breaker.state is BreakerState.HALF_OPEN
+        with pytest.raises(DependencyUnavailable):
+            await breaker.call(failing(server_error()))
+        assert breaker.state is BreakerState.OPEN
+
+        clock.tick(timedelta(seconds=30))
+        assert await breaker.call(succeeding) == "ok"
+        assert breaker.state is BreakerState.CLOSED
+        assert metrics.gauge("circuit_breaker_state", dependency="twitter").value == 0
+
+
+@pytest.mark.asyncio
+async def test_half_open_lets_a_single_trial_through():
+    breaker = CircuitBreaker(
+        "mongo", failure_threshold=1, reset_timeout=0, failures=MONGO_FAILURES
+    )
+    with pytest.raises(DependencyUnavailable):
+        await breaker.call(failing(AutoReconnect()))
+    assert breaker.state is BreakerState.HALF_OPEN
+
+    trial = asyncio.create_task(breaker.call(asyncio.sleep, 0.01))
+    await asyncio.sleep(0)
+    with pytest.raises(CircuitOpen):
+        await breaker.call(succeeding)
+    await trial
+    assert breaker.state is BreakerState.CLOSED
+
+
+@pytest.mark.asyncio
+async def test_timeout_is_a_failure():
+    breaker = CircuitBreaker("mongo", timeout=0.01, failure_threshold=1, failures=MONGO_FAILURES)
+    with pytest.raises(DependencyUnavailable):
+        await breaker.call(hanging)
+    assert breaker.state is BreakerState.OPEN
+    assert metrics.counter("dependency_timeouts_total", dependency="mongo").value == 1
+
+
+@pytest.mark.asyncio
+async def test_request_errors_dont_open_the_breaker():
+    breaker = CircuitBreaker("twitter", failure_threshold=1, failures=TWITTER_FAILURES)
+    # The tweet is protected, Twitter itself is fine
+    with pytest.raises(Forbidden):
+        await breaker.call(failing(Forbidden(FakeResponse({}, status=403), response_json={})))
+    assert breaker.state is BreakerState.CLOSED
+
+
+@pytest.fixture
+def fur_stream(fake_twitter_api):
+    furretweet = MagicMock()
+    furretweet.client = fake_twitter_api
+    stream = FurStream(
+        bearer_token="token",
+        furretweet=furretweet,
+        accounts=AccountPool([RetweetAccount("main", fake_twitter_api)]),
+        twitter_breaker=CircuitBreaker(
+            "twitter", timeout=0.01, failure_threshold=2, failures=TWITTER_FAILURES
+        ),
+    )
+    stream.pipeline = compile_pipeline(PipelineSpec(selection=SelectionSpec(window_seconds=10)))
+    stream.on_rate_limit_exceeded = AsyncMock()
+    return stream
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("fault", ["hang", "error"])
+async def test_retweet_is_deferred(
+    fur_stream: FurStream, fake_twitter_api, mock_response: StreamResponse, fault: str
+):
+    fake_twitter_api.fault = fault
+    for tweet_id in (1, 2):
+        response = StreamResponse(
+            client=mock_response.client,
+            tweet=mock_response.tweet.copy(update={"id": tweet_id}),
+            includes=mock_response.includes,
+            errors=[],
+        )
+        await fur_stream.retweet(response)
+
+    assert len(fur_stream.selector) == 2
+    assert fur_stream.twitter_breaker.state is BreakerState.OPEN
+    # Candidates wait for Twitter instead of being retweeted
+    assert fur_stream.selector.budget() == 0
+    await fur_stream.selector.flush()
+    assert len(fur_stream.selector) == 2
+    fur_stream.on_rate_limit_exceeded.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_user_list_falls_back_to_the_last_one(fur_stream: FurStream):
+    fetch = AsyncMock(return_value=[1, 2])
+    assert await fur_stream.user_list("blacklist", fetch) == [1, 2]
+
+    fetch.side_effect = server_error()
+    assert await fur_stream.user_list("blacklist", fetch) == [1, 2]
+    # Never fetched, the check is skipped
+    assert await fur_stream.user_list("whitelist", fetch) == []
+    assert metrics.counter("user_list_fallbacks_total", list="blacklist").value == 1
+
+
+@pytest.mark.asyncio
+async def test_mongo_write_gives_up_on_stalled_mongo():
+    collection = MagicMock()
+    collection.update_one = AsyncMock(side_effect=hanging)
+    breaker = CircuitBreaker("mongo", timeout=0.01, failure_threshold=1, failures=MONGO_FAILURES)
+    repository = AuthorRetweetsRepository(collection, breaker=breaker)
+
+    await asyncio.wait_for(repository.save("1", []), 1)
+    # Open, the next write doesn't wait at all
+    await repository.save("1", [])
+    assert collection.update_one.await_count == 1
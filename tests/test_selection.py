@@ -0,0 +1,235 @@
+import itertools
+import pytest
+from datetime import datetime, timedelta, timezone
+from unittest.mock import AsyncMock, MagicMock
+from freezegun import freeze_time
+from furretweet.accounts import AccountPool, RetweetAccount
+from furretweet.filters import AuthorRetweetCapFilter
+from furretweet.metrics import metrics
+from furretweet.models import StreamResponse
+from furretweet.pipeline import PipelineSpec, SelectionSpec, compile_pipeline
+from furretweet.resilience import CircuitBreaker
+from furretweet.selection import RetweetSelector
+
+
+@pytest.fixture
+def stream():
+    stream = MagicMock()
+    stream.pipeline = compile_pipeline(
+        PipelineSpec(selection=SelectionSpec(window_seconds=10, max_wait_seconds=0))
+    )
+    stream.accounts = AccountPool([RetweetAccount("main", MagicMock())])
+    stream.twitter_breaker = CircuitBreaker("twitter")
+    stream.rate_limit_handler = stream.accounts.primary.rate_limit_handler
+    stream.retweet = AsyncMock()
+    stream.on_rate_limit_exceeded = AsyncMock()
+    stream.on_failed_filters = AsyncMock()
+    return stream
+
+
+@pytest.fixture
+def selector(stream: MagicMock):
+    return RetweetSelector(stream)
+
+
+tweet_ids = itertools.count(1)
+
+
+def make_response(mock_response: StreamResponse, author_id: int, followers: int, likes: int):
+    response = StreamResponse(
+        client=mock_response.client,
+        tweet=mock_response.tweet.copy(deep=True),
+        includes=mock_response.includes.copy(deep=True),
+        errors=[],
+    )
+    response.tweet.id = next(tweet_ids)
+    response.tweet.public_metrics.like_count = likes
+    response.author.id = author_id
+    response.author.public_metrics.followers_count = followers
+    return response
+
+
+def test_score(selector: RetweetSelector, mock_response: StreamResponse):
+    small = make_response(mock_response, 1, followers=10, likes=0)
+    popular = make_response(mock_response, 2, followers=10_000, likes=500)
+    assert selector.score(popular) > selector.score(small)
+
+    # Recently retweeted authors are penalized, less and less as time goes by
+    score = selector.score(popular)
+    selector.on_retweeted(popular)
+    now = datetime.now(timezone.utc)
+    assert selector.score(popular, now) == pytest.approx(score - 3, abs=0.01)
+    later = selector.score(popular, now + timedelta(hours=6))
+    assert later == pytest.approx(score - 1.5, abs=0.01)
+
+
+@freeze_time("2023-04-14 12:00:00")
+def test_budget(selector: RetweetSelector, stream: MagicMock):
+    handler = stream.rate_limit_handler
+    selector._pending = [MagicMock()] * 7
+
+    # Unknown quota, everything can be retweeted
+    assert selector.budget() == 7
+
+    handler.populated = True
+    handler.remaining = 50
+    handler.reset_time = datetime.now(timezone.utc) + timedelta(seconds=100)
+    # 10 windows of 10 seconds left until the reset
+    assert selector.budget() == 5
+
+    handler.reset_time = datetime.now(timezone.utc) + timedelta(seconds=5)
+    assert selector.budget() == 50
+
+    handler.remaining = 0
+    handler.reset_time = datetime.now(timezone.utc) + timedelta(seconds=100)
+    assert selector.budget() == 0
+
+
+@freeze_time("2023-04-14 12:00:00")
+def test_budget_sums_accounts(selector: RetweetSelector, stream: MagicMock):
+    stream.accounts = AccountPool(
+        [RetweetAccount("main", MagicMock()), RetweetAccount("second", MagicMock())]
+    )
+    for remaining, account in zip((50, 20), stream.accounts):
+        account.rate_limit_handler.populated = True
+        account.rate_limit_handler.remaining = remaining
+        account.rate_limit_handler.reset_time = datetime.now(timezone.utc) + timedelta(seconds=100)
+
+    assert selector.budget() == 5 + 2
+
+
+@pytest.mark.asyncio
+async def test_flush_spends_budget_on_best(
+    selector: RetweetSelector, stream: MagicMock, mock_response: StreamResponse
+):
+    handler = stream.rate_limit_handler
+    handler.populated = True
+    handler.remaining = 2
+    handler.reset_time = datetime.now(timezone.utc) + timedelta(seconds=5)
+
+    responses = [make_response(mock_response, i, followers=10**i, likes=0) for i in range(1, 5)]
+    for response in responses:
+        await selector.submit(response)
+    assert len(selector) == 4
+    stream.retweet.assert_not_called()
+
+    await selector.flush()
+
+    assert [c.args[0] for c in stream.retweet.call_args_list] == [responses[3], responses[2]]
+    # max_wait_seconds is 0 so the others are given up
+    given_up = [c.args[0] for c in stream.on_rate_limit_exceeded.call_args_list]
+    assert sorted(given_up, key=lambda r: r.author.id) == responses[:2]
+    assert len(selector) == 0
+    assert metrics.gauge("selection_budget").value == 2
+
+
+def retweets_like_the_stream(selector: RetweetSelector, stream: MagicMock):
+    async def retweet(response: StreamResponse):
+        selector.on_retweeted(response)
+        for f in response.filters:
+            await f.on_retweet(response)
+
+    stream.retweet.side_effect = retweet
+
+
+@pytest.mark.asyncio
+async def test_flush_rescores_between_picks(
+    selector: RetweetSelector, stream: MagicMock, mock_response: StreamResponse
+):
+    retweets_like_the_stream(selector, stream)
+    first = make_response(mock_response, 1, followers=10_000, likes=0)
+    second = make_response(mock_response, 1, followers=10_000, likes=0)
+    other = make_response(mock_response, 2, followers=3_000, likes=0)
+    for response in (first, second, other):
+        await selector.submit(response)
+
+    handler = stream.rate_limit_handler
+    handler.populated = True
+    handler.remaining = 2
+    handler.reset_time = datetime.now(timezone.utc) + timedelta(seconds=5)
+    await selector.flush()
+
+    # Once its first tweet is retweeted, the author's second one is penalized
+    assert [c.args[0] for c in stream.retweet.call_args_list] == [first, other]
+    stream.on_rate_limit_exceeded.assert_called_once_with(second)
+
+
+@pytest.mark.asyncio
+async def test_flush_checks_author_cap_between_picks(
+    selector: RetweetSelector, stream: MagicMock, mock_response: StreamResponse
+):
+    retweets_like_the_stream(selector, stream)
+    cap = AuthorRetweetCapFilter(max_retweets=1)
+    responses = [make_response(mock_response, 1, followers=10_000, likes=0) for _ in range(3)]
+    for response in responses:
+        # Each of them passed the cap when streamed
+        response.process_filters([cap])
+        await selector.submit(response)
+
+    await selector.flush()
+
+    assert [c.args[0] for c in stream.retweet.call_args_list] == [responses[0]]
+    capped = [c.args[0] for c in stream.on_failed_filters.call_args_list]
+    assert sorted(capped, key=id) == sorted(responses[1:], key=id)
+    assert all(response.failed_filters == [cap] for response in capped)
+    assert metrics.counter("selection_author_capped_total").value == 2
+
+
+@pytest.mark.asyncio
+async def test_flush_survives_a_failing_retweet(
+    selector: RetweetSelector, stream: MagicMock, mock_response: StreamResponse
+):
+    stream.retweet.side_effect = [RuntimeError("mongo is down"), None]
+    responses = [make_response(mock_response, i, followers=10**i, likes=0) for i in (1, 2)]
+    for response in responses:
+        await selector.submit(response)
+
+    await selector.flush()
+
+    assert [c.args[0] for c in stream.retweet.call_args_list] == [responses[1], responses[0]]
+    assert len(selector) == 0
+
+
+@pytest.mark.asyncio
+async def test_submit_without_window(
+    selector: RetweetSelector, stream: MagicMock, mock_response: StreamResponse
+):
+    stream.pipeline = compile_pipeline(PipelineSpec())
+
+    await selector.submit(mock_response)
+
+    stream.retweet.assert_called_once_with(mock_response)
+    assert len(selector) == 0
+
+
+@pytest.mark.asyncio
+async def test_submit_max_pending(
+    selector: RetweetSelector, stream: MagicMock, mock_response: StreamResponse
+):
+    stream.pipeline = compile_pipeline(
+        PipelineSpec(selection=SelectionSpec(window_seconds=10, max_pending=1))
+    )
+    worst = make_response(mock_response, 1, followers=1, likes=0)
+    best = make_response(mock_response, 2, followers=1000, likes=0)
+
+    await selector.submit(worst)
+    await selector.submit(best)
+
+    assert len(selector) == 1
+    stream.on_rate_limit_exceeded.assert_called_once_with(worst)
+
+
+@pytest.mark.asyncio
+async def test_submit_ignores_pending_tweet(
+    selector: RetweetSelector, stream: MagicMock, mock_response: StreamResponse
+):
+    response = make_response(mock_response, 1, followers=1000, likes=0)
+    await selector.submit(response)
+    # Redelivered while it waits for its window
+    await selector.submit(response)
+
+    assert len(selector) == 1
+    assert response.tweet.id in selector
+    await selector.flush()
+    stream.retweet.assert_called_once_with(response)
+    assert response.tweet.id not in selector
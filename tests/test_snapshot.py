@@ -0,0 +1,112 @@
+from datetime import datetime, timedelta, timezone
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from freezegun import freeze_time
+
+from furretweet.accounts import AccountPool, RetweetAccount
+from furretweet.database import StateSnapshotsRepository
+from furretweet.dedup import RecentIds
+from furretweet.metrics import metrics
+from furretweet.models import StreamResponse
+from furretweet.snapshot import FileSnapshotStore, StateSnapshotter
+from furretweet.stream import FurStream
+
+
+@pytest.fixture(autouse=True)
+def clear_metrics():
+    metrics.clear()
+
+
+def make_stream() -> FurStream:
+    furretweet = MagicMock()
+    furretweet.mongo.not_retweeted_tweets_repository.add = AsyncMock()
+    accounts = AccountPool(
+        [RetweetAccount("main", MagicMock()), RetweetAccount("alt", MagicMock())]
+    )
+    return FurStream(bearer_token="token", furretweet=furretweet, accounts=accounts)
+
+
+def test_recent_ids():
+    recent_ids = RecentIds(maxlen=3)
+    for tweet_id in [1, 2, 3, 1, 4]:
+        recent_ids.add(tweet_id)
+    # 1 was added again, 2 is the oldest one
+    assert list(recent_ids) == [3, 1, 4]
+    assert 2 not in recent_ids
+
+
+@pytest.mark.asyncio
+async def test_restart_restores_state(tmp_path, mock_response: StreamResponse):
+    store = FileSnapshotStore(tmp_path / "state.json")
+    stream = make_stream()
+    reset_time = datetime.now(timezone.utc).replace(microsecond=0) + timedelta(minutes=10)
+    stream.accounts.primary.rate_limit_handler.update_limits(
+        {
+            "x-rate-limit-remaining": "0",
+            "x-rate-limit-reset": str(int(reset_time.timestamp())),
+            "x-rate-limit-limit": "50",
+        }
+    )
+    stream.user_lists = {"blacklist": [1], "whitelist": [2, 3]}
+    await stream.on_failed_filters(mock_response)
+    await StateSnapshotter(stream, store).save()
+
+    restarted = make_stream()
+    assert await StateSnapshotter(restarted, store).restore()
+
+    # The limit is known right away instead of after the next 429
+    handler = restarted.accounts.primary.rate_limit_handler
+    assert handler.is_limit_exceeded()
+    assert (handler.remaining, handler.limit, handler.reset_time) == (0, 50, reset_time)
+    assert restarted.accounts.select() is restarted.accounts.accounts[1]
+    assert not restarted.accounts.accounts[1].rate_limit_handler.populated
+
+    assert restarted.user_lists_warmed
+    assert restarted.user_lists == {"blacklist": [1], "whitelist": [2, 3]}
+
+    # The tweet was decided on before the restart
+    restarted.on_response = AsyncMock()
+    await restarted._process(mock_response, restarted.pipeline.default_campaign)
+    restarted.on_response.assert_not_called()
+    assert metrics.counter("duplicate_tweets_total").value == 1
+
+
+@pytest.mark.asyncio
+async def test_stale_snapshot_is_rejected(tmp_path):
+    store = FileSnapshotStore(tmp_path / "state.json")
+    stream = make_stream()
+    stream.user_lists = {"blacklist": [1], "whitelist": [2]}
+    snapshotter = StateSnapshotter(stream, store, max_age=60)
+
+    with freeze_time("2022-04-22 12:00:00") as clock:
+        await snapshotter.save()
+        clock.tick(timedelta(seconds=61))
+        restarted = make_stream()
+        assert not await StateSnapshotter(restarted, store, max_age=60).restore()
+        assert not restarted.user_lists_warmed
+        assert metrics.counter("state_snapshot_rejected_total").value == 1
+
+
+@pytest.mark.asyncio
+async def test_unreadable_or_missing_snapshot(tmp_path):
+    store = FileSnapshotStore(tmp_path / "state.json")
+    snapshotter = StateSnapshotter(make_stream(), store)
+    assert not await snapshotter.restore()
+
+    (tmp_path / "state.json").write_text('{"version": 1, "taken')
+    assert not await snapshotter.restore()
+
+
+@pytest.mark.asyncio
+async def test_mongo_store():
+    collection = MagicMock()
+    collection.replace_one = AsyncMock()
+    repository = StateSnapshotsRepository(collection)
+    snapshotter = StateSnapshotter(make_stream(), repository)
+
+    await snapshotter.save()
+    snapshot = collection.replace_one.call_args.args[1]
+    collection.find_one = AsyncMock(return_value={"_id": "state", **snapshot})
+    assert await repository.load() == snapshot
+    assert await snapshotter.restore()
@@ -0,0 +1,226 @@
+"""Soak test, replays synthetic traffic through `FurStream` under accelerated
+time and fails if memory or live tasks keep growing.
+
+It runs a few simulated hours by default, the whole Friday window with:
+
+    SOAK_HOURS=50 pytest tests/test_soak.py -s
+"""
+import asyncio
+import gc
+import os
+import random
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+import pytest
+import ujson
+from freezegun import freeze_time
+from loguru import logger
+
+from furretweet.database import AuthorRetweetsRepository, NotRetweetedTweetsRepository
+from furretweet.metrics import metrics
+from furretweet.models import StreamResponse
+from furretweet.pipeline import (
+    FilterSpec,
+    PipelineSpec,
+    RecheckSpec,
+    ScheduleSpec,
+    SelectionSpec,
+    compile_pipeline,
+)
+from furretweet.stream import FurStream
+
+SOAK_HOURS = float(os.environ.get("SOAK_HOURS", "2"))
+TWEETS_PER_MINUTE = 10
+AUTHORS = 500
+# Growth allowed over the last third of the run, once every bounded
+# structure had the time to fill up.
+MAX_GROWTH_BYTES = 1024 * 1024
+
+SPAM = "Earn 500 dollars a day working from home, click the link in my bio #FursuitFriday"
+WORDS = (
+    "new paws tail head con friends blep boop photoshoot maker suit park "
+    "beach snow convention meet happy weekend finally done crypto"
+).split()
+SELECTION_WINDOW = 10
+RECHECK_INTERVAL = 60
+
+
+class DiscardingCollection:
+    """Stands in for a Mongo collection, keeping nothing so it can't be what grows."""
+
+    def __init__(self) -> None:
+        self.writes = 0
+
+    async def insert_one(self, document: dict) -> None:
+        self.writes += 1
+
+    async def update_one(self, *args, **kwargs) -> None:
+        self.writes += 1
+
+    async def _empty(self):
+        return
+        yield
+
+    def find(self, *args, **kwargs):
+        return self._empty()
+
+
+class SoakFurRetweet:
+    def __init__(self, client) -> None:
+        self.client = client
+        self.mongo = SimpleNamespace(
+            not_retweeted_tweets_repository=NotRetweetedTweetsRepository(DiscardingCollection()),
+            author_retweets_repository=AuthorRetweetsRepository(DiscardingCollection()),
+        )
+        self.text_indexes = {}
+
+    async def get_blacklist(self) -> list[int]:
+        return []
+
+    async def get_whitelist(self) -> list[int]:
+        return []
+
+
+def synthetic_tweet(rng: random.Random, tweet_id: int, now: datetime) -> str:
+    author_id = rng.randrange(AUTHORS)
+    if rng.random() < 0.01:
+        text = SPAM
+    else:
+        words = " ".join(rng.choices(WORDS, k=rng.randrange(3, 15)))
+        text = f"#FursuitFriday {words}" + "\n" * rng.randrange(5)
+    return ujson.dumps(
+        {
+            "data": {
+                "id": str(tweet_id),
+                "text": text,
+                "author_id": str(author_id),
+                "created_at": now.isoformat(),
+                "entities": {"hashtags": [{"tag": "FursuitFriday"}]},
+                "possibly_sensitive": False,
+                "public_metrics": {
+                    "retweet_count": rng.randrange(10),
+                    "reply_count": rng.randrange(10),
+                    "like_count": rng.randrange(200),
+                    "quote_count": 0,
+                    "impression_count": 0,
+                },
+                "edit_history_tweet_ids": [str(tweet_id)],
+            },
+            "includes": {
+                "users": [
+                    {
+                        "id": str(author_id),
+                        "username": f"furry{author_id}",
+                        "name": "Furry",
+                        "verified": False,
+                        "verified_type": "none",
+                        "public_metrics": {
+                            "followers_count": (author_id * 7919) % 3000,
+                            "following_count": 0,
+                            "tweet_count": 0,
+                            "listed_count": 0,
+                        },
+                        "created_at": "2015-01-01T00:00:00.000Z",
+                    }
+                ]
+            },
+            "matching_rules": [{"id": "1", "tag": "FurretweetRules"}],
+        }
+    )
+
+
+def soak_pipeline():
+    return compile_pipeline(
+        PipelineSpec(
+            required_terms=["#fursuitfriday"],
+            schedule=ScheduleSpec(weekdays=[]),
+            default_filters=[
+                FilterSpec(type="BannedTermsFilter", banned_terms=["crypto", "nft"]),
+                FilterSpec(type="MinimumFollowersFilter", min_followers=100),
+                FilterSpec(type="MinimumAccountAgeFilter", min_days=30),
+                FilterSpec(type="MaximumNewLinesFilter", max=3),
+                FilterSpec(type="NearDuplicateTextFilter", max_cluster_size=3),
+                FilterSpec(type="AuthorRetweetCapFilter", max_retweets=3),
+            ],
+            selection=SelectionSpec(window_seconds=SELECTION_WINDOW, max_pending=200),
+            recheck=RecheckSpec(
+                soft_filters=["MinimumFollowersFilter"],
+                interval_seconds=RECHECK_INTERVAL,
+                max_pending=500,
+            ),
+        )
+    )
+
+
+def live_responses() -> int:
+    gc.collect()
+    return sum(isinstance(o, StreamResponse) for o in gc.get_objects())
+
+
+def growth_report(after: tracemalloc.Snapshot, before: tracemalloc.Snapshot) -> str:
+    return "\n".join(str(stat) for stat in after.compare_to(before, "lineno")[:10])
+
+
+@pytest.mark.asyncio
+async def test_soak(fake_twitter_api_factory):
+    rng = random.Random(0)
+    tick = timedelta(minutes=1) / TWEETS_PER_MINUTE
+    total = int(SOAK_HOURS * 60 * TWEETS_PER_MINUTE)
+    checkpoints = {2 * total // 3: "second", total: "end"}
+    snapshots: dict[str, tracemalloc.Snapshot] = {}
+
+    metrics.clear()
+    logger.disable("furretweet")
+    tracemalloc.start()
+    try:
+        with freeze_time(datetime(2023, 4, 21, tzinfo=timezone.utc)) as clock:
+            api = fake_twitter_api_factory(limit=300)
+            stream = FurStream(bearer_token="soak", furretweet=SoakFurRetweet(api))
+            stream.get_rules = AsyncMock(return_value=SimpleNamespace(data=[]))
+            stream.add_rules = AsyncMock(return_value=SimpleNamespace(errors=[]))
+            await stream.install_pipeline(soak_pipeline())
+            tasks_before = len(asyncio.all_tasks())
+
+            elapsed = timedelta()
+            for i in range(1, total + 1):
+                now = datetime.now(timezone.utc)
+                await stream.on_data(synthetic_tweet(rng, i, now))
+
+                clock.tick(tick)
+                elapsed += tick
+                if elapsed.total_seconds() % SELECTION_WINDOW < tick.total_seconds():
+                    await stream.selector.flush()
+                if elapsed.total_seconds() % RECHECK_INTERVAL < tick.total_seconds():
+                    await stream.recheck_queue.run_once()
+                if now.timestamp() >= api.reset:
+                    api.remaining.clear()
+                    api.reset += 15 * 60
+                # The fake API records its calls, that is not the bot growing
+                api.calls.clear()
+
+                if i in checkpoints:
+                    gc.collect()
+                    snapshots[checkpoints[i]] = tracemalloc.take_snapshot()
+
+            assert len(asyncio.all_tasks()) <= tasks_before
+            responses = live_responses()
+    finally:
+        tracemalloc.stop()
+        logger.enable("furretweet")
+
+    assert metrics.counter("retweets_total", campaign="default").value > 0
+    # Only the candidates waiting for selection are kept whole
+    assert responses <= stream.pipeline.spec.selection.max_pending + 2
+    assert len(stream.recheck_queue) <= stream.pipeline.spec.recheck.max_pending
+
+    growth = sum(
+        stat.size_diff for stat in snapshots["end"].compare_to(snapshots["second"], "filename")
+    )
+    assert (
+        growth < MAX_GROWTH_BYTES
+    ), f"Memory grew by {growth} bytes over the last third of the soak:\n" + growth_report(
+        snapshots["end"], snapshots["second"]
+    )
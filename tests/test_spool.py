@@ -0,0 +1,168 @@
+import asyncio
+import os
+
+import bson
+import pytest
+import pytest_asyncio
+from pymongo.errors import AutoReconnect, BulkWriteError
+
+from furretweet.database import NotRetweetedTweetsRepository
+from furretweet.metrics import metrics
+from furretweet.models import StreamResponse
+from furretweet.spool import DUPLICATE_KEY, Spool, SpoolDrainer
+
+
+class MongoStandIn:
+    """A collection that can be killed, even in the middle of a batch, and stalled."""
+
+    def __init__(self) -> None:
+        self.documents: dict[str, dict] = {}
+        self.alive = True
+        self.stalled = False
+        # Documents written before dying in the middle of the next batch
+        self.die_after: int | None = None
+
+    async def insert_many(self, documents: list[dict], ordered: bool = True) -> None:
+        if self.stalled:
+            await asyncio.Event().wait()
+        if not self.alive:
+            raise AutoReconnect("connection refused")
+
+        errors = []
+        for index, document in enumerate(documents):
+            if self.die_after is not None and index == self.die_after:
+                self.alive = False
+                self.die_after = None
+                raise AutoReconnect("connection closed")
+            if document["_id"] in self.documents:
+                errors.append({"index": index, "code": DUPLICATE_KEY, "errmsg": "E11000"})
+                if ordered:
+                    break
+            else:
+                self.documents[document["_id"]] = document
+        if errors:
+            raise BulkWriteError({"writeErrors": errors, "writeConcernErrors": []})
+
+    async def update_one(self, query: dict, update: dict, upsert: bool = False) -> None:
+        if self.stalled:
+            await asyncio.Event().wait()
+        self.documents.setdefault(query["_id"], {**query, **update["$setOnInsert"]})
+
+
+@pytest.fixture(autouse=True)
+def clear_metrics():
+    metrics.clear()
+
+
+@pytest_asyncio.fixture
+async def spool(tmp_path):
+    spool = Spool(tmp_path / "writes.spool")
+    yield spool
+    await spool.close()
+
+
+def documents(count: int, start: int = 0) -> list[dict]:
+    return [{"_id": str(i), "text": f"tweet {i}"} for i in range(start, start + count)]
+
+
+@pytest.mark.asyncio
+async def test_append_and_read(spool: Spool):
+    for document in documents(3):
+        spool.append(bson.encode(document))
+    await spool.sync()
+
+    records, offset = spool.read(2)
+    assert [bson.decode(r)["_id"] for r in records] == ["0", "1"]
+    spool.commit(offset)
+
+    records, offset = spool.read(10)
+    assert [bson.decode(r)["_id"] for r in records] == ["2"]
+    spool.commit(offset)
+    # Fully drained, the file starts over
+    assert spool.pending == 0
+    assert os.path.getsize(spool.path) == 0
+
+
+@pytest.mark.asyncio
+async def test_reopen_resumes_and_drops_torn_record(tmp_path):
+    spool = Spool(tmp_path / "writes.spool")
+    for document in documents(3):
+        spool.append(bson.encode(document))
+    records, offset = spool.read(1)
+    spool.commit(offset)
+    await spool.close()
+    # A crash in the middle of an append
+    with open(spool.path, "ab") as f:
+        f.write(b"\x40\x00\x00\x00\x01")
+
+    reopened = Spool(tmp_path / "writes.spool")
+    try:
+        records, _ = reopened.read(10)
+        assert [bson.decode(r)["_id"] for r in records] == ["1", "2"]
+        reopened.append(bson.encode({"_id": "3"}))
+        records, _ = reopened.read(10)
+        assert [bson.decode(r)["_id"] for r in records] == ["1", "2", "3"]
+    finally:
+        await reopened.close()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("ordered", [False, True])
+async def test_drains_exactly_once_when_mongo_dies_midway(spool: Spool, ordered: bool):
+    mongo = MongoStandIn()
+    drainer = SpoolDrainer(
+        spool, mongo, batch_size=10, interval=0.01, max_backoff=0.05, ordered=ordered
+    )
+    for document in documents(25):
+        spool.append(bson.encode(document))
+
+    assert await drainer.drain_once() == 10
+    # Killed after writing part of the second batch
+    mongo.die_after = 4
+    with pytest.raises(AutoReconnect):
+        await drainer.drain_once()
+    assert len(mongo.documents) == 14
+
+    # The stream keeps writing while Mongo is down
+    for document in documents(5, start=25):
+        spool.append(bson.encode(document))
+
+    await drainer.start()
+    await asyncio.sleep(0.05)
+    assert metrics.counter("spool_drain_errors_total").value > 0
+    mongo.alive = True
+    for _ in range(100):
+        if not spool.pending:
+            break
+        await asyncio.sleep(0.01)
+    drainer.task.cancel()
+
+    assert sorted(mongo.documents, key=int) == [str(i) for i in range(30)]
+    assert metrics.counter("spool_drained_total").value == 30
+    assert spool.pending == 0
+
+
+@pytest.mark.asyncio
+async def test_drain_times_out_on_stalled_mongo(spool: Spool):
+    mongo = MongoStandIn()
+    mongo.stalled = True
+    drainer = SpoolDrainer(spool, mongo, timeout=0.01)
+    spool.append(bson.encode({"_id": "1"}))
+
+    with pytest.raises(asyncio.TimeoutError):
+        await drainer.drain_once()
+    assert spool.pending > 0
+
+
+@pytest.mark.asyncio
+async def test_repository_writes_to_spool(spool: Spool, mock_response: StreamResponse):
+    mongo = MongoStandIn()
+    mongo.stalled = True
+    repository = NotRetweetedTweetsRepository(mongo, spool=spool)
+
+    # Doesn't wait for the stalled Mongo
+    await asyncio.wait_for(repository.add(mock_response), 0.1)
+
+    records, _ = spool.read(10)
+    assert bson.decode(records[0])["_id"] == str(mock_response.tweet.id)
+    assert mongo.documents == {}
@@ -1,7 +1,18 @@
+import asyncio
+import copy
 from typing import Any
 import pytest
 import json
+from furretweet.accounts import AccountPool, RetweetAccount
 from furretweet.filters import MinimumFollowersFilter
+from furretweet.pipeline import (
+    CampaignSpec,
+    FilterSpec,
+    PipelineSpec,
+    SelectionSpec,
+    StreamRuleSpec,
+    compile_pipeline,
+)
 from furretweet.stream import FurStream, StreamResponse
 from unittest.mock import MagicMock, AsyncMock
 from tweepy.errors import TooManyRequests, HTTPException
@@ -22,7 +33,7 @@ def fur_stream(mock_furretweet: MagicMock):
 
 @pytest.fixture
 def mock_stream_response():
-    return MagicMock()
+    return MagicMock(campaign=None)
 
 
 @pytest.mark.asyncio
@@ -103,6 +114,8 @@ async def test_retweet_success(fur_stream: FurStream, mock_stream_response: Magi
 
     mock_stream_response.retweet = AsyncMock(return_value=retweet_response_mock)
     fur_stream.rate_limit_handler.update_limits = MagicMock()
+    mock_filter = MagicMock(on_retweet=AsyncMock())
+    mock_stream_response.filters = [mock_filter]
 
     await fur_stream.retweet(mock_stream_response)
 
@@ -110,6 +123,28 @@ async def test_retweet_success(fur_stream: FurStream, mock_stream_response: Magi
     fur_stream.rate_limit_handler.update_limits.assert_called_once_with(
         retweet_response_mock.headers
     )
+    mock_filter.on_retweet.assert_called_once_with(mock_stream_response)
+
+
+@pytest.mark.asyncio
+async def test_on_retweeted_records_in_current_pipeline(
+    fur_stream: FurStream, mock_response: StreamResponse
+):
+    def author_cap_pipeline():
+        spec = PipelineSpec(default_filters=[FilterSpec(type="AuthorRetweetCapFilter")])
+        return compile_pipeline(spec)
+
+    old = author_cap_pipeline()
+    mock_response.campaign = old.default_campaign
+    mock_response.filters = old.default_filters
+    # Reloaded while the tweet waited in the selector
+    fur_stream.pipeline = author_cap_pipeline()
+
+    await fur_stream.on_retweeted(mock_response)
+
+    author_id = str(mock_response.author.id)
+    assert fur_stream.pipeline.default_filters[0].counter.count(author_id) == 1
+    assert old.default_filters[0].counter.count(author_id) == 0
 
 
 @pytest.mark.asyncio
@@ -155,3 +190,189 @@ async def test_retweet_http_exception(fur_stream: FurStream, mock_stream_respons
 
     mock_stream_response.retweet.assert_called_once()
     fur_stream.rate_limit_handler.update_limits.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_install_pipeline(fur_stream: FurStream):
+    pipeline = compile_pipeline(PipelineSpec(default_filters=[]))
+    fur_stream.get_rules = AsyncMock(return_value=MagicMock(data=None))
+    fur_stream.add_rules = AsyncMock(return_value=MagicMock(errors=[]))
+
+    await fur_stream.install_pipeline(pipeline)
+
+    assert fur_stream.pipeline is pipeline
+    assert fur_stream.default_filters == []
+    fur_stream.add_rules.assert_called_once_with(add=pipeline.stream_rules)
+
+
+@pytest.mark.asyncio
+async def test_install_pipeline_keeps_current_on_failure(fur_stream: FurStream):
+    current = fur_stream.pipeline
+    pipeline = compile_pipeline(PipelineSpec(default_filters=[]))
+    fur_stream.get_rules = AsyncMock(return_value=MagicMock(data=None))
+    fur_stream.add_rules = AsyncMock(side_effect=HTTPException(MagicMock()))
+
+    with pytest.raises(HTTPException):
+        await fur_stream.install_pipeline(pipeline)
+
+    # Routing stays in line with the rules Twitter has
+    assert fur_stream.pipeline is current
+
+
+@pytest.mark.asyncio
+async def test_on_data_hydrates_missing_author(
+    fur_stream: FurStream, raw_data_example: dict[str, Any], fake_twitter_api
+):
+    fake_twitter_api.add_tweet(raw_data_example)
+    fur_stream.hydrator.client = fake_twitter_api
+    fur_stream.hydrator.batch_delay = 0.01
+    fur_stream.on_response = AsyncMock()
+
+    raw_data = copy.deepcopy(raw_data_example)
+    raw_data["data"]["text"] += " #FursuitFriday"
+    del raw_data["includes"]["users"]
+    await fur_stream.on_data(json.dumps(raw_data))
+
+    # The author is looked up in the background instead of dropping the tweet
+    fur_stream.on_response.assert_not_called()
+    await asyncio.gather(*fur_stream._hydration_tasks)
+
+    response = fur_stream.on_response.call_args.args[0]
+    assert response.author.username == "DonovanCarmona"
+    assert response.includes.media[0].media_key == "3_1517533153853902848"
+    assert [call[0] for call in fake_twitter_api.calls] == ["get_users"]
+
+    # Later tweets from the same author are served from the cache
+    await fur_stream.on_data(json.dumps(raw_data))
+    assert fur_stream.on_response.call_count == 2
+    assert len(fake_twitter_api.calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_process_skips_pending_tweet(fur_stream: FurStream, mock_response: StreamResponse):
+    fur_stream.pipeline = compile_pipeline(
+        PipelineSpec(selection=SelectionSpec(window_seconds=10))
+    )
+    fur_stream.on_response = AsyncMock()
+    await fur_stream.selector.submit(mock_response)
+
+    await fur_stream._process(mock_response, fur_stream.pipeline.campaigns[0])
+
+    fur_stream.on_response.assert_not_called()
+
+
+@pytest.fixture
+def campaigns_pipeline():
+    return compile_pipeline(
+        PipelineSpec(
+            campaigns=[
+                CampaignSpec(
+                    name="anthrocon",
+                    required_terms=["#anthrocon"],
+                    stream_rules=[StreamRuleSpec(value="#Anthrocon", tag="Anthrocon")],
+                    default_filters=[FilterSpec(type="MediaFilter")],
+                    schedule={"weekdays": []},
+                    max_retweets=1,
+                )
+            ]
+        )
+    )
+
+
+@pytest.mark.asyncio
+async def test_on_data_routes_campaigns(
+    fur_stream: FurStream, raw_data_example: dict[str, Any], campaigns_pipeline
+):
+    fur_stream.pipeline = campaigns_pipeline
+    fur_stream.on_response = AsyncMock()
+
+    raw_data = copy.deepcopy(raw_data_example)
+    raw_data["data"]["text"] += " #Anthrocon"
+    raw_data["matching_rules"] = [{"id": "1", "tag": "Anthrocon"}]
+    await fur_stream.on_data(json.dumps(raw_data))
+
+    response = fur_stream.on_response.call_args.args[0]
+    assert response.campaign is campaigns_pipeline.campaigns[1]
+
+    # Tweets without the terms of the campaign they matched are ignored
+    raw_data["data"]["text"] = "#FursuitFriday"
+    fur_stream.on_response.reset_mock()
+    await fur_stream.on_data(json.dumps(raw_data))
+    fur_stream.on_response.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_on_response_campaign(
+    fur_stream: FurStream, mock_response: StreamResponse, campaigns_pipeline
+):
+    fur_stream.pipeline = campaigns_pipeline
+    fur_stream.furretweet.get_blacklist = AsyncMock(return_value=[])
+    fur_stream.furretweet.get_whitelist = AsyncMock(return_value=[])
+    fur_stream.selector.submit = AsyncMock()
+    mock_response.campaign = campaigns_pipeline.campaigns[1]
+
+    await fur_stream.on_response(mock_response)
+
+    # Filtered with the campaign filters, active every day
+    assert [f.name for f in mock_response.filters] == ["MediaFilter"]
+    fur_stream.selector.submit.assert_called_once_with(mock_response)
+
+
+@pytest.mark.asyncio
+async def test_retweet_campaign_budget(
+    fur_stream: FurStream, mock_stream_response: MagicMock, campaigns_pipeline
+):
+    campaign = campaigns_pipeline.campaigns[1]
+    mock_stream_response.campaign = campaign
+    mock_stream_response.retweet = AsyncMock()
+    fur_stream.on_rate_limit_exceeded = AsyncMock()
+    fur_stream.campaign_budget.record(campaign)
+
+    await fur_stream.retweet(mock_stream_response)
+
+    mock_stream_response.retweet.assert_not_called()
+    fur_stream.on_rate_limit_exceeded.assert_called_once_with(mock_stream_response)
+
+
+@pytest.mark.asyncio
+async def test_retweet_fans_out_accounts(
+    mock_furretweet: MagicMock, mock_response: StreamResponse, fake_twitter_api_factory
+):
+    main_api, second_api = fake_twitter_api_factory(limit=2), fake_twitter_api_factory(limit=50)
+    accounts = AccountPool(
+        [RetweetAccount("main", main_api), RetweetAccount("second", second_api)]
+    )
+    fur_stream = FurStream(bearer_token="token", furretweet=mock_furretweet, accounts=accounts)
+    fur_stream.on_rate_limit_exceeded = AsyncMock()
+
+    # The second account has more headroom once both limits are known
+    await fur_stream.retweet(mock_response)
+    await fur_stream.retweet(mock_response)
+    await fur_stream.retweet(mock_response)
+    await fur_stream.retweet(mock_response)
+
+    assert len(main_api.calls) == 1
+    assert len(second_api.calls) == 3
+    assert fur_stream.rate_limit_handler is accounts.primary.rate_limit_handler
+    fur_stream.on_rate_limit_exceeded.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_retweet_falls_back_on_429(
+    mock_furretweet: MagicMock, mock_response: StreamResponse, fake_twitter_api_factory
+):
+    main_api, second_api = fake_twitter_api_factory(), fake_twitter_api_factory()
+    main_api.remaining["retweet"] = 0
+    second_api.remaining["retweet"] = 0
+    accounts = AccountPool(
+        [RetweetAccount("main", main_api), RetweetAccount("second", second_api)]
+    )
+    fur_stream = FurStream(bearer_token="token", furretweet=mock_furretweet, accounts=accounts)
+    fur_stream.on_rate_limit_exceeded = AsyncMock()
+
+    await fur_stream.retweet(mock_response)
+
+    # Both accounts were tried once before giving up
+    assert len(main_api.calls) == len(second_api.calls) == 1
+    fur_stream.on_rate_limit_exceeded.assert_called_once_with(mock_response)
+    assert accounts.select() is None
@@ -0,0 +1,155 @@
+import asyncio
+import copy
+
+import pytest
+import pytest_asyncio
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+from telebot import types
+from telebot.async_telebot import AsyncTeleBot
+
+from furretweet.metrics import metrics
+from furretweet.telegram_webhook import SECRET_TOKEN_HEADER, TelegramWebhook
+
+SECRET = "s3cr3t-token"
+
+# Updates recorded from the Bot API, a moderator pressing "Retweet" on the feed
+CALLBACK_QUERY_UPDATE = {
+    "update_id": 123456789,
+    "callback_query": {
+        "id": "4382bfdwdsb323b2d9",
+        "from": {"id": 1111111, "is_bot": False, "first_name": "Mod", "username": "mod"},
+        "message": {
+            "message_id": 42,
+            "from": {"id": 2222222, "is_bot": True, "first_name": "FurRetweet"},
+            "chat": {"id": -498308406, "title": "Feed", "type": "group"},
+            "date": 1650643076,
+            "text": "Author: DonovanCarmona\nNo failed filters",
+        },
+        "chat_instance": "-2998318392918",
+        "data": "failed_tweet:1517533170840838144:166643730:retweet",
+    },
+}
+START_MESSAGE_UPDATE = {
+    "update_id": 123456790,
+    "message": {
+        "message_id": 43,
+        "from": {"id": 1111111, "is_bot": False, "first_name": "Mod", "username": "mod"},
+        "chat": {"id": 1111111, "first_name": "Mod", "type": "private"},
+        "date": 1650643080,
+        "text": "/start",
+        "entities": [{"offset": 0, "length": 6, "type": "bot_command"}],
+    },
+}
+
+
+def callback_update(update_id: int) -> dict:
+    update = copy.deepcopy(CALLBACK_QUERY_UPDATE)
+    update["update_id"] = update_id
+    return update
+
+
+@pytest.fixture(autouse=True)
+def clear_metrics():
+    metrics.clear()
+
+
+@pytest.fixture
+def bot():
+    bot = AsyncTeleBot("123456:TEST", validate_token=False)
+    bot.callbacks = []
+    bot.messages = []
+    # Handlers wait for it, letting tests hold them
+    bot.release = asyncio.Event()
+    bot.release.set()
+
+    @bot.callback_query_handler(func=lambda call: True)
+    async def on_callback(callback: types.CallbackQuery):
+        await bot.release.wait()
+        bot.callbacks.append(callback)
+
+    @bot.message_handler(commands=["start"])
+    async def on_start(message: types.Message):
+        bot.messages.append(message)
+
+    return bot
+
+
+@pytest.fixture
+def webhook(bot: AsyncTeleBot):
+    return TelegramWebhook(bot, secret_token=SECRET, max_concurrency=2, max_pending=3)
+
+
+@pytest_asyncio.fixture
+async def client(webhook: TelegramWebhook):
+    app = web.Application()
+    webhook.install(app)
+    client = TestClient(TestServer(app))
+    await client.start_server()
+    yield client
+    await client.close()
+
+
+async def post(client: TestClient, update: dict, secret: str = SECRET):
+    return await client.post("/telegram", json=update, headers={SECRET_TOKEN_HEADER: secret})
+
+
+@pytest.mark.asyncio
+async def test_dispatches_recorded_updates(client: TestClient, webhook, bot):
+    for update in [CALLBACK_QUERY_UPDATE, START_MESSAGE_UPDATE]:
+        assert (await post(client, update)).status == 200
+    await webhook.drain()
+
+    callback = bot.callbacks[0]
+    assert callback.data == "failed_tweet:1517533170840838144:166643730:retweet"
+    assert callback.message.chat.id == -498308406
+    assert bot.messages[0].text == "/start"
+
+
+@pytest.mark.asyncio
+async def test_refuses_wrong_secret_token(client: TestClient, webhook, bot):
+    assert (await post(client, CALLBACK_QUERY_UPDATE, secret="guess")).status == 401
+    response = await client.post("/telegram", json=CALLBACK_QUERY_UPDATE)
+    assert response.status == 401
+    assert (await post(client, {"no": "update_id"})).status == 400
+
+    await webhook.drain()
+    assert bot.callbacks == []
+    assert metrics.counter("telegram_updates_refused_total", reason="secret_token").value == 2
+
+
+@pytest.mark.asyncio
+async def test_ignores_redelivered_updates(client: TestClient, webhook, bot):
+    # Telegram sends an update again when it wasn't answered in time
+    for _ in range(3):
+        assert (await post(client, CALLBACK_QUERY_UPDATE)).status == 200
+    await webhook.drain()
+    assert len(bot.callbacks) == 1
+    assert metrics.counter("telegram_duplicate_updates_total").value == 2
+
+
+@pytest.mark.asyncio
+async def test_handlers_are_bounded(client: TestClient, webhook, bot):
+    bot.release.clear()
+    # Answered right away even though no handler finished
+    for update_id in range(3):
+        assert (await post(client, callback_update(update_id))).status == 200
+    assert webhook.pending == 3
+    assert (await post(client, callback_update(3))).status == 503
+
+    await asyncio.sleep(0.01)
+    # Only max_concurrency updates are being handled, the other one waits
+    assert webhook._semaphore.locked()
+    bot.release.set()
+    await webhook.drain()
+    assert sorted(c.message.message_id for c in bot.callbacks) == [42, 42, 42]
+
+    # The refused update is taken when Telegram sends it again
+    assert (await post(client, callback_update(3))).status == 200
+    await webhook.drain()
+    assert len(bot.callbacks) == 4
+
+
+def test_needs_a_secret_token(bot: AsyncTeleBot):
+    with pytest.raises(ValueError):
+        TelegramWebhook(bot, secret_token="")
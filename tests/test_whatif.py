@@ -0,0 +1,125 @@
+import copy
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from furretweet.models import Includes, Tweet
+from furretweet.pipeline import PipelineConfigError
+from furretweet.whatif import ReplayReport, campaign_query, load_campaign, replay, replay_batch
+
+CANDIDATE_TOML = """
+[[default_filters]]
+type = "MinimumFollowersFilter"
+min_followers = 5000
+
+[[default_filters]]
+type = "NsfwFilter"
+
+[[default_filters]]
+type = "NearDuplicateTextFilter"
+"""
+
+
+@pytest.fixture
+def candidate_path(tmp_path) -> str:
+    path = tmp_path / "candidate.toml"
+    path.write_text(CANDIDATE_TOML)
+    return str(path)
+
+
+def make_document(raw_data: dict, followers: int, failed_filters: list[str]) -> dict:
+    raw_data = copy.deepcopy(raw_data)
+    raw_data["includes"]["users"][0]["public_metrics"]["followers_count"] = followers
+    return {
+        "_id": raw_data["data"]["id"],
+        "author_id": raw_data["data"]["author_id"],
+        "failed_filters": [{"filter_name": name, "details": {}} for name in failed_filters],
+        "tweet": Tweet.parse_obj(raw_data["data"]).dict(),
+        "includes": Includes.parse_obj(raw_data["includes"]).dict(),
+    }
+
+
+def test_replay_batch(candidate_path: str, raw_data_example: dict):
+    documents = [
+        # Failed the old 10k followers threshold, passes the new 5k one
+        make_document(raw_data_example, 7000, ["MinimumFollowersFilter"]),
+        # Passed the old filters but hit the rate limit, fails the new threshold
+        make_document(raw_data_example, 1000, []),
+        # Stateful filters keep their stored result
+        make_document(raw_data_example, 7000, ["NearDuplicateTextFilter"]),
+        {"_id": "1", "author_id": "2", "failed_filters": []},
+    ]
+
+    report = replay_batch(candidate_path, "default", documents)
+
+    assert report.documents == 4
+    assert report.skipped == 1
+    assert report.newly_passing == 1
+    assert report.newly_failing == 1
+    assert report.failures_before == {"MinimumFollowersFilter": 1, "NearDuplicateTextFilter": 1}
+    assert report.failures_after == {"MinimumFollowersFilter": 1, "NearDuplicateTextFilter": 1}
+    assert report.authors_passing == {"166643730": 1}
+    assert report.authors_failing == {"166643730": 1}
+
+
+def test_replay_batch_as_streamed(tmp_path, raw_data_example: dict):
+    path = tmp_path / "candidate.toml"
+    path.write_text(
+        """
+[[default_filters]]
+type = "MinimumFollowersFilter"
+min_followers = 8000
+
+[[default_filters]]
+type = "MinimumFollowersFilter"
+min_followers = 5000
+
+[[default_filters]]
+type = "MinimumAccountAgeFilter"
+min_days = 4400
+"""
+    )
+    documents = [make_document(raw_data_example, 7000, [])]
+
+    report = replay_batch(str(path), "default", documents)
+
+    # The first threshold isn't hidden by the second, and the account,
+    # created in 2010, wasn't 4400 days old yet when it tweeted in 2022
+    assert report.failures_after == {"MinimumFollowersFilter": 1, "MinimumAccountAgeFilter": 1}
+    assert report.newly_failing == 1
+
+
+def test_replay(candidate_path: str, raw_data_example: dict):
+    documents = (
+        make_document(raw_data_example, followers, ["MinimumFollowersFilter"])
+        for followers in range(0, 10_000, 100)
+    )
+
+    with ThreadPoolExecutor(2) as executor:
+        report = replay(documents, candidate_path, executor, batch_size=7, max_pending=2)
+
+    assert report.documents == 100
+    assert report.newly_passing == 50
+    assert report.failures_after == {"MinimumFollowersFilter": 50}
+
+    output = report.format()
+    assert "Newly passing: 50" in output
+    assert f"{'MinimumFollowersFilter':<32} {100:>10} {50:>10} {-50:>+10}" in output
+    assert "  166643730: 50" in output
+
+
+def test_load_campaign_unknown(candidate_path: str):
+    with pytest.raises(PipelineConfigError):
+        load_campaign(candidate_path, "anthrocon")
+
+
+def test_campaign_query():
+    assert campaign_query("default") == {"campaign": {"$in": [None, "default"]}}
+    assert campaign_query("anthrocon") == {"campaign": "anthrocon"}
+
+
+def test_report_merge():
+    report = ReplayReport(documents=1, newly_passing=1)
+    report.failures_before["NsfwFilter"] = 1
+    report.merge(ReplayReport(documents=2, newly_failing=1, failures_before={"NsfwFilter": 2}))
+
+    assert (report.documents, report.newly_passing, report.newly_failing) == (3, 1, 1)
+    assert report.failures_before == {"NsfwFilter": 3}